@@ -0,0 +1,64 @@
+#!python
+
+"""
+Verification throughput for HS256, RS256 (2048-bit) and ES256 (P-256) tokens. Each is
+timed with jose given the key as text, the way fromJWT used to verify anything but
+HS256, which parses the PEM on every call, and with our codecs, which parse it once.
+
+  python benchmarks/benchAlgorithms.py [seconds-per-case]
+"""
+
+import sys
+
+import time
+
+from jose import jwt
+
+from datawire.utils import DataWireCredential
+from datawire.utils.keys import DataWireHMACKey, DataWireRSAKey, DataWireECKey
+from datawire.utils.hs256 import DataWireHS256
+
+def rate(case, seconds):
+  """ Calls per second of case, over about seconds seconds. """
+  case()
+
+  calls = 0
+  start = time.time()
+  elapsed = 0
+
+  while elapsed < seconds:
+    case()
+    calls += 1
+    elapsed = time.time() - start
+
+  return calls / elapsed
+
+def main(seconds=1.0):
+  cred = DataWireCredential('ORG', 'bob', { 'dw:user0': True, 'dw:reqSvc0': True }, 'alice@example.com',
+                            email='bob@example.com')
+
+  hmacKey = DataWireHMACKey.new().private_key
+  rsaKey = DataWireRSAKey.new(bits=2048)
+  ecKey = DataWireECKey.new()
+
+  cases = [
+    ('HS256', hmacKey, hmacKey, DataWireHS256.forKey(hmacKey)),
+    ('RS256', rsaKey.private_key, rsaKey.public_key, DataWireRSAKey(public_key=rsaKey.public_key).codec()),
+    ('ES256', ecKey.private_key, ecKey.public_key, DataWireECKey(public_key=ecKey.public_key).codec()),
+  ]
+
+  decodeArgs = { 'audience': 'ORG', 'issuer': 'cloud-hub.datawire.io' }
+
+  print("%-6s %18s %18s %18s" % ("", "jose, key as text", "parsed once", "fromJWT, parsed"))
+
+  for algorithm, privateKey, publicKey, codec in cases:
+    token = cred.toJWT(privateKey, algorithm=algorithm)
+
+    jose = rate(lambda: jwt.decode(token, publicKey, algorithms=algorithm, **decodeArgs), seconds)
+    ours = rate(lambda: codec.decode(token, **decodeArgs), seconds)
+    full = rate(lambda: DataWireCredential.fromJWT(token, codec, 'ORG'), seconds)
+
+    print("%-6s %12.0f tok/s %12.0f tok/s %12.0f tok/s" % (algorithm, jose, ours, full))
+
+if __name__ == '__main__':
+  main(float(sys.argv[1]) if len(sys.argv) > 1 else 1.0)
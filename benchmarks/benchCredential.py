@@ -0,0 +1,96 @@
+#!python
+
+"""
+Memory per DataWireCredential, and hasScope speed, against the old dict-based
+credential (kept below as DictCredential).
+
+Each credential gets its own freshly decoded scopes dict, as fromJWT would give it.
+Memory is measured with tracemalloc where there is one (Python 3), and by adding up
+sys.getsizeof of each credential and what it alone holds onto otherwise.
+
+  python benchmarks/benchCredential.py [count]
+"""
+
+import sys
+
+import gc
+import json
+import timeit
+
+from datawire.utils import DataWireCredential
+
+try:
+  import tracemalloc
+except ImportError:
+  tracemalloc = None
+
+class DictCredential (object):
+  """ DataWireCredential as it was: attributes in __dict__, scopes as a dict. """
+
+  def __init__(self, orgID, credID, scopes, ownerEmail, email=None, tokenID=None, iat=None, nbf=None, exp=None):
+    self.orgID = orgID
+    self.credID = credID
+    self.ownerEmail = ownerEmail
+    self.scopes = scopes
+    self.email = email
+    self.tokenID = tokenID
+    self.iat = iat
+    self.nbf = nbf
+    self.expiry = exp
+
+  def hasScope(self, scope):
+    return bool(self.scopes.get(scope, False))
+
+SCOPES_JSON = '{"dw:user0": true, "dw:reqSvc0": true, "dw:admin0": true}'
+
+def makeCreds(klass, count):
+  return [ klass('ORG', 'bob', json.loads(SCOPES_JSON), 'alice@example.com', email='bob@example.com',
+                 tokenID='token', iat=1000, nbf=1000, exp=2000)
+           for i in range(count) ]
+
+def ownSize(cred):
+  size = sys.getsizeof(cred)
+
+  inner = getattr(cred, '__dict__', None)
+
+  if inner is not None:
+    size += sys.getsizeof(inner)
+
+  if isinstance(cred, DictCredential):
+    size += sys.getsizeof(cred.scopes)
+
+  return size
+
+def bytesPerCred(klass, count):
+  gc.collect()
+
+  if tracemalloc:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    creds = makeCreds(klass, count)
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    # Less the list holding them.
+    return (after - before - sys.getsizeof(creds)) / float(count)
+
+  creds = makeCreds(klass, count)
+
+  return sum(ownSize(cred) for cred in creds) / float(count)
+
+def main(count=100000):
+  for klass in (DictCredential, DataWireCredential):
+    name = klass.__name__
+    perCred = bytesPerCred(klass, count)
+
+    cred = makeCreds(klass, 1)[0]
+    iterations = 1000000
+
+    seconds = min(timeit.repeat(lambda: cred.hasScope('dw:admin0'), number=iterations, repeat=3))
+
+    print("%-20s %7.0f bytes/cred  %7.1f MB per %d creds  hasScope %5.3f us" %
+          (name, perCred, perCred * count / 1e6, count, 1e6 * seconds / iterations))
+
+if __name__ == '__main__':
+  main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
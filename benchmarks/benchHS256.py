@@ -0,0 +1,71 @@
+#!python
+
+"""
+Compare DataWireHS256 against python-jose for encoding and verifying credentials, and
+verifying with a key loaded from disk per token against a DataWireKeyring of 16 keys.
+
+  python benchmarks/benchHS256.py [iterations]
+"""
+
+import sys
+
+import os
+import shutil
+import tempfile
+import timeit
+
+from jose import jwt
+
+from datawire.utils import DataWireCredential
+from datawire.utils.hs256 import DataWireHS256
+from datawire.utils.keys import DataWireHMACKey, DataWireKey, DataWireKeyring
+
+def report(name, seconds, iterations):
+  print("%-28s %9.0f ops/s  %7.2f us/op" % (name, iterations / seconds, 1e6 * seconds / iterations))
+
+def main(iterations=20000):
+  key = DataWireHMACKey.new().private_key
+  codec = DataWireHS256.forKey(key)
+
+  cred = DataWireCredential('ORG', 'bob', { 'dw:user0': True, 'dw:reqSvc0': True }, 'alice@example.com',
+                            email='bob@example.com')
+  claims = cred.getClaims()
+  token = codec.encode(claims)
+
+  assert token == jwt.encode(claims, key, algorithm='HS256')
+
+  decodeArgs = { 'audience': 'ORG', 'issuer': 'cloud-hub.datawire.io' }
+
+  tmpdir = tempfile.mkdtemp()
+
+  for i in range(16):
+    with open(os.path.join(tmpdir, 'key%02d.key' % i), "w") as keyFile:
+      keyFile.write(DataWireHMACKey(key=(key if i == 7 else DataWireHMACKey.new().private_key)).encoded())
+
+  keyPath = os.path.join(tmpdir, 'key07.key')
+  keyring = DataWireKeyring(tmpdir)
+  kidToken = cred.toJWT(key, kid='key07')
+
+  def loadAndDecode():
+    publicKey = DataWireKey.load_public(keyPath).publicKey
+    return DataWireCredential.fromJWT(token, publicKey, 'ORG')
+
+  cases = [
+    ("jose encode", lambda: jwt.encode(claims, key, algorithm='HS256')),
+    ("DataWireHS256 encode", lambda: codec.encode(claims)),
+    ("jose decode", lambda: jwt.decode(token, key, algorithms='HS256', **decodeArgs)),
+    ("DataWireHS256 decode", lambda: codec.decode(token, **decodeArgs)),
+    ("jose unverified", lambda: (jwt.get_unverified_headers(token), jwt.get_unverified_claims(token))),
+    ("DataWireHS256 unverified", lambda: DataWireHS256.decodeSegment(DataWireHS256.split(token)[1], 'payload')),
+    ("fromJWT, key loaded per token", loadAndDecode),
+    ("fromJWT, DataWireKeyring", lambda: DataWireCredential.fromJWT(kidToken, keyring, 'ORG')),
+  ]
+
+  try:
+    for name, case in cases:
+      report(name, min(timeit.repeat(case, number=iterations, repeat=3)), iterations)
+  finally:
+    shutil.rmtree(tmpdir)
+
+if __name__ == '__main__':
+  main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
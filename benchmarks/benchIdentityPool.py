@@ -0,0 +1,103 @@
+#!python
+
+"""
+Compare pooled Identity connections against a fresh connection per call.
+
+Runs a tiny local HTTP/1.1 server that counts the TCP connections it accepts,
+then makes the same serviceCheck calls through a pooled Identity and through
+module-level requests.post (which is what Identity used to do).
+
+  python benchmarks/benchIdentityPool.py [calls]
+"""
+
+import sys
+
+import json
+import threading
+import time
+
+try:
+  from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+  from SocketServer import ThreadingMixIn
+except ImportError:
+  from http.server import HTTPServer, BaseHTTPRequestHandler
+  from socketserver import ThreadingMixIn
+
+import requests
+
+from datawire.cloud.identity import Identity
+
+class CountingServer (ThreadingMixIn, HTTPServer):
+  daemon_threads = True
+
+  def __init__(self, *args, **kwargs):
+    HTTPServer.__init__(self, *args, **kwargs)
+    self.lock = threading.Lock()
+    self.connections = 0
+
+  def process_request(self, request, client_address):
+    with self.lock:
+      self.connections += 1
+
+    return ThreadingMixIn.process_request(self, request, client_address)
+
+class SvcCheckHandler (BaseHTTPRequestHandler):
+  protocol_version = 'HTTP/1.1'
+  disable_nagle_algorithm = True
+
+  def do_POST(self):
+    length = int(self.headers.get('Content-Length', 0))
+
+    if length:
+      self.rfile.read(length)
+
+    body = json.dumps({ 'ok': True, 'orgID': self.path.split('/')[3] }).encode('utf-8')
+
+    self.send_response(200)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, *args):
+    pass
+
+def run(name, server, calls, check):
+  before = server.connections
+  start = time.time()
+
+  for i in range(calls):
+    rc = check()
+    assert rc, rc
+
+  elapsed = time.time() - start
+  opened = server.connections - before
+
+  print("%-10s %5d calls  %5d connections  %8.1f calls/s  %6.3f ms/call" %
+        (name, calls, opened, calls / elapsed, 1000.0 * elapsed / calls))
+
+def main(calls=500):
+  server = CountingServer(('127.0.0.1', 0), SvcCheckHandler)
+  thread = threading.Thread(target=server.serve_forever)
+  thread.daemon = True
+  thread.start()
+
+  baseURL = "http://127.0.0.1:%d" % server.server_address[1]
+  dwc = Identity(baseURL, None, really_dont_verify_tokens=True)
+
+  def unpooled():
+    url, headers = dwc.httpParams([ 'v1', 'svcCheck', 'ORG', 'svc' ], 'token')
+    return dwc.checkResponse(url, requests.post(url, headers=headers), required=[ 'orgID' ])
+
+  def pooled():
+    return dwc.serviceCheck('ORG', 'token', 'svc')
+
+  run("unpooled", server, calls, unpooled)
+  run("pooled", server, calls, pooled)
+
+  dwc.close()
+  server.shutdown()
+  server.server_close()
+
+if __name__ == '__main__':
+  main(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
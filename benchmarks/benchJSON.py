@@ -0,0 +1,87 @@
+#!python
+
+"""
+Time the JSON-heavy call sites -- DataWireResult and DataWireCredential to and from
+JSON, DataWireState save and load, and Identity.checkResponse -- with the stdlib json
+module and with whatever faster libraries jsoncodec finds.
+
+  python benchmarks/benchJSON.py [iterations]
+"""
+
+import sys
+
+import os
+import shutil
+import tempfile
+import time
+import timeit
+
+from datawire.cloud.identity import Identity
+from datawire.utils import DataWireCredential, DataWireResult, jsoncodec
+from datawire.utils.state import DataWireState
+
+class FakeResponse (object):
+  def __init__(self, status_code, content):
+    self.status_code = status_code
+    self.content = content
+
+def report(name, seconds, iterations):
+  print("  %-28s %9.0f ops/s  %9.2f us/op" % (name, iterations / seconds, 1e6 * seconds / iterations))
+
+def stateWith(tokens):
+  return {
+    'orgID': 'ORG',
+    'orgs': {
+      'ORG': {
+        'email': 'alice@example.com',
+        'user_token': 'not.a.token',
+        'service_tokens': dict(('svc%d' % i, 'eyJ' + 'x' * 200) for i in range(tokens))
+      }
+    }
+  }
+
+def main(iterations=20000):
+  tmpdir = tempfile.mkdtemp()
+
+  try:
+    result = DataWireResult.OK(orgID='ORG', email='alice@example.com', token='eyJ' + 'x' * 200,
+                               scopes=[ 'dw:user0', 'dw:reqSvc0' ])
+    resultJSON = result.toJSON()
+
+    cred = DataWireCredential('ORG', 'bob', { 'dw:user0': True, 'dw:reqSvc0': True },
+                              'alice@example.com', email='bob@example.com', tokenID='bench-token')
+    credJSON = cred.toJSON()
+
+    dwc = Identity('http://localhost:8080', None, really_dont_verify_tokens=True)
+    response = FakeResponse(200, resultJSON.encode('utf-8'))
+
+    statePath = os.path.join(tmpdir, 'datawire.json')
+    dwState = DataWireState(statePath)
+    dwState['orgs'] = stateWith(10000)['orgs']
+    dwState.save()
+    stateJSON = dwState.toJSON()
+
+    for libraries in [ ('json',), jsoncodec.LIBRARIES ]:
+      codec = jsoncodec.useLibraries(*libraries)
+      print(codec.describe())
+
+      cases = [
+        ("DataWireResult.toJSON", lambda: result.toJSON(), iterations),
+        ("DataWireResult.fromJSON", lambda: DataWireResult.fromJSON(resultJSON), iterations),
+        ("DataWireCredential.toJSON", lambda: cred.toJSON(), iterations),
+        ("DataWireCredential.fromJSON", lambda: DataWireCredential.fromJSON(credJSON, 'ORG'), iterations),
+        ("Identity.checkResponse", lambda: dwc.checkResponse('url', response, [ 'token' ]), iterations),
+        ("state toJSON (10k tokens)", lambda: dwState.toJSON(), 10),
+        ("state parse (10k tokens)", lambda: dwState.parse(stateJSON), 10),
+      ]
+
+      for name, case, number in cases:
+        report(name, min(timeit.repeat(case, number=number, repeat=3)), number)
+
+      print("")
+  finally:
+    jsoncodec.useLibraries()
+    shutil.rmtree(tmpdir)
+
+if __name__ == '__main__':
+  main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
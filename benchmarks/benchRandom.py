@@ -0,0 +1,34 @@
+#!python
+
+"""
+Per-call against batched generation in DataWireRandom: randomID against randomIDs,
+and randomBitString against randomBitStrings.
+
+  python benchmarks/benchRandom.py [count]
+"""
+
+import sys
+
+import timeit
+
+from datawire.utils.random import DataWireRandom
+
+def report(name, seconds, count):
+  print("  %-36s %10.0f /s  %8.0f ns each" % (name, count / seconds, 1e9 * seconds / count))
+
+def main(count=200000):
+  randomness = DataWireRandom()
+
+  cases = [
+    ("randomID, one at a time", lambda: [ randomness.randomID() for i in range(count) ]),
+    ("randomIDs", lambda: randomness.randomIDs(count)),
+    ("randomIDs, unique", lambda: randomness.randomIDs(count, unique=True)),
+    ("randomBitString(384), one at a time", lambda: [ randomness.randomBitString(384) for i in range(count) ]),
+    ("randomBitStrings(384)", lambda: randomness.randomBitStrings(count, 384)),
+  ]
+
+  for name, case in cases:
+    report(name, min(timeit.repeat(case, number=1, repeat=3)), count)
+
+if __name__ == '__main__':
+  main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
@@ -0,0 +1,93 @@
+#!python
+
+"""
+Compare DataWireResult against the old setattr-plus-_keys implementation (kept below
+as SetattrResult) for construction, lookup, toJSON and size.
+
+  python benchmarks/benchResult.py [iterations]
+"""
+
+import sys
+
+import json
+import timeit
+
+from datawire.utils import DataWireResult
+
+class SetattrResult (object):
+  """ DataWireResult as it was: values as attributes, plus a set of keys. """
+
+  def __init__(self, ok=True, error=None, **kwargs):
+    self._keys = set()
+
+    if ok:
+      self.ok = True
+      self.error = None
+    else:
+      self.ok = False
+      self['error'] = error
+
+    for key in kwargs:
+      self[key] = kwargs[key]
+
+  def toDict(self):
+    dictified = { 'ok': self.ok }
+
+    for key in self._keys:
+      value = self[key]
+      dictifier = getattr(value, 'toDict', None)
+      dictified[key] = dictifier() if dictifier else value
+
+    return dictified
+
+  def toJSON(self):
+    return json.dumps(self.toDict())
+
+  def __setitem__(self, key, value):
+    self._keys.add(key)
+    setattr(self, key, value)
+
+  def __getitem__(self, key):
+    return getattr(self, key)
+
+  def __contains__(self, key):
+    return key in self._keys
+
+def deepSize(obj):
+  size = sys.getsizeof(obj)
+
+  for attr in ('__dict__', '_keys', '_values'):
+    inner = getattr(obj, attr, None)
+
+    if isinstance(inner, (dict, set)):
+      size += sys.getsizeof(inner)
+
+  return size
+
+def report(name, seconds, iterations):
+  print("%-32s %9.0f ops/s  %7.2f us/op" % (name, iterations / seconds, 1e6 * seconds / iterations))
+
+def main(iterations=200000):
+  kwargs = { 'orgID': 'ORG', 'email': 'alice@example.com', 'token': 'x' * 200 }
+
+  for klass in (SetattrResult, DataWireResult):
+    name = klass.__name__
+    result = klass(ok=True, **kwargs)
+
+    cases = [
+      ("construct", lambda: klass(ok=True, **kwargs)),
+      ("construct error", lambda: klass(ok=False, error="nope", errorReturn=503)),
+      (".attr", lambda: result.email),
+      ("['key']", lambda: result['email']),
+      ("in", lambda: 'email' in result),
+      ("toJSON", lambda: result.toJSON()),
+    ]
+
+    for caseName, case in cases:
+      report("%s %s" % (name, caseName), min(timeit.repeat(case, number=iterations, repeat=3)), iterations)
+
+    print("%-32s %9d bytes" % ("%s size" % name, deepSize(result)))
+    print("")
+
+if __name__ == '__main__':
+  main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
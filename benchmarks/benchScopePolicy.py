@@ -0,0 +1,60 @@
+#!python
+
+"""
+Scope checking as Identity.checkToken used to do it (a list of missing and a list of
+wrong scopes, built from hasScope calls on every check) against a compiled
+DataWireScopePolicy, and the whole of checkOrgAdmin on a token already in the
+credential cache.
+
+  python benchmarks/benchScopePolicy.py [iterations]
+"""
+
+import sys
+
+import timeit
+
+from datawire.cloud.identity import Identity
+from datawire.utils import DataWireCredential
+from datawire.utils.keys import DataWireHMACKey
+
+def listCheck(cred, scopesMust, scopesMustNot):
+  missingScopes = [ scope for scope in scopesMust if not cred.hasScope(scope) ]
+
+  if missingScopes:
+    return 'credential is missing scopes: %s' % " ".join(missingScopes)
+
+  wrongScopes = [ scope for scope in scopesMustNot if cred.hasScope(scope) ]
+
+  if wrongScopes:
+    return 'credential must not have scopes: %s' % " ".join(wrongScopes)
+
+  return None
+
+def report(name, seconds, iterations):
+  print("  %-32s %9.0f ops/s  %7.3f us/op" % (name, iterations / seconds, 1e6 * seconds / iterations))
+
+def main(iterations=200000):
+  key = DataWireHMACKey.new().private_key
+  dwc = Identity('http://localhost:8080', key)
+
+  cred = DataWireCredential('ORG', 'bob', { 'dw:user0': True, 'dw:admin0': True, 'dw:reqSvc0': True },
+                            'alice@example.com', email='bob@example.com')
+  token = cred.toJWT(key)
+
+  policy = Identity.scopePolicy('orgAdmin')
+  must, mustNot = policy.scopesMust, policy.scopesMustNot
+
+  assert dwc.checkOrgAdmin(token, 'ORG')
+
+  cases = [
+    ("hasScope lists (old)", lambda: listCheck(cred, must, mustNot)),
+    ("DataWireScopePolicy.check", lambda: policy.check(cred)),
+    ("checkOrgAdmin (cached cred)", lambda: dwc.checkOrgAdmin(token, 'ORG')),
+    ("checkToken (cached cred)", lambda: dwc.checkToken(token, 'ORG', must, mustNot)),
+  ]
+
+  for name, case in cases:
+    report(name, min(timeit.repeat(case, number=iterations, repeat=3)), iterations)
+
+if __name__ == '__main__':
+  main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
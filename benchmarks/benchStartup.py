@@ -0,0 +1,115 @@
+#!python
+
+"""
+Measure dwc startup for commands that only read local state.
+
+Runs each command repeatedly in a fresh interpreter against a throwaway state file,
+and exits nonzero if the median for any of them is over budget.
+
+  python benchmarks/benchStartup.py [--runs N] [--budget MS]
+"""
+
+import sys
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+DWC = os.path.join(ROOT, 'dwc')
+
+# Modules that the local-only commands should never need to import.
+HEAVY = [ 'requests', 'jose.jwt', 'uuid', 'multiprocessing' ]
+
+def median(values):
+  values = sorted(values)
+  return values[len(values) // 2]
+
+def timeRuns(cmdline, runs, env):
+  times = []
+
+  with open(os.devnull, 'w') as devnull:
+    for i in range(runs):
+      start = time.time()
+      subprocess.check_call(cmdline, stdout=devnull, stderr=devnull, env=env)
+      times.append(time.time() - start)
+
+  return 1000.0 * median(times)
+
+def heavyImports(cmdline, env):
+  # -v makes the interpreter log every import to stderr.
+  proc = subprocess.Popen([ cmdline[0], '-v' ] + cmdline[1:],
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+  out, err = proc.communicate()
+
+  loaded = set(line.split()[1] for line in err.decode('utf-8', 'replace').splitlines()
+               if line.startswith('import '))
+
+  return [ module for module in HEAVY if module in loaded ]
+
+def writeState(path):
+  state = {
+    'orgID': 'ORG',
+    'orgs': {
+      'ORG': {
+        'email': 'alice@example.com',
+        'user_token': 'not.a.token',
+        'service_tokens': { 'svc%d' % i: 'token%d' % i for i in range(100) }
+      }
+    }
+  }
+
+  with open(path, 'w') as outFile:
+    json.dump(state, outFile)
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--runs', type=int, default=20)
+  parser.add_argument('--budget', type=float, default=100.0,
+                      help='Median milliseconds allowed per dwc command')
+  args = parser.parse_args()
+
+  tmpdir = tempfile.mkdtemp()
+  statePath = os.path.join(tmpdir, 'datawire.json')
+  writeState(statePath)
+
+  env = dict(os.environ)
+  env['PYTHONPATH'] = ROOT + os.pathsep + env.get('PYTHONPATH', '')
+
+  python = sys.executable
+
+  cases = [
+    ('python -c pass', [ python, '-c', 'pass' ], False),
+    ('dwc service-token', [ python, DWC, '--state', statePath, 'service-token', 'svc42' ], True),
+    ('dwc -h', [ python, DWC, '-h' ], True),
+  ]
+
+  overBudget = False
+
+  try:
+    for name, cmdline, budgeted in cases:
+      ms = timeRuns(cmdline, args.runs, env)
+      heavy = heavyImports(cmdline, env) if budgeted else []
+
+      flag = ''
+
+      if budgeted and (ms > args.budget):
+        flag = '  OVER BUDGET (%.0f ms)' % args.budget
+        overBudget = True
+
+      print("%-20s %7.1f ms median%s" % (name, ms, flag))
+
+      if heavy:
+        print("%-20s imports %s" % ('', ", ".join(heavy)))
+  finally:
+    shutil.rmtree(tmpdir)
+
+  sys.exit(1 if overBudget else 0)
+
+if __name__ == '__main__':
+  main()
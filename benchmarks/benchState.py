@@ -0,0 +1,73 @@
+#!python
+
+"""
+Time adding one service token and saving, against state with N service tokens, for
+each DataWireState backend (JSON, journaled JSON, SQLite).
+
+  python benchmarks/benchState.py [N ...]
+"""
+
+import sys
+
+import os
+import shutil
+import tempfile
+import time
+
+from datawire.utils.state import DataWireState
+
+BACKENDS = [
+  ('json', 'datawire.json', False),
+  ('journal', 'datawire.json', True),
+  ('sqlite', 'datawire.db', False),
+]
+
+def seed(statePath, journaled, count):
+  dwState = DataWireState.open(statePath, journaled=journaled)
+  dwState['orgID'] = 'ORG'
+  dwState['orgs'] = {
+    'ORG': {
+      'email': 'alice@example.com',
+      'user_token': 'not.a.token',
+      'service_tokens': dict(('svc%d' % i, 'token%d' % i) for i in range(count))
+    }
+  }
+  dwState.save()
+
+def timeSaves(statePath, saves):
+  dwState = DataWireState.open(statePath)
+
+  start = time.time()
+
+  for i in range(saves):
+    dwState.currentOrg()['service_tokens']['new%d' % i] = 'new-token'
+    dwState.save()
+
+  return 1000.0 * (time.time() - start) / saves
+
+def timeLoad(statePath, loads):
+  start = time.time()
+
+  for i in range(loads):
+    DataWireState.open(statePath).currentServiceToken('svc0')
+
+  return 1000.0 * (time.time() - start) / loads
+
+def main(counts):
+  for count in counts:
+    for name, fileName, journaled in BACKENDS:
+      tmpdir = tempfile.mkdtemp()
+
+      try:
+        statePath = os.path.join(tmpdir, fileName)
+        seed(statePath, journaled, count)
+
+        saveMS = timeSaves(statePath, 20)
+        loadMS = timeLoad(statePath, 5)
+
+        print("%7d tokens  %-8s  save %8.2f ms  load %8.2f ms" % (count, name, saveMS, loadMS))
+      finally:
+        shutil.rmtree(tmpdir)
+
+if __name__ == '__main__':
+  main([ int(arg) for arg in sys.argv[1:] ] or [ 10, 1000, 100000 ])
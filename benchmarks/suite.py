@@ -0,0 +1,248 @@
+#!python
+
+"""
+Micro-benchmarks for the datawire.utils hot paths, with stored baselines.
+
+  python benchmarks/suite.py [--quick] [--filter TEXT ...]
+    Run the benchmarks and print time per operation.
+
+  python benchmarks/suite.py --save
+    Run them and store the results as the baseline for this Python version, in
+    benchmarks/baselines/pyXY.json (or --baseline PATH).
+
+  python benchmarks/suite.py --compare [--threshold 0.25]
+    Run them and compare against the baseline: anything more than threshold slower is
+    a regression, and the exit status is 1 if there are any.
+
+Everything runs offline: keys, tokens and state files are made up in a temporary
+directory. Each case is timed as the best of several runs, each long enough to swamp
+timer noise, taken in rounds across all the cases; even so, compare on a quiet machine,
+and against a baseline from the same machine.
+"""
+
+import sys
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+
+from datawire.cloud.identity import Identity
+from datawire.utils import DataWireCredential, DataWireResult
+from datawire.utils.keys import DataWireHMACKey, DataWireKey
+from datawire.utils.random import DataWireRandom
+from datawire.utils.state import DataWireState
+
+baselineDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+
+stateSizes = [ ('10', 10), ('1k', 1000), ('100k', 100000) ]
+
+def makeCred():
+  return DataWireCredential('ORG', 'bob', { 'dw:user0': True, 'dw:reqSvc0': True }, 'alice@example.com',
+                            email='bob@example.com', tokenID='6d3a1f0e-benchmark')
+
+def seedState(statePath, count):
+  dwState = DataWireState.open(statePath)
+  dwState['orgID'] = 'ORG'
+  dwState['orgs'] = {
+    'ORG': {
+      'email': 'alice@example.com',
+      'user_token': 'not.a.token',
+      'service_tokens': dict(('svc%d' % i, 'token%d' % i) for i in range(count))
+    }
+  }
+  dwState.save()
+
+def cases(tmpdir):
+  """ Yields (name, callable) for every benchmark. Setup happens here, untimed. """
+
+  key = DataWireHMACKey.new().private_key
+  cred = makeCred()
+  claims = cred.getClaims()
+  token = cred.toJWT(key)
+
+  yield 'credential.toJWT', lambda: cred.toJWT(key)
+  yield 'credential.fromJWT', lambda: DataWireCredential.fromJWT(token, key, 'ORG')
+  yield 'credential.fromClaims', lambda: DataWireCredential.fromClaims(claims, 'ORG')
+
+  kwargs = { 'orgID': 'ORG', 'email': 'alice@example.com', 'token': token }
+  result = DataWireResult(ok=True, **kwargs)
+  resultJSON = result.toJSON()
+
+  yield 'result.construct', lambda: DataWireResult(ok=True, **kwargs)
+  yield 'result.toDict', lambda: result.toDict()
+  yield 'result.fromJSON', lambda: DataWireResult.fromJSON(resultJSON)
+
+  for label, count in stateSizes:
+    statePath = os.path.join(tmpdir, 'state%s.json' % label)
+    seedState(statePath, count)
+
+    dwState = DataWireState.open(statePath)
+
+    def save(dwState=dwState):
+      dwState.currentOrg()['service_tokens']['svc0'] = 'token-%f' % time.time()
+      dwState.dirty = True
+      dwState.save()
+
+    yield 'state.load.%s' % label, lambda statePath=statePath: DataWireState.open(statePath)
+    yield 'state.save.%s' % label, save
+
+  rng = DataWireRandom()
+
+  yield 'random.randomID', rng.randomID
+
+  keyPath = os.path.join(tmpdir, 'public.key')
+
+  with open(keyPath, "w") as keyFile:
+    keyFile.write(DataWireHMACKey(key=key).encoded().decode('ascii'))
+
+  yield 'keys.load_public', lambda: DataWireKey.load_public(keyPath)
+
+  cached = Identity(None, key)
+  uncached = Identity(None, key, credCacheSize=0)
+
+  yield 'identity.checkToken', lambda: cached.checkToken(token, 'ORG', [ 'dw:user0' ], [])
+  yield 'identity.checkToken.uncached', lambda: uncached.checkToken(token, 'ORG', [ 'dw:user0' ], [])
+
+def timeRun(case, number):
+  start = time.time()
+
+  for i in range(number):
+    case()
+
+  return time.time() - start
+
+def calibrate(case, minTime):
+  """ How many calls of case make a run of at least minTime seconds. """
+  case()
+
+  number = 1
+
+  while True:
+    elapsed = timeRun(case, number)
+
+    if elapsed >= minTime:
+      return number
+
+    number *= 10 if (elapsed < minTime / 10) else 2
+
+def run(filters, minTime, repeats):
+  """
+  Returns { name: best seconds per call }. The repeats are taken in rounds over all the
+  cases, rather than one case at a time, so a burst of load from elsewhere spoils at
+  most one sample of each case instead of every sample of one.
+  """
+
+  results = {}
+  calibrated = []
+  tmpdir = tempfile.mkdtemp()
+
+  try:
+    for name, case in cases(tmpdir):
+      if filters and not any(text in name for text in filters):
+        continue
+
+      try:
+        calibrated.append((name, case, calibrate(case, minTime)))
+      except Exception as e:
+        # Report it and carry on: one broken case shouldn't hide the rest.
+        sys.stdout.write("%-32s %12s  %s: %s\n" % (name, "failed", type(e).__name__, e))
+
+    for i in range(repeats):
+      for name, case, number in calibrated:
+        perCall = timeRun(case, number) / number
+        results[name] = min(results.get(name, perCall), perCall)
+
+    for name, case, number in calibrated:
+      sys.stdout.write("%-32s %12s\n" % (name, formatTime(results[name])))
+  finally:
+    shutil.rmtree(tmpdir)
+
+  return results
+
+def formatTime(seconds):
+  if seconds >= 1e-3:
+    return "%.2f ms" % (seconds * 1e3)
+
+  return "%.2f us" % (seconds * 1e6)
+
+def defaultBaseline():
+  return os.path.join(baselineDir, 'py%d%d.json' % sys.version_info[:2])
+
+def compare(baseline, results, threshold):
+  """ Prints the comparison; returns the names of the cases that regressed. """
+  regressed = []
+
+  print("\n%-32s %12s %12s %8s" % ("vs baseline", "baseline", "now", "ratio"))
+
+  for name in sorted(results):
+    if name not in baseline:
+      print("%-32s %12s %12s" % (name, "-", formatTime(results[name])))
+      continue
+
+    ratio = results[name] / baseline[name]
+    verdict = ""
+
+    if ratio > 1 + threshold:
+      verdict = "  REGRESSED"
+      regressed.append(name)
+    elif ratio < 1 / (1 + threshold):
+      verdict = "  faster"
+
+    print("%-32s %12s %12s %7.2fx%s" % (name, formatTime(baseline[name]), formatTime(results[name]),
+                                        ratio, verdict))
+
+  return regressed
+
+def main(argv):
+  parser = argparse.ArgumentParser(description="datawire.utils micro-benchmarks")
+  parser.add_argument('--save', action='store_true', help='store the results as the baseline')
+  parser.add_argument('--compare', action='store_true', help='compare the results with the baseline')
+  parser.add_argument('--baseline', default=defaultBaseline(), help='baseline file (default: %(default)s)')
+  parser.add_argument('--threshold', type=float, default=0.25,
+                      help='slowdown (as a fraction) that counts as a regression (default: %(default)s)')
+  parser.add_argument('--filter', action='append', dest='filters',
+                      help='only run cases whose names contain this (repeatable)')
+  parser.add_argument('--quick', action='store_true', help='shorter runs, for a smoke test')
+
+  args = parser.parse_args(argv)
+
+  baseline = None
+
+  if args.compare:
+    try:
+      with open(args.baseline, "r") as baselineFile:
+        baseline = json.load(baselineFile)['results']
+    except (IOError, OSError, ValueError, KeyError) as e:
+      sys.stderr.write("can't read baseline %s: %s\n" % (args.baseline, e))
+      return 2
+
+  minTime, repeats = (0.02, 2) if args.quick else (0.2, 5)
+  results = run(args.filters, minTime, repeats)
+
+  if args.save:
+    if not os.path.isdir(os.path.dirname(os.path.abspath(args.baseline))):
+      os.makedirs(os.path.dirname(os.path.abspath(args.baseline)))
+
+    with open(args.baseline, "w") as baselineFile:
+      json.dump({ 'python': platform.python_version(), 'platform': platform.platform(),
+                  'results': results }, baselineFile, indent=2, sort_keys=True)
+      baselineFile.write("\n")
+
+    print("\nsaved baseline %s" % args.baseline)
+
+  if baseline is not None:
+    regressed = compare(baseline, results, args.threshold)
+
+    if regressed:
+      print("\n%d regressed by more than %d%%: %s" % (len(regressed), args.threshold * 100,
+                                                     " ".join(regressed)))
+      return 1
+
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv[1:]))
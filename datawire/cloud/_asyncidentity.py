@@ -0,0 +1,365 @@
+#!python
+
+"""
+asyncio DataWireRegistrar client (Python 3.5+, needs aiohttp). Import it from
+datawire.cloud.asyncidentity: this module is Python 3.5+ syntax, so it isn't installed
+for Python 2.
+"""
+
+import asyncio
+import time
+
+import aiohttp
+
+from ..utils import DataWireResult, jsoncodec
+from ..utils.metrics import DataWireMetrics
+from .identity import Identity
+
+class AsyncIdentity (Identity):
+  """
+  Same surface as Identity, but every call that talks to the Identity Service is a
+  coroutine. Token checks (checkToken, checkOrgAdmin, credentialFromToken, etc.) are
+  purely local and stay synchronous.
+
+  concurrency - maximum number of requests in flight at once; callers beyond that
+    wait on a semaphore rather than piling up connections.
+  perHostLimit - maximum number of connections to any one host (0 for no limit beyond
+    concurrency)
+
+  timeout, timeouts, hedge, hedgeQuantile, minHedgeSamples, hedgeWorkers and metrics work
+  as for Identity. Hedging here takes no extra threads: the duplicate request is just
+  another task. Times count from when a request gets past the semaphore, and there's no
+  duplicate while the semaphore is full, since it would only wait its turn.
+
+  Create and use an AsyncIdentity from within the event loop that will run it, and
+  close() it (or use "async with") when done.
+  """
+
+  def __init__(self, baseURL, key, really_dont_verify_tokens=False, concurrency=100,
+               perHostLimit=0, timeout=None, timeouts=None, hedge=False, hedgeQuantile=0.95,
+               minHedgeSamples=20, hedgeWorkers=16, metrics=True):
+    Identity.__init__(self, baseURL, key, really_dont_verify_tokens=really_dont_verify_tokens,
+                      timeout=timeout, timeouts=timeouts, hedge=hedge, hedgeQuantile=hedgeQuantile,
+                      minHedgeSamples=minHedgeSamples, hedgeWorkers=hedgeWorkers, metrics=metrics)
+
+    self.concurrency = concurrency
+    self.perHostLimit = perHostLimit
+    self.semaphore = asyncio.Semaphore(concurrency)
+    self.aioSession = None
+
+  def session(self):
+    if self.aioSession is None:
+      connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.perHostLimit)
+      self.aioSession = aiohttp.ClientSession(connector=connector, json_serialize=jsoncodec.dumps)
+
+    return self.aioSession
+
+  async def close(self):
+    if self.aioSession is not None:
+      await self.aioSession.close()
+      self.aioSession = None
+
+  async def __aenter__(self):
+    return self
+
+  async def __aexit__(self, *exc_info):
+    await self.close()
+
+  async def request(self, method, target=None, args=None, required=None, token=None, timeout=None,
+                    hedge=False):
+    url, headers = self.httpParams(target, token)
+    timeout = self.clientTimeout(self.timeoutFor(method, timeout))
+    endpoint = DataWireMetrics.endpointFor(target) if (self.metrics is not None) else None
+
+    delay = None
+
+    if hedge and self.hedge:
+      delay = self.currentHedgeDelay()
+
+    if delay is None:
+      answer = await self.send(method, url, args, headers, timeout, endpoint)
+    else:
+      answer = await self.sendHedged(delay, method, url, args, headers, timeout, endpoint)
+
+    if isinstance(answer, DataWireResult):
+      # Timed out.
+      return answer
+
+    status, result = answer
+
+    return self.checkResult(url, status, result, required=required, method=method,
+                            endpoint=endpoint)
+
+  @classmethod
+  def clientTimeout(klass, timeout):
+    if isinstance(timeout, tuple):
+      connect, read = timeout
+    else:
+      connect = read = timeout
+
+    return aiohttp.ClientTimeout(sock_connect=connect, sock_read=read)
+
+  async def send(self, method, url, args, headers, timeout, endpoint=None, sending=None):
+    """
+    One HTTP request. Returns (status, decoded body), or a failed DataWireResult on timeout.
+    Sets the sending Event, if given, once past the semaphore.
+    """
+
+    try:
+      async with self.semaphore:
+        # Time waiting for the semaphore is ours, not the service's.
+        start = time.time()
+
+        if sending is not None:
+          sending.set()
+
+        async with self.session().request(method, url, json=args, headers=headers,
+                                          timeout=timeout) as resp:
+          status = resp.status
+          body = await resp.read()
+    except asyncio.TimeoutError:
+      return self.failure(method, endpoint, 'timeout', '%s %s timed out' % (method, url))
+
+    elapsed = time.time() - start
+    self.recordLatency(elapsed)
+
+    if (self.metrics is not None) and (endpoint is not None):
+      self.metrics.recordResponse(method, endpoint, status, elapsed, len(body))
+
+    result = None
+
+    try:
+      result = jsoncodec.loads(body)
+    except ValueError:
+      pass
+
+    return status, result
+
+  async def sendHedged(self, delay, method, url, args, headers, timeout, endpoint=None):
+    """
+    send(), but if there's no answer within delay seconds of sending, send it again, and
+    return whichever answers first; the other is cancelled. (If the first answer is a
+    failure, wait for the other.) If the semaphore is full, or hedgeWorkers duplicates are
+    already in flight, don't add another; just wait.
+    """
+
+    sending = asyncio.Event()
+    first = asyncio.ensure_future(self.send(method, url, args, headers, timeout, endpoint,
+                                            sending=sending))
+
+    # Start the clock once the request is on its way, not while it waits for the semaphore.
+    waiting = asyncio.ensure_future(sending.wait())
+
+    try:
+      await asyncio.wait([ first, waiting ], return_when=asyncio.FIRST_COMPLETED)
+    finally:
+      waiting.cancel()
+
+    done, pending = await asyncio.wait([ first ], timeout=delay)
+
+    if done:
+      return first.result()
+
+    if self.semaphore.locked() or (self.hedgesInFlight >= self.hedgeWorkers):
+      self.hedgesSkipped += 1
+      return await first
+
+    self.hedgesSent += 1
+    self.hedgesInFlight += 1
+
+    second = asyncio.ensure_future(self.send(method, url, args, headers, timeout, endpoint))
+    second.add_done_callback(self.hedgeDone)
+    pending = [ first, second ]
+
+    try:
+      while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+
+        for task in done:
+          if (task.exception() is None) and not isinstance(task.result(), DataWireResult):
+            if task is second:
+              self.hedgesWon += 1
+
+            return task.result()
+
+      # Both failed: report the last failure.
+      return task.result()
+    finally:
+      for task in pending:
+        task.cancel()
+
+  def hedgeDone(self, task):
+    self.hedgesInFlight -= 1
+
+  async def get(self, target=None, required=None, token=None, timeout=None, hedge=True):
+    """
+    GET from an endpoint that will respond with a JSON-encoded DataWireResult.
+
+    Returns a DataWireResult, after making sure that all the requiredResults are present
+    in the DataWireResult.
+    """
+
+    return await self.request('GET', target=target, required=required, token=token,
+                              timeout=timeout, hedge=hedge)
+
+  async def post(self, target=None, args=None, required=None, token=None, timeout=None, hedge=False):
+    """
+    POST to an endpoint that will respond with a JSON-encoded DataWireResult.
+
+    Returns a DataWireResult, after making sure that all the requiredResults are present
+    in the DataWireResult.
+    """
+
+    return await self.request('POST', target=target, args=args, required=required, token=token,
+                              timeout=timeout, hedge=hedge)
+
+  async def put(self, target=None, args=None, required=None, token=None, timeout=None):
+    """
+    PUT to an endpoint that will respond with a JSON-encoded DataWireResult.
+
+    Returns a DataWireResult, after making sure that all the requiredResults are present
+    in the DataWireResult.
+    """
+
+    return await self.request('PUT', target=target, args=args, required=required, token=token,
+                              timeout=timeout)
+
+  async def delete(self, target=None, args=None, required=None, token=None, timeout=None):
+    """
+    DELETE to an endpoint that will respond with a JSON-encoded DataWireResult.
+
+    Returns a DataWireResult, after making sure that all the requiredResults are present
+    in the DataWireResult.
+    """
+
+    return await self.request('DELETE', target=target, args=args, required=required, token=token,
+                              timeout=timeout)
+
+  async def orgList(self, superToken):
+    rc = await self.get( target=[ 'v1', 'orgs' ],
+                         token=superToken,
+                         required=[ 'orgIDs' ]
+                       )
+
+    return rc
+
+  async def orgDelete(self, orgID, superToken):
+    rc = await self.delete( target=[ 'v1', 'orgs', orgID ],
+                            token=superToken,
+                            required=[ 'count' ]
+                          )
+
+    return rc
+
+  async def orgCreate(self, orgName, adminName, adminEmail, adminPassword, isATest=False, reason=None):
+    args={
+      "orgName": orgName,
+      "adminName": adminName,
+      "adminEmail": adminEmail,
+      "adminPassword": adminPassword,
+      "isATest": isATest
+    }
+
+    if reason:
+      args['reason'] = reason
+
+    rc = await self.post( target=[ 'v1', 'orgs' ],
+                          args=args,
+                          required=[ 'orgID', 'token' ]
+                        )
+
+    return self.orgCreateResult(orgName, rc)
+
+  async def userInvite(self, orgID, token, email, adminName, adminEmail,
+                       message=None, scopes=None):
+    rc = await self.post( target=[ 'v1', 'users', orgID ],
+                          token=token,
+                          args={
+                            "adminName": adminName,
+                            "adminEmail": adminEmail,
+                            "email": email,
+                            "message": message,
+                            "scopes": scopes
+                          },
+                          required=[ 'orgID', 'invitation' ]
+                        )
+
+    return rc
+
+  async def userAcceptInvitation(self, invitation, name, password):
+    rc = await self.put( target=[ 'v1', 'invitations', invitation ],
+                         args={
+                           "name": name,
+                           "password": password
+                         },
+                         required=[ 'orgID', 'email', 'token' ]
+                       )
+
+    return self.userCommonResult(rc)
+
+  async def userUpdate(self, orgID, token, email, name=None, password=None, meta=None):
+    args = {
+      "name": name,
+      "password": password
+    }
+
+    if meta:
+      args['meta'] = meta
+
+    rc = await self.put( target=[ 'v1', 'users', orgID, email ],
+                         token=token,
+                         args=args,
+                         required=[ 'orgID', 'token' ]
+                       )
+
+    return self.userCommonResult(rc)
+
+  async def userAuth(self, email, password, orgID=None, doppelganger=None):
+    args = { 'password': password }
+
+    if orgID is not None:
+      args['orgID'] = orgID
+
+    if doppelganger:
+      args['doppelganger'] = doppelganger
+
+    rc = await self.post( target=[ 'v1', 'auth', email ],
+                          args=args,
+                          required=[ 'orgID', 'email', 'token' ]
+                        )
+
+    return self.userCommonResult(rc)
+
+  async def userForgotPassword(self, email, orgID=None):
+    args=None
+
+    if orgID is not None:
+      args = { 'orgID': orgID }
+
+    rc = await self.post( target=[ 'v1', 'forgot', email ],
+                          args=args,
+                          required=[ 'msg' ]
+                        )
+
+    return rc
+
+  async def serviceCreate(self, orgID, token, serviceHandle):
+    rc = await self.post( target=[ 'v1', 'services', orgID ],
+                          token=token,
+                          args={
+                            "serviceHandle": serviceHandle,
+                          },
+                          required=[ 'orgID', 'token' ]
+                        )
+
+    return self.serviceCreateResult(rc)
+
+  async def serviceCheck(self, orgID, token, serviceHandle):
+    # Only checks, so it's as safe to hedge as a GET.
+    rc = await self.post( target=[ 'v1', 'svcCheck', orgID, serviceHandle ],
+                          token=token,
+                          required=[ 'orgID' ],
+                          hedge=True
+                        )
+
+    return rc
@@ -0,0 +1,15 @@
+#!python
+
+"""
+asyncio DataWireRegistrar client (Python 3.5+, needs aiohttp): see AsyncIdentity.
+
+AsyncIdentity itself lives in _asyncidentity, which Python 2 can't even parse, so this
+module is just here to fail cleanly there.
+"""
+
+import sys
+
+if sys.version_info < (3, 5):
+  raise ImportError("datawire.cloud.asyncidentity requires Python 3.5+")
+
+from ._asyncidentity import AsyncIdentity
@@ -0,0 +1,558 @@
+#!python
+
+"""
+A stand-in for the Datawire Identity Service, for testing, load testing and
+benchmarking Identity offline.
+
+It implements the endpoints in API.md (plus the svcCheck form Identity still uses),
+keeps everything in memory, and signs tokens with DataWireCredential, so Identity can
+verify them with the service's key. It's multi-threaded, and can add latency and fail
+a fraction of requests, from a seeded random generator, on demand.
+
+  with FakeIdentityService(latency=(0.001, 0.005), errorRate=0.01, seed=1) as service:
+    dwc = Identity(service.baseURL, service.publicKey)
+    ...
+
+Or from the command line, e.g. to run tests-remote against it:
+
+  python -m datawire.cloud.fakeidentity --port 8080 --keys-dir keys
+"""
+
+import sys
+
+import hashlib
+import random
+import threading
+import time
+
+try:
+  from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+  from SocketServer import ThreadingMixIn
+  from urllib import unquote
+except ImportError:
+  from http.server import HTTPServer, BaseHTTPRequestHandler
+  from socketserver import ThreadingMixIn
+  from urllib.parse import unquote
+
+from ..utils import DataWireCredential, jsoncodec
+from ..utils.hs256 import DataWireHS256
+from ..utils.keys import DataWireHMACKey
+from ..utils.policy import DataWireScopePolicy
+from ..utils.random import DataWireRandom
+from .identity import Identity
+
+class FakeIdentityError (Exception):
+  """ Raised by a route to answer with an error: status, then message. """
+  def __init__(self, status, error):
+    Exception.__init__(self, error)
+    self.status = status
+    self.error = error
+
+class FakeIdentityServer (ThreadingMixIn, HTTPServer):
+  daemon_threads = True
+  allow_reuse_address = True
+
+  def handle_error(self, request, client_address):
+    # Clients that time out, or that we've timed out, hang up on us. That's fine.
+    pass
+
+class FakeIdentityHandler (BaseHTTPRequestHandler):
+  protocol_version = 'HTTP/1.1'
+
+  # Send each response in one piece: written a header at a time, Nagle's algorithm and
+  # the client's delayed ACKs add 40ms to every request.
+  wbufsize = -1
+  disable_nagle_algorithm = True
+
+  def do_GET(self):
+    self.server.service.handle(self, 'GET')
+
+  def do_POST(self):
+    self.server.service.handle(self, 'POST')
+
+  def do_PUT(self):
+    self.server.service.handle(self, 'PUT')
+
+  def do_DELETE(self):
+    self.server.service.handle(self, 'DELETE')
+
+  def log_message(self, *args):
+    if self.server.service.verbose:
+      BaseHTTPRequestHandler.log_message(self, *args)
+
+class FakeIdentityService (object):
+  """
+  key - HMAC key to sign tokens with (default: a new one); publicKey is the same key,
+    for Identity
+  host, port - where to listen (port 0 picks a free one; see baseURL)
+  latency - seconds to wait before answering: a number, or (low, high) for a uniformly
+    random wait
+  errorRate - fraction of requests (0.0 to 1.0) that fail with errorStatus instead
+  seed - seed for the latency and error randomness, for repeatable runs
+  tokenLifetime - seconds until issued tokens expire (None for never)
+
+  latency, errorRate and errorStatus can be changed while the service is running.
+  superToken is a token that orgList and orgDelete accept.
+  """
+
+  superScope = 'dw:super0'
+  superOrgID = 'datawire'
+
+  adminScopes = [ 'dw:user0', 'dw:admin0', 'dw:reqSvc0' ]
+
+  def __init__(self, key=None, host='127.0.0.1', port=0, latency=0, errorRate=0.0,
+               errorStatus=503, seed=None, tokenLifetime=86400, verbose=False):
+    self.key = key if key is not None else DataWireHMACKey.new().private_key
+    self.publicKey = self.key
+
+    self.latency = latency
+    self.errorRate = errorRate
+    self.errorStatus = errorStatus
+    self.tokenLifetime = tokenLifetime
+    self.verbose = verbose
+
+    self.random = random.Random(seed)
+    self.ids = DataWireRandom()
+
+    # Verify bearer tokens the way clients do, with the same scope policies.
+    self.verifier = Identity(None, self.key, metrics=False)
+    self.superPolicy = DataWireScopePolicy([ self.superScope ], [], name='super')
+
+    self.lock = threading.Lock()
+
+    # orgID -> org dict; (orgID, email) -> user dict; invitation -> (orgID, email, scopes);
+    # (orgID, serviceHandle) -> owner email
+    self.orgs = {}
+    self.users = {}
+    self.invitations = {}
+    self.services = {}
+
+    self.requestCount = 0
+    self.injectedErrors = 0
+
+    self.superToken = self.sign(self.superOrgID, 'super-admin', [ self.superScope ],
+                                'super-admin@datawire.io', exp=None)
+
+    self.routes = [
+      ('GET', [ 'health' ], self.health),
+      ('GET', [ 'v1', 'orgs' ], self.orgList),
+      ('POST', [ 'v1', 'orgs' ], self.orgCreate),
+      ('GET', [ 'v1', 'orgs', None ], self.forbidden),
+      ('DELETE', [ 'v1', 'orgs', None ], self.orgDelete),
+      ('GET', [ 'v1', 'users', None ], self.userList),
+      ('POST', [ 'v1', 'users', None ], self.userInvite),
+      ('GET', [ 'v1', 'users', None, None ], self.forbidden),
+      ('PUT', [ 'v1', 'users', None, None ], self.userUpdate),
+      ('DELETE', [ 'v1', 'users', None, None ], self.userDeactivate),
+      ('PUT', [ 'v1', 'invitations', None ], self.userAcceptInvitation),
+      ('POST', [ 'v1', 'auth' ], self.userAuth),
+      ('POST', [ 'v1', 'auth', None ], self.userAuth),
+      ('POST', [ 'v1', 'forgot', None ], self.userForgotPassword),
+      ('POST', [ 'v1', 'services', None ], self.serviceCreate),
+      ('GET', [ 'v1', 'services', None ], self.serviceCheckByHandle),
+      ('POST', [ 'v1', 'svcCheck', None, None ], self.serviceCheck),
+    ]
+
+    self.server = FakeIdentityServer((host, port), FakeIdentityHandler)
+    self.server.service = self
+    self.thread = None
+
+  @property
+  def baseURL(self):
+    host, port = self.server.server_address[:2]
+    return "http://%s:%d" % (host, port)
+
+  def start(self):
+    """ Serve on a background thread. """
+    # A short poll interval, so that stop() doesn't keep tests waiting.
+    self.thread = threading.Thread(target=self.server.serve_forever, kwargs={ 'poll_interval': 0.05 })
+    self.thread.daemon = True
+    self.thread.start()
+
+    return self
+
+  def stop(self):
+    if self.thread is not None:
+      self.server.shutdown()
+      self.thread.join()
+      self.thread = None
+
+    self.server.server_close()
+
+  def __enter__(self):
+    return self.start()
+
+  def __exit__(self, *exc):
+    self.stop()
+
+  # Plumbing.
+
+  def handle(self, request, method):
+    with self.lock:
+      self.requestCount += 1
+
+      latency = self.latency
+
+      if isinstance(latency, (tuple, list)):
+        latency = self.random.uniform(*latency)
+
+      injectError = (self.errorRate > 0) and (self.random.random() < self.errorRate)
+
+      if injectError:
+        self.injectedErrors += 1
+
+    if latency:
+      time.sleep(latency)
+
+    length = int(request.headers.get('Content-Length') or 0)
+    body = request.rfile.read(length) if length else None
+
+    if injectError:
+      return self.respond(request, self.errorStatus, { 'ok': False, 'error': 'injected failure' })
+
+    path = request.path.split('?', 1)[0]
+    elements = [ unquote(element) for element in path.strip('/').split('/') ]
+
+    try:
+      route, args = self.route(method, elements)
+
+      try:
+        params = jsoncodec.loads(body) if body else {}
+      except ValueError:
+        raise FakeIdentityError(400, 'request body is not JSON')
+
+      if not isinstance(params, dict):
+        raise FakeIdentityError(400, 'request body is not a JSON object')
+
+      token = None
+      authorization = request.headers.get('Authorization') or ''
+
+      if authorization.startswith('Bearer '):
+        token = authorization[len('Bearer '):]
+
+      result = route(token, params, *args)
+    except FakeIdentityError as e:
+      return self.respond(request, e.status, { 'ok': False, 'error': e.error })
+    except Exception as e:
+      # A bug, or a request we didn't think of. Answer anyway: the server would just
+      # drop the connection, and the client would see that rather than the problem.
+      return self.respond(request, 500, { 'ok': False, 'error': '%s: %s' % (type(e).__name__, e) })
+
+    result['ok'] = True
+    self.respond(request, 200, result)
+
+  def route(self, method, elements):
+    pathMatched = False
+
+    for routeMethod, pattern, route in self.routes:
+      if len(pattern) != len(elements):
+        continue
+
+      if any((want is not None) and (want != got) for want, got in zip(pattern, elements)):
+        continue
+
+      pathMatched = True
+
+      if routeMethod == method:
+        return route, [ got for want, got in zip(pattern, elements) if want is None ]
+
+    if pathMatched:
+      raise FakeIdentityError(405, 'method not allowed')
+
+    raise FakeIdentityError(404, 'no such endpoint')
+
+  def respond(self, request, status, result):
+    body = jsoncodec.dumps(result)
+
+    if not isinstance(body, bytes):
+      body = body.encode('utf-8')
+
+    request.send_response(status)
+    request.send_header('Content-Type', 'application/json')
+    request.send_header('Content-Length', str(len(body)))
+    request.end_headers()
+    request.wfile.write(body)
+
+  def sign(self, orgID, credID, scopes, ownerEmail, email=None, exp=0):
+    if exp == 0:
+      exp = (int(time.time()) + self.tokenLifetime) if self.tokenLifetime else None
+
+    cred = DataWireCredential(orgID, credID, dict((scope, True) for scope in scopes), ownerEmail,
+                              email=email, tokenID=self.ids.randomID(), exp=exp)
+
+    return cred.toJWT(self.key)
+
+  def authorize(self, token, orgID, policy):
+    """ Returns the credential for token, if it passes policy for orgID, else raises. """
+    if not token:
+      raise FakeIdentityError(401, 'authorization required')
+
+    rc = self.verifier.checkPolicy(token, orgID, policy)
+
+    if not rc:
+      raise FakeIdentityError(403, rc.error)
+
+    return rc.cred
+
+  def org(self, orgID):
+    org = self.orgs.get(orgID, None)
+
+    if org is None:
+      raise FakeIdentityError(404, 'no such organization: %s' % orgID)
+
+    return org
+
+  @staticmethod
+  def passwordHash(email, password):
+    return hashlib.sha256((u'%s:%s' % (email, password)).encode('utf-8')).hexdigest()
+
+  @staticmethod
+  def userHash(email):
+    return hashlib.md5(email.strip().lower().encode('utf-8')).hexdigest()
+
+  def userResult(self, user):
+    """ What userAuth, userAcceptInvitation and userUpdate all answer with. """
+    return {
+      'orgID': user['orgID'],
+      'email': user['email'],
+      'token': self.sign(user['orgID'], user['email'], user['scopes'], user['email'],
+                         email=user['email']),
+      'meta': user['meta'],
+      'userHash': self.userHash(user['email']),
+      'createdAt': user['createdAt'],
+    }
+
+  def addUser(self, orgID, email, name, password, scopes):
+    user = { 'orgID': orgID, 'email': email, 'name': name, 'scopes': scopes, 'meta': {},
+             'password': self.passwordHash(email, password), 'active': True,
+             'createdAt': int(time.time()) }
+    self.users[(orgID, email)] = user
+
+    return user
+
+  # The endpoints. Each gets the bearer token (or None), the decoded request body, and
+  # the variable parts of the path, and returns a dict for a DataWireResult.
+
+  def health(self, token, params):
+    return {}
+
+  def forbidden(self, token, params, *args):
+    # What the real service does for these, for now.
+    raise FakeIdentityError(403, 'forbidden')
+
+  def orgList(self, token, params):
+    self.authorize(token, self.superOrgID, self.superPolicy)
+
+    with self.lock:
+      return { 'orgIDs': sorted(self.orgs) }
+
+  def orgCreate(self, token, params):
+    for required in [ 'orgName', 'adminName', 'adminEmail', 'adminPassword' ]:
+      if not params.get(required):
+        raise FakeIdentityError(400, 'missing %s' % required)
+
+    orgID = self.ids.randomID()
+    email = params['adminEmail']
+
+    with self.lock:
+      self.orgs[orgID] = { 'orgID': orgID, 'orgName': params['orgName'],
+                           'isATest': bool(params.get('isATest')), 'createdAt': int(time.time()) }
+
+      user = self.addUser(orgID, email, params['adminName'], params['adminPassword'],
+                          params.get('scopes') or self.adminScopes)
+
+    return self.userResult(user)
+
+  def orgDelete(self, token, params, orgID):
+    self.authorize(token, self.superOrgID, self.superPolicy)
+
+    with self.lock:
+      self.org(orgID)
+      del(self.orgs[orgID])
+
+      for key in [ key for key in self.users if key[0] == orgID ]:
+        del(self.users[key])
+
+      for key in [ key for key in self.services if key[0] == orgID ]:
+        del(self.services[key])
+
+    return { 'count': 1 }
+
+  def userList(self, token, params, orgID):
+    self.authorize(token, orgID, 'orgAdmin')
+
+    with self.lock:
+      self.org(orgID)
+
+      return { 'orgID': orgID,
+               'users': sorted(email for (userOrgID, email), user in self.users.items()
+                               if (userOrgID == orgID) and user['active']) }
+
+  def userInvite(self, token, params, orgID):
+    self.authorize(token, orgID, 'orgAdmin')
+
+    if not params.get('email'):
+      raise FakeIdentityError(400, 'missing email')
+
+    invitation = self.ids.randomID()
+    scopes = [ 'dw:user0' ] + [ scope for scope in (params.get('scopes') or []) if scope != 'dw:user0' ]
+
+    with self.lock:
+      self.org(orgID)
+      self.invitations[invitation] = (orgID, params['email'], scopes)
+
+    return { 'orgID': orgID, 'invitation': invitation }
+
+  def userAcceptInvitation(self, token, params, invitation):
+    with self.lock:
+      if invitation not in self.invitations:
+        raise FakeIdentityError(404, 'no such invitation')
+
+      orgID, email, scopes = self.invitations.pop(invitation)
+      self.org(orgID)
+
+      user = self.addUser(orgID, email, params.get('name'), params.get('password') or '', scopes)
+
+    return self.userResult(user)
+
+  def userUpdate(self, token, params, orgID, email):
+    cred = self.authorize(token, orgID, 'user')
+
+    if (cred.email != email) and not cred.hasScope('dw:admin0'):
+      raise FakeIdentityError(403, 'only %s or an admin may update %s' % (email, email))
+
+    with self.lock:
+      user = self.users.get((orgID, email), None)
+
+      if (user is None) or not user['active']:
+        raise FakeIdentityError(404, 'no such user: %s' % email)
+
+      if params.get('name'):
+        user['name'] = params['name']
+
+      if params.get('password'):
+        user['password'] = self.passwordHash(email, params['password'])
+
+      if params.get('meta'):
+        user['meta'] = params['meta']
+
+    return self.userResult(user)
+
+  def userDeactivate(self, token, params, orgID, email):
+    self.authorize(token, orgID, 'orgAdmin')
+
+    with self.lock:
+      user = self.users.get((orgID, email), None)
+
+      if user is None:
+        raise FakeIdentityError(404, 'no such user: %s' % email)
+
+      user['active'] = False
+
+    return { 'orgID': orgID, 'count': 1 }
+
+  def userAuth(self, token, params, email=None):
+    email = email or params.get('email')
+    orgID = params.get('orgID')
+    password = self.passwordHash(email or '', params.get('password') or '')
+
+    with self.lock:
+      candidates = [ user for (userOrgID, userEmail), user in self.users.items()
+                     if (userEmail == email) and user['active'] and
+                        ((orgID is None) or (userOrgID == orgID)) ]
+
+    if len(candidates) > 1:
+      raise FakeIdentityError(400, 'orgID required: %s is in more than one organization' % email)
+
+    if (not candidates) or (candidates[0]['password'] != password):
+      raise FakeIdentityError(401, 'invalid email or password')
+
+    return self.userResult(candidates[0])
+
+  def userForgotPassword(self, token, params, email):
+    # Never says whether the user exists.
+    return { 'msg': 'If %s has an account, a password reset is on its way.' % email }
+
+  def serviceCreate(self, token, params, orgID):
+    cred = self.authorize(token, orgID, 'canRequestServices')
+    serviceHandle = params.get('serviceHandle')
+
+    if not serviceHandle:
+      raise FakeIdentityError(400, 'missing serviceHandle')
+
+    with self.lock:
+      self.org(orgID)
+      self.services[(orgID, serviceHandle)] = cred.email
+
+    return { 'orgID': orgID,
+             'token': self.sign(orgID, serviceHandle, [ 'dw:service0' ], cred.email) }
+
+  def serviceCheck(self, token, params, orgID, serviceHandle):
+    cred = self.authorize(token, orgID, 'service')
+
+    with self.lock:
+      known = (orgID, serviceHandle) in self.services
+
+    if (cred.credID != serviceHandle) or not known:
+      raise FakeIdentityError(403, 'token is not for service %s' % serviceHandle)
+
+    return { 'orgID': orgID, 'serviceHandle': serviceHandle }
+
+  def serviceCheckByHandle(self, token, params, serviceHandle):
+    # The newer form: the org comes from the token itself (and is then checked).
+    try:
+      claims = DataWireHS256.decodeSegment(DataWireHS256.split(token or '')[1], 'payload')
+    except Exception:
+      raise FakeIdentityError(401, 'authorization required')
+
+    return self.serviceCheck(token, params, claims.get('aud'), serviceHandle)
+
+def main(argv):
+  import argparse
+  import os
+
+  parser = argparse.ArgumentParser(description="Run a stand-in Identity Service")
+  parser.add_argument('--host', default='127.0.0.1')
+  parser.add_argument('--port', type=int, default=8080)
+  parser.add_argument('--key', help='HMAC key file to sign with (default: a new key)')
+  parser.add_argument('--keys-dir', dest='keysDir',
+                      help='write dwc-identity.key and dwc-super-admin.jwt here, as tests-remote wants')
+  parser.add_argument('--latency', default='0',
+                      help='seconds to wait before answering: SECONDS or LOW,HIGH')
+  parser.add_argument('--error-rate', dest='errorRate', type=float, default=0.0,
+                      help='fraction of requests to fail')
+  parser.add_argument('--error-status', dest='errorStatus', type=int, default=503)
+  parser.add_argument('--seed', type=int)
+  parser.add_argument('-v', '--verbose', action='store_true', help='log requests')
+
+  args = parser.parse_args(argv)
+
+  latency = tuple(float(x) for x in args.latency.split(','))
+  latency = latency if (len(latency) > 1) else latency[0]
+
+  key = DataWireHMACKey.load(args.key).private_key if args.key else None
+
+  service = FakeIdentityService(key=key, host=args.host, port=args.port, latency=latency,
+                                errorRate=args.errorRate, errorStatus=args.errorStatus,
+                                seed=args.seed, verbose=args.verbose)
+
+  if args.keysDir:
+    for fileName, contents in [ ('dwc-identity.key', DataWireHMACKey(key=service.key).encoded()),
+                                ('dwc-super-admin.jwt', service.superToken) ]:
+      if not isinstance(contents, str):
+        contents = contents.decode('ascii')
+
+      with open(os.path.join(args.keysDir, fileName), "w") as keyFile:
+        keyFile.write(contents + "\n")
+
+  sys.stderr.write("fake Identity Service at %s\n" % service.baseURL)
+
+  try:
+    service.server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    service.server.server_close()
+
+if __name__ == '__main__':
+  main(sys.argv[1:])
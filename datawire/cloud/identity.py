@@ -1,13 +1,31 @@
 #!python
 
+import collections
 import logging
-import requests
+import os
+import select
+import sys
+import threading
+import time
+
+try:
+  import queue
+except ImportError:
+  import Queue as queue
+
+# requests is imported only once we actually talk to the network, and multiprocessing
+# only for checkTokens: dwc commands that just read local state shouldn't pay for either.
 
 """
 DataWireRegistrar client
 """
 
 from ..utils import DataWireResult, DataWireCredential # Needs to move to .utils
+from ..utils import jsoncodec
+from ..utils.cache import DataWireCredentialCache
+from ..utils.keys import DataWireKeyring
+from ..utils.metrics import DataWireMetrics
+from ..utils.policy import DataWireScopePolicy
 
 class DataWireIdentityError (Exception):
   pass
@@ -15,14 +33,297 @@ class DataWireIdentityError (Exception):
 class DataWireIdentityNoKeyError (DataWireIdentityError):
   pass
 
+class DataWireHedgeThreads (object):
+  """
+  Threads for Identity.sendHedged. run() starts a job right away, on an idle thread or
+  a new one if none is idle, so a job never waits in a queue behind others (that wait
+  would count against the hedging delay). Idle threads stay until close().
+  """
+
+  def __init__(self):
+    self.jobs = queue.Queue()
+    self.idle = 0
+    self.closed = False
+    self.lock = threading.Lock()
+
+  def run(self, function, *args):
+    with self.lock:
+      if self.idle:
+        self.idle -= 1
+        self.jobs.put((function, args))
+        return
+
+    thread = threading.Thread(target=self.work, args=((function, args),))
+    thread.daemon = True
+    thread.start()
+
+  def work(self, job):
+    while job is not None:
+      function, args = job
+      function(*args)
+
+      with self.lock:
+        if self.closed:
+          return
+
+        self.idle += 1
+
+      job = self.jobs.get()
+      self.jobs.task_done()
+
+  def close(self):
+    """
+    Let the threads go, once they've finished what they're doing. Waits for the idle
+    ones to wake up and leave, so they aren't still waking up at interpreter exit.
+    """
+
+    with self.lock:
+      self.closed = True
+
+      for i in range(self.idle):
+        self.jobs.put(None)
+
+      self.idle = 0
+
+    self.jobs.join()
+
+class DataWireWakePipe (object):
+  """ A pipe to sleep on in select(), closed when the last reference goes. """
+
+  def __init__(self):
+    self.r, self.w = os.pipe()
+
+  def __del__(self):
+    os.close(self.r)
+    os.close(self.w)
+
+class DataWireAnswers (object):
+  """
+  Where sendHedged's attempts put their answers, and the caller waits for them.
+
+  Python 2's timed waits poll, sleeping in steps of up to 50ms (a 20ms wait comes back
+  about 12ms late), which would swamp the delays we're timing. So there the caller
+  sleeps in select() on a pipe instead: one per thread, reused.
+  """
+
+  perThread = threading.local()
+  usePipes = (sys.version_info[0] < 3) and (os.name == 'posix')
+
+  def __init__(self):
+    self.answers = queue.Queue()
+    self.pipe = None
+
+    if self.usePipes:
+      self.pipe = getattr(self.perThread, 'pipe', None)
+
+      if self.pipe is None:
+        self.pipe = DataWireWakePipe()
+        self.perThread.pipe = self.pipe
+
+  def put(self, answer):
+    self.answers.put(answer)
+
+    if self.pipe is not None:
+      os.write(self.pipe.w, b'.')
+
+  def get(self, timeout=None):
+    """ The next answer. Raises queue.Empty if there's none within timeout seconds. """
+    if self.pipe is None:
+      # Always timed: on Python 2, an untimed get() can't be interrupted.
+      return self.answers.get(True, 86400 if timeout is None else timeout)
+
+    deadline = None if (timeout is None) else (time.time() + timeout)
+
+    while True:
+      try:
+        return self.answers.get_nowait()
+      except queue.Empty:
+        pass
+
+      remaining = None
+
+      if deadline is not None:
+        remaining = deadline - time.time()
+
+        if remaining <= 0:
+          raise queue.Empty()
+
+      # Wakeups left over from a previous call's slow attempt just go round again.
+      if select.select([ self.pipe.r ], [], [], remaining)[0]:
+        os.read(self.pipe.r, 512)
+
 class Identity (object):
-  def __init__(self, baseURL, key, really_dont_verify_tokens=False):
+  # Named scope policies for checkPolicy, compiled once. Add to them with registerScopePolicy.
+  scopePolicies = dict((policy.name, policy) for policy in [
+    DataWireScopePolicy([ 'dw:user0', 'dw:admin0', 'dw:reqSvc0' ],
+                        [ 'dw:organization0', 'dw:service0' ], name='orgAdmin'),
+    DataWireScopePolicy([ 'dw:reqSvc0' ],
+                        [], name='canRequestServices'),
+    DataWireScopePolicy([ 'dw:user0' ],
+                        [ 'dw:organization0', 'dw:service0' ], name='user'),
+    DataWireScopePolicy([ 'dw:service0' ],
+                        [ 'dw:organization0', 'dw:user0', 'dw:reqSvc0' ], name='service'),
+  ])
+
+  # (scopesMust, scopesMustNot) -> policy, for plain checkToken calls. Bounded, since
+  # callers can make up as many of these as they like.
+  adHocPolicies = {}
+  maxAdHocPolicies = 256
+
+  # Connect and read timeouts, in seconds, unless told otherwise.
+  defaultTimeout = (5.0, 30.0)
+
+  def __init__(self, baseURL, key, really_dont_verify_tokens=False,
+               poolSize=10, maxKeepAlive=10, blockPerHost=False, credCacheSize=1024,
+               timeout=None, timeouts=None, hedge=False, hedgeQuantile=0.95,
+               minHedgeSamples=20, hedgeWorkers=16, metrics=True):
+    """
+    baseURL - URL of the Identity Service
+    key - public key for token verification
+    credCacheSize - number of verified credentials to remember (0 disables the cache)
+
+    Connection pooling (shared by every verb and every thread using this Identity):
+
+    poolSize - number of per-host connection pools to cache
+    maxKeepAlive - number of connections kept alive for reuse, per host
+    blockPerHost - if True, maxKeepAlive is also a hard limit on concurrent connections
+      per host, and callers wait for a free connection rather than opening a new one
+
+    Timeouts, in seconds: either a (connect, read) pair or one number for both, as for
+    requests. A request that times out returns a failed DataWireResult.
+
+    timeout - for every request (default defaultTimeout)
+    timeouts - dict of HTTP method ('GET', 'POST', etc.) -> timeout for that method
+    Every verb also takes timeout= for just that call.
+
+    Hedging, to cap tail latency when the Identity Service is struggling:
+
+    hedge - if True, an idempotent request (a GET, or serviceCheck) that's still waiting
+      after the hedgeQuantile of recent request times gets a duplicate sent, and we take
+      whichever answers first. Starts once minHedgeSamples requests have been timed.
+    hedgeWorkers - most duplicates in flight at once; past that, slow requests just wait
+      rather than add to the load
+
+    metrics - where to record request latencies, status codes, failures and token
+      verifications (see DataWireMetrics): True for a new DataWireMetrics, a
+      DataWireMetrics to share one, or False not to record anything
+    """
     self.baseURL = baseURL
     self.publicKey = key
 
+    self.timeout = self.defaultTimeout if timeout is None else timeout
+    self.timeouts = dict(timeouts or {})
+
+    self.hedge = hedge
+    self.hedgeQuantile = hedgeQuantile
+    self.minHedgeSamples = minHedgeSamples
+    self.hedgeWorkers = hedgeWorkers
+    self.hedgeThreads = None
+    self.hedgeDelay = None
+    self.hedgesSent = 0
+    self.hedgesWon = 0
+    self.hedgesSkipped = 0
+    self.hedgesInFlight = 0
+
+    # Recent request times, for the hedging threshold. deque appends are thread-safe.
+    self.latencies = collections.deque(maxlen=256)
+    self.latencyCount = 0
+    self.hedgeDelayAt = 0
+
+    if metrics is True:
+      metrics = DataWireMetrics()
+
+    self.metrics = metrics or None
+
     if (key is None) and not really_dont_verify_tokens:
       raise DataWireIdentityNoKeyError("Identity requires public key for token verification")
 
+    # The adapter owns the urllib3 pool, which is thread-safe. requests.Session isn't
+    # guaranteed to be, so each thread gets its own Session mounted on the shared adapter.
+    # Both are created on first use.
+    self.poolArgs = { 'pool_connections': poolSize, 'pool_maxsize': maxKeepAlive,
+                      'pool_block': blockPerHost }
+    self.adapter = None
+    self.adapterLock = threading.Lock()
+    self.sessions = threading.local()
+
+    self.credCache = None
+
+    if credCacheSize:
+      self.credCache = DataWireCredentialCache(maxSize=credCacheSize)
+
+    # The publicKey keyring's reloads count when we last cleared the cache.
+    self.keyringReloads = None
+
+  def httpAdapter(self):
+    with self.adapterLock:
+      if self.adapter is None:
+        from requests.adapters import HTTPAdapter
+
+        self.adapter = HTTPAdapter(**self.poolArgs)
+
+    return self.adapter
+
+  def hedgingThreads(self):
+    with self.adapterLock:
+      if self.hedgeThreads is None:
+        self.hedgeThreads = DataWireHedgeThreads()
+
+    return self.hedgeThreads
+
+  def session(self):
+    session = getattr(self.sessions, 'session', None)
+
+    if session is None:
+      import requests
+
+      adapter = self.httpAdapter()
+
+      session = requests.Session()
+      session.mount('http://', adapter)
+      session.mount('https://', adapter)
+
+      self.sessions.session = session
+
+    return session
+
+  def close(self):
+    """ Drop all pooled connections. The Identity is still usable afterward. """
+    if self.adapter is not None:
+      self.adapter.close()
+
+    with self.adapterLock:
+      if self.hedgeThreads is not None:
+        self.hedgeThreads.close()
+        self.hedgeThreads = None
+
+  def timeoutFor(self, method, timeout=None):
+    if timeout is not None:
+      return timeout
+
+    return self.timeouts.get(method, self.timeout)
+
+  def recordLatency(self, seconds):
+    self.latencies.append(seconds)
+    self.latencyCount += 1
+
+  def currentHedgeDelay(self):
+    """
+    How long to wait before hedging: the hedgeQuantile of recent request times, or None
+    if we haven't timed enough requests yet. Only re-sorted every 16 requests.
+    """
+
+    if len(self.latencies) < self.minHedgeSamples:
+      return None
+
+    if self.latencyCount >= self.hedgeDelayAt:
+      samples = sorted(self.latencies)
+
+      self.hedgeDelay = samples[min(len(samples) - 1, int(len(samples) * self.hedgeQuantile))]
+      self.hedgeDelayAt = self.latencyCount + 16
+
+    return self.hedgeDelay
+
   def makeURL(self, *elements):
     return "%s/%s" % (self.baseURL, "/".join(elements))
 
@@ -37,26 +338,36 @@ class Identity (object):
   
     return url, headers    
 
-  def checkResponse(self, url, resp, required=None):
+  def checkResponse(self, url, resp, required=None, method=None, endpoint=None):
     status = resp.status_code
     result = None
 
     try:
-      result = resp.json()
+      result = jsoncodec.loads(resp.content)
     except ValueError:
       pass
 
+    return self.checkResult(url, status, result, required=required, method=method,
+                            endpoint=endpoint)
+
+  def checkResult(self, url, status, result, required=None, method=None, endpoint=None):
+    """
+    The guts of checkResponse, once the response body has been decoded. Split out so that
+    AsyncIdentity can share it. Failures are counted against method and endpoint, if given.
+    """
+
     # print("%s: %d -- %s" % (url, status, result))
 
     if not result:
       # Hrm.
-      return DataWireResult.fromError('No result from request (status %d)!' % status)
+      return self.failure(method, endpoint, 'no result',
+                          'No result from request (status %d)!' % status)
 
     # OK. Did it work?
     ok = result.get('ok', False)
 
     if not ok:
-      return DataWireResult.fromError(result.get('error', 'request failed!'))
+      return self.failure(method, endpoint, 'not ok', result.get('error', 'request failed!'))
 
     # OK, if here, the claim is that it worked.
 
@@ -67,38 +378,149 @@ class Identity (object):
         missingElements.append(key)
 
     if missingElements:
-      return DataWireResult.fromError('missing response elements: %s' % " ".join(missingElements))
+      return self.failure(method, endpoint, 'missing elements',
+                          'missing response elements: %s' % " ".join(missingElements))
 
     # Finally!
     return DataWireResult(**result)
 
-  def get(self, target=None, required=None, token=None):
+  def failure(self, method, endpoint, reason, error):
+    """ A failed DataWireResult for error, counted (if we're counting) under reason. """
+    if (self.metrics is not None) and (endpoint is not None):
+      self.metrics.recordFailure(method, endpoint, reason, error)
+
+    return DataWireResult.fromError(error)
+
+  def request(self, method, target=None, args=None, required=None, token=None, timeout=None,
+              hedge=False):
     """
-    GET from an endpoint that will respond with a JSON-encoded DataWireResult.
+    Make a request to an endpoint that will respond with a JSON-encoded DataWireResult.
 
     Returns a DataWireResult, after making sure that all the requiredResults are present
-    in the DataWireResult.
+    in the DataWireResult. hedge says the request is safe to send twice (see __init__).
     """
 
     url, headers = self.httpParams(target, token)
-    resp = requests.get(url, headers=headers)
+    timeout = self.timeoutFor(method, timeout)
+    endpoint = DataWireMetrics.endpointFor(target) if (self.metrics is not None) else None
+
+    delay = None
+
+    if hedge and self.hedge:
+      delay = self.currentHedgeDelay()
+
+    if delay is None:
+      resp = self.send(method, url, args, headers, timeout, endpoint)
+    else:
+      resp = self.sendHedged(delay, method, url, args, headers, timeout, endpoint)
+
+    if isinstance(resp, DataWireResult):
+      # Timed out.
+      return resp
+
+    return self.checkResponse(url, resp, required=required, method=method, endpoint=endpoint)
+
+  def send(self, method, url, args, headers, timeout, endpoint=None):
+    """ One HTTP request. Returns the response, or a failed DataWireResult on timeout. """
+    import requests
+
+    start = time.time()
+
+    try:
+      resp = self.session().request(method, url, json=args, headers=headers, timeout=timeout)
+    except requests.exceptions.Timeout as e:
+      return self.failure(method, endpoint, 'timeout', '%s %s timed out: %s' % (method, url, e))
+
+    elapsed = time.time() - start
+    self.recordLatency(elapsed)
+
+    if (self.metrics is not None) and (endpoint is not None):
+      self.metrics.recordResponse(method, endpoint, resp.status_code, elapsed, len(resp.content))
 
-    return self.checkResponse(url, resp, required=required)
+    return resp
 
-  def post(self, target=None, args=None, required=None, token=None):
+  def sendHedged(self, delay, method, url, args, headers, timeout, endpoint=None):
     """
-    POST to an endpoint that will respond with a JSON-encoded DataWireResult.
+    send(), but if there's no answer within delay seconds of sending, send it again, and
+    return whichever answers first. (If the first answer is a failure, wait for the other.)
+    If hedgeWorkers duplicates are already in flight, don't add another; just wait.
+    """
+
+    answers = DataWireAnswers()
+
+    def attempt(which):
+      if which == 0:
+        answers.put((None, None, None))
+
+      try:
+        answers.put((which, self.send(method, url, args, headers, timeout, endpoint), None))
+      except Exception as e:
+        answers.put((which, None, e))
+      finally:
+        if which == 1:
+          with self.adapterLock:
+            self.hedgesInFlight -= 1
+
+    threads = self.hedgingThreads()
+    threads.run(attempt, 0)
+
+    # Start the clock once the request is on its way, not before.
+    answers.get()
+
+    try:
+      which, resp, error = answers.get(delay)
+    except queue.Empty:
+      with self.adapterLock:
+        duplicate = self.hedgesInFlight < self.hedgeWorkers
+
+        if duplicate:
+          self.hedgesInFlight += 1
+          self.hedgesSent += 1
+        else:
+          self.hedgesSkipped += 1
+
+      if duplicate:
+        threads.run(attempt, 1)
+
+      # Wait for as many answers as there are attempts, stopping at the first good one.
+      for i in range(2 if duplicate else 1):
+        which, resp, error = answers.get()
+
+        if (error is None) and not isinstance(resp, DataWireResult):
+          break
+
+      if which == 1:
+        with self.adapterLock:
+          self.hedgesWon += 1
+
+    if error is not None:
+      raise error
+
+    return resp
+
+  def get(self, target=None, required=None, token=None, timeout=None, hedge=True):
+    """
+    GET from an endpoint that will respond with a JSON-encoded DataWireResult.
 
     Returns a DataWireResult, after making sure that all the requiredResults are present
     in the DataWireResult.
     """
 
-    url, headers = self.httpParams(target, token)
-    resp = requests.post(url, json=args, headers=headers)
+    return self.request('GET', target=target, required=required, token=token,
+                        timeout=timeout, hedge=hedge)
+
+  def post(self, target=None, args=None, required=None, token=None, timeout=None, hedge=False):
+    """
+    POST to an endpoint that will respond with a JSON-encoded DataWireResult.
+
+    Returns a DataWireResult, after making sure that all the requiredResults are present
+    in the DataWireResult.
+    """
 
-    return self.checkResponse(url, resp, required=required)
+    return self.request('POST', target=target, args=args, required=required, token=token,
+                        timeout=timeout, hedge=hedge)
 
-  def put(self, target=None, args=None, required=None, token=None):
+  def put(self, target=None, args=None, required=None, token=None, timeout=None):
     """
     PUT to an endpoint that will respond with a JSON-encoded DataWireResult.
 
@@ -106,12 +528,10 @@ class Identity (object):
     in the DataWireResult.
     """
 
-    url, headers = self.httpParams(target, token)
-    resp = requests.put(url, json=args, headers=headers)
+    return self.request('PUT', target=target, args=args, required=required, token=token,
+                        timeout=timeout)
 
-    return self.checkResponse(url, resp, required=required)
-
-  def delete(self, target=None, args=None, required=None, token=None):
+  def delete(self, target=None, args=None, required=None, token=None, timeout=None):
     """
     DELETE to an endpoint that will respond with a JSON-encoded DataWireResult.
 
@@ -119,23 +539,101 @@ class Identity (object):
     in the DataWireResult.
     """
 
-    url, headers = self.httpParams(target, token)
-    resp = requests.delete(url, json=args, headers=headers)
-
-    return self.checkResponse(url, resp, required=required)
+    return self.request('DELETE', target=target, args=args, required=required, token=token,
+                        timeout=timeout)
 
   def credentialFromToken(self, token, orgID):
-    # First, is the credential valid?
+    keyring = self.publicKey if isinstance(self.publicKey, DataWireKeyring) else None
+    reloads = None
+
+    if (keyring is not None) and (self.credCache is not None):
+      # A cache hit never gets as far as the keyring, so check it for changes here: when
+      # a key goes, so must everything it verified.
+      if time.time() >= keyring.nextCheck:
+        keyring.refresh()
+
+      reloads = keyring.reloads
+
+      if reloads != self.keyringReloads:
+        self.credCache.clear()
+        self.keyringReloads = reloads
+
+    # Have we already verified this one?
+    if self.credCache is not None:
+      cred = self.credCache.get(token, orgID)
+
+      if cred is not None:
+        if self.metrics is not None:
+          self.metrics.recordVerification('cached')
+
+        return DataWireResult(ok=True, cred=cred)
+
+    # Nope. Is the credential valid?
 
     really_dont_verify_tokens = False
 
     if not self.publicKey:
       really_dont_verify_tokens = True
 
-    return DataWireCredential.fromJWT(token, self.publicKey, orgID,
-                                      really_dont_verify_tokens=really_dont_verify_tokens)
+    start = time.time()
+
+    rc = DataWireCredential.fromJWT(token, self.publicKey, orgID,
+                                    really_dont_verify_tokens=really_dont_verify_tokens)
+
+    if self.metrics is not None:
+      self.metrics.recordVerification('verified' if rc else 'invalid', time.time() - start)
+
+    # (Unless the keyring reloaded while we were at it: we might have used a dropped key.)
+    if rc and (self.credCache is not None) and ((keyring is None) or (keyring.reloads == reloads)):
+      self.credCache.put(token, orgID, rc.cred)
+
+    return rc
+
+  @classmethod
+  def registerScopePolicy(klass, name, scopesMust, scopesMustNot):
+    """
+    Define (or redefine) the scope policy called name, for checkPolicy: the token's
+    credential must have every scope in scopesMust, and none in scopesMustNot.
+
+    Returns the compiled DataWireScopePolicy.
+    """
+
+    policy = DataWireScopePolicy(scopesMust, scopesMustNot, name=name)
+    klass.scopePolicies[name] = policy
+
+    return policy
+
+  @classmethod
+  def scopePolicy(klass, name):
+    policy = klass.scopePolicies.get(name, None)
+
+    if policy is None:
+      raise DataWireIdentityError("no such scope policy: %s" % name)
+
+    return policy
+
+  @classmethod
+  def adHocPolicy(klass, scopesMust, scopesMustNot):
+    key = (tuple(scopesMust), tuple(scopesMustNot))
+    policy = klass.adHocPolicies.get(key, None)
+
+    if policy is None:
+      policy = DataWireScopePolicy(*key)
+
+      if len(klass.adHocPolicies) < klass.maxAdHocPolicies:
+        klass.adHocPolicies[key] = policy
+
+    return policy
+
+  def checkPolicy(self, token, orgID, policy):
+    """
+    Verify token for orgID, and check its credential against policy: either the name of
+    a registered scope policy, or a DataWireScopePolicy.
+    """
+
+    if not isinstance(policy, DataWireScopePolicy):
+      policy = self.scopePolicy(policy)
 
-  def checkToken(self, token, orgID, scopesMust, scopesMustNot):
     # Try to grab the credential underlying our token...
 
     rc = self.credentialFromToken(token, orgID)
@@ -146,42 +644,73 @@ class Identity (object):
 
     # OK! Time to check to make sure the scopes match.
     cred = rc.cred
+    error = policy.check(cred)
 
-    missingScopes = [ scope for scope in scopesMust if not cred.hasScope(scope) ]
+    if self.metrics is not None:
+      self.metrics.recordPolicyCheck(policy, not error)
 
-    if missingScopes:
-      return DataWireResult.fromError('credential is missing scopes: %s' % " ".join(missingScopes))
-
-    wrongScopes = [ scope for scope in scopesMustNot if cred.hasScope(scope) ]
-
-    if wrongScopes:
-      return DataWireResult.fromError('credential must not have scopes: %s' % " ".join(wrongScopes))
+    if error:
+      return DataWireResult.fromError(error)
 
     # All good.
     return DataWireResult(ok=True, cred=cred)
 
+  def checkToken(self, token, orgID, scopesMust, scopesMustNot):
+    return self.checkPolicy(token, orgID, self.adHocPolicy(scopesMust, scopesMustNot))
+
+  def checkTokens(self, tokens, orgID, scopesMust, scopesMustNot, workers=None, useProcesses=False):
+    """
+    Batch version of checkToken: returns a list of DataWireResults, one per token, in the
+    same order as tokens.
+
+    The work is spread over workers threads (default: one per CPU). With useProcesses,
+    it uses a process pool instead, which sidesteps the GIL for big batches at the cost
+    of starting the processes; credentials verified that way don't land in our cache, or
+    in our metrics.
+    """
+
+    import multiprocessing
+    from multiprocessing.pool import ThreadPool
+
+    tokens = list(tokens)
+
+    if not tokens:
+      return []
+
+    # Compile the scope lists once for the whole batch.
+    policy = self.adHocPolicy(scopesMust, scopesMustNot)
+
+    if not workers:
+      workers = multiprocessing.cpu_count()
+
+    workers = min(workers, len(tokens))
+    chunkSize = max(1, len(tokens) // (workers * 4))
+
+    if useProcesses:
+      pool = multiprocessing.Pool(workers, initializer=_initBatchChecker,
+                                  initargs=(self.publicKey, orgID, policy))
+      checker = _batchCheckToken
+    else:
+      pool = ThreadPool(workers)
+      checker = lambda token: self.checkPolicy(token, orgID, policy)
+
+    try:
+      return pool.map(checker, tokens, chunkSize)
+    finally:
+      pool.close()
+      pool.join()
+
   def checkOrgAdmin(self, token, orgID):
-    return self.checkToken(token, orgID, 
-                           [ 'dw:user0', 'dw:admin0', 'dw:reqSvc0' ], # must have these
-                           [ 'dw:organization0', 'dw:service0' ]      # must not have these
-                          )
+    return self.checkPolicy(token, orgID, 'orgAdmin')
 
   def checkCanRequestServices(self, token, orgID):
-    return self.checkToken(token, orgID, 
-                           [ 'dw:reqSvc0' ],                          # must have these
-                           []                                         # must not have these
-                          )
+    return self.checkPolicy(token, orgID, 'canRequestServices')
+
   def checkUser(self, token, orgID):
-    return self.checkToken(token, orgID, 
-                           [ 'dw:user0' ],                            # must have these
-                           [ 'dw:organization0', 'dw:service0' ]      # must not have these
-                          )
+    return self.checkPolicy(token, orgID, 'user')
 
   def checkService(self, token, orgID):
-    return self.checkToken(token, orgID, 
-                           [ 'dw:service0' ],                         # must have these
-                           [ 'dw:organization0', 'dw:user0', 'dw:reqSvc0' ] # must not have these
-                          )
+    return self.checkPolicy(token, orgID, 'service')
 
   def orgList(self, superToken):
     rc = self.get( target=[ 'v1', 'orgs' ],
@@ -216,6 +745,9 @@ class Identity (object):
                     required=[ 'orgID', 'token' ]
                   )
 
+    return self.orgCreateResult(orgName, rc)
+
+  def orgCreateResult(self, orgName, rc):
     if not rc:
       return rc
 
@@ -351,6 +883,9 @@ class Identity (object):
                     required=[ 'orgID', 'token' ]
                   )
 
+    return self.serviceCreateResult(rc)
+
+  def serviceCreateResult(self, rc):
     if not rc:
       return rc
 
@@ -369,9 +904,28 @@ class Identity (object):
     return DataWireResult(ok=True, token=token, cred=cred, orgID=orgID)
 
   def serviceCheck(self, orgID, token, serviceHandle):
+    # Only checks, so it's as safe to hedge as a GET.
     rc = self.post( target=[ 'v1', 'svcCheck', orgID, serviceHandle ],
                     token=token,
-                    required=[ 'orgID' ]
+                    required=[ 'orgID' ],
+                    hedge=True
                   )
 
     return rc
+
+# Process-pool plumbing for Identity.checkTokens. Each worker process builds its own
+# verification-only Identity once, when it starts, and reuses it for every token it's handed.
+
+_batchChecker = None
+
+def _initBatchChecker(publicKey, orgID, policy):
+  global _batchChecker
+
+  _batchChecker = (Identity(None, publicKey, really_dont_verify_tokens=not publicKey,
+                            metrics=False),
+                   orgID, policy)
+
+def _batchCheckToken(token):
+  identity, orgID, policy = _batchChecker
+
+  return identity.checkPolicy(token, orgID, policy)
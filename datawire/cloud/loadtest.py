@@ -0,0 +1,553 @@
+#!python
+
+"""
+Load generator for the Identity Service, driving it through Identity, so what gets
+measured is the real client path: HTTP, response checking, and verifying the tokens
+that come back. dwc loadtest is the command-line front end.
+"""
+
+import sys
+
+import collections
+import math
+import random
+import re
+import threading
+import time
+
+try:
+  import queue
+except ImportError:
+  import Queue as queue
+
+from ..utils import DataWireResult
+from ..utils.metrics import DataWireHistogram
+from .identity import Identity
+
+# Latency buckets 5% apart, from 100us to about 2 minutes, so quantiles are good to 5%.
+latencyBuckets = tuple(1e-4 * (1.05 ** i) for i in range(290))
+
+def runUserAuth(dwc, fixtures, worker):
+  return dwc.userAuth(fixtures['email'], fixtures['password'], orgID=fixtures.get('orgID'))
+
+def runServiceCreate(dwc, fixtures, worker):
+  worker.created += 1
+  serviceHandle = '%s-%s-%d' % (fixtures['servicePrefix'], worker.name, worker.created)
+
+  return dwc.serviceCreate(fixtures['orgID'], fixtures['userToken'], serviceHandle)
+
+def runServiceCheck(dwc, fixtures, worker):
+  return dwc.serviceCheck(fixtures['orgID'], fixtures['serviceToken'], fixtures['serviceHandle'])
+
+def runOrgList(dwc, fixtures, worker):
+  return dwc.orgList(fixtures['superToken'])
+
+# Operation name -> (function, fixtures it needs).
+operations = collections.OrderedDict([
+  ('userAuth', (runUserAuth, [ 'email', 'password' ])),
+  ('serviceCreate', (runServiceCreate, [ 'orgID', 'userToken', 'servicePrefix' ])),
+  ('serviceCheck', (runServiceCheck, [ 'orgID', 'serviceToken', 'serviceHandle' ])),
+  ('orgList', (runOrgList, [ 'superToken' ])),
+])
+
+def parseMix(text):
+  """
+  Parse a mix like 'serviceCheck=80,userAuth=10,orgList=10' into [ (operation, weight) ].
+  A bare operation name gets weight 1. Raises ValueError for nonsense.
+  """
+
+  mix = []
+
+  for item in text.split(','):
+    name, sep, weight = item.strip().partition('=')
+
+    if name not in operations:
+      raise ValueError("unknown operation %s (try %s)" % (name, ", ".join(operations)))
+
+    weight = float(weight) if sep else 1.0
+
+    if weight < 0:
+      raise ValueError("negative weight for %s" % name)
+
+    if weight > 0:
+      mix.append((name, weight))
+
+  if not mix:
+    raise ValueError("the mix is empty")
+
+  return mix
+
+def prepareFixtures(dwc, mix, email=None, password=None, orgID=None, userToken=None,
+                    superToken=None, serviceHandle='loadtest', servicePrefix='loadtest'):
+  """
+  Gather what the operations in mix need, making the calls that get it (a login for a
+  user token, a service creation for a service token) just once, up front. Returns a
+  DataWireResult with fixtures, or the reason we can't run.
+  """
+
+  fixtures = { 'email': email, 'password': password, 'orgID': orgID, 'userToken': userToken,
+               'superToken': superToken, 'serviceHandle': serviceHandle,
+               'servicePrefix': servicePrefix }
+
+  names = [ name for name, weight in mix ]
+
+  if (('serviceCreate' in names) or ('serviceCheck' in names)) and not userToken:
+    if not (email and password):
+      return DataWireResult.fromError("serviceCreate and serviceCheck need a user token, or an email and password")
+
+  if ('userAuth' in names) and not (email and password):
+    return DataWireResult.fromError("userAuth needs an email and password")
+
+  if (not userToken) and email and password:
+    rc = dwc.userAuth(email, password, orgID=orgID)
+
+    if not rc:
+      return DataWireResult.fromError("could not log in as %s: %s" % (email, rc.error))
+
+    fixtures['userToken'] = rc.token
+    fixtures['orgID'] = rc.orgID
+
+  if 'serviceCheck' in names:
+    rc = dwc.serviceCreate(fixtures['orgID'], fixtures['userToken'], serviceHandle)
+
+    if not rc:
+      return DataWireResult.fromError("could not create service %s: %s" % (serviceHandle, rc.error))
+
+    fixtures['serviceToken'] = rc.token
+
+  for name in names:
+    missing = [ need for need in operations[name][1] if not fixtures.get(need) ]
+
+    if missing:
+      return DataWireResult.fromError("%s needs %s" % (name, ", ".join(missing)))
+
+  return DataWireResult(ok=True, fixtures=fixtures)
+
+class LoadTestPacer (object):
+  """
+  Hands out send times: a rate ramping linearly from zero to rate over ramp seconds,
+  then holding at rate for hold seconds. With rate 0 there's no pacing, just the
+  deadline. Safe to share between threads.
+  """
+
+  def __init__(self, rate, ramp, hold, start=None):
+    self.rate = rate
+    self.ramp = ramp
+    self.hold = hold
+    self.start = time.time() if start is None else start
+    self.end = self.start + ramp + hold
+
+    self.sent = 0
+    self.lock = threading.Lock()
+
+  def offset(self, n):
+    """ When the nth request is due, in seconds from the start. """
+    rampCount = self.rate * self.ramp / 2.0
+
+    if n < rampCount:
+      # n = rate * t^2 / (2 * ramp) while ramping.
+      return math.sqrt(2.0 * n * self.ramp / self.rate)
+
+    return self.ramp + (n - rampCount) / self.rate
+
+  def next(self):
+    """ The time to send the next request, or None once we're past the end. """
+    if not self.rate:
+      now = time.time()
+      return now if (now < self.end) else None
+
+    with self.lock:
+      slot = self.start + self.offset(self.sent)
+      self.sent += 1
+
+    return slot if (slot < self.end) else None
+
+  def targetRate(self, now):
+    if not self.rate:
+      return None
+
+    elapsed = now - self.start
+    return self.rate * min(1.0, elapsed / self.ramp) if (self.ramp and elapsed < self.ramp) else self.rate
+
+class LoadTestStats (object):
+  """
+  Per-operation successes, failures and histograms of latency (from when the request
+  was due) and service time (from when it was actually sent), plus failure messages and
+  a count of hedged duplicates. Workers record() into one; the reporter drain()s it
+  every interval and merge()s what comes back from every worker process.
+  """
+
+  def __init__(self):
+    self.ops = {}
+    self.errors = collections.Counter()
+    self.hedges = 0
+    self.lock = threading.Lock()
+
+  def record(self, op, ok, seconds, serviceSeconds, error=None):
+    with self.lock:
+      entry = self.ops.get(op, None)
+
+      if entry is None:
+        entry = [ 0, 0, DataWireHistogram(latencyBuckets), DataWireHistogram(latencyBuckets) ]
+        self.ops[op] = entry
+
+      if ok:
+        entry[0] += 1
+      else:
+        entry[1] += 1
+        self.errors[error] += 1
+
+      entry[2].observe(seconds)
+      entry[3].observe(serviceSeconds)
+
+  def hedged(self, count):
+    with self.lock:
+      self.hedges += count
+
+  def drain(self):
+    """ Everything recorded since the last drain(), as a picklable (ops, errors, hedges). """
+    with self.lock:
+      drained = (self.ops, dict(self.errors), self.hedges)
+      self.ops = {}
+      self.errors = collections.Counter()
+      self.hedges = 0
+
+    return drained
+
+  def merge(self, drained):
+    ops, errors, hedges = drained
+
+    with self.lock:
+      for op, (ok, failed, histogram, serviceHistogram) in ops.items():
+        entry = self.ops.get(op, None)
+
+        if entry is None:
+          self.ops[op] = [ ok, failed, histogram, serviceHistogram ]
+        else:
+          entry[0] += ok
+          entry[1] += failed
+          entry[2].merge(histogram)
+          entry[3].merge(serviceHistogram)
+
+      self.errors.update(errors)
+      self.hedges += hedges
+
+  def totals(self, ops=None):
+    """
+    (successes, failures, latency histogram, service time histogram) summed over ops
+    (default: all of them).
+    """
+
+    ok = failed = 0
+    histogram = DataWireHistogram(latencyBuckets)
+    serviceHistogram = DataWireHistogram(latencyBuckets)
+
+    for op, entry in self.ops.items():
+      if (ops is None) or (op in ops):
+        ok += entry[0]
+        failed += entry[1]
+        histogram.merge(entry[2])
+        serviceHistogram.merge(entry[3])
+
+    return ok, failed, histogram, serviceHistogram
+
+class LoadTestWorker (threading.Thread):
+  def __init__(self, name, dwc, fixtures, mix, pacer, stats, seed, startAt):
+    threading.Thread.__init__(self, name='loadtest-%s' % name)
+    self.daemon = True
+
+    self.name = name
+    self.dwc = dwc
+    self.fixtures = fixtures
+    self.pacer = pacer
+    self.stats = stats
+    self.startAt = startAt
+    self.created = 0
+
+    self.random = random.Random(seed)
+    self.choices = [ (name, operations[name][0]) for name, weight in mix ]
+    self.cumulative = []
+
+    total = 0.0
+
+    for name, weight in mix:
+      total += weight
+      self.cumulative.append(total)
+
+  def choose(self):
+    pick = self.random.random() * self.cumulative[-1]
+
+    for i, bound in enumerate(self.cumulative):
+      if pick < bound:
+        return self.choices[i]
+
+    return self.choices[-1]
+
+  def run(self):
+    delay = self.startAt - time.time()
+
+    if delay > 0:
+      time.sleep(delay)
+
+    while True:
+      slot = self.pacer.next()
+
+      if slot is None:
+        break
+
+      delay = slot - time.time()
+
+      if delay > 0:
+        time.sleep(delay)
+
+      op, function = self.choose()
+      start = time.time()
+
+      try:
+        rc = function(self.dwc, self.fixtures, self)
+        ok, error = bool(rc), (None if rc else rc.error)
+      except Exception as e:
+        # Drop object addresses from the message, so the same failure counts as the same.
+        ok, error = False, re.sub(r' at 0x[0-9a-fA-F]+', '', '%s: %s' % (type(e).__name__, e))
+
+      # Latency counts from when the request was due, not when we got round to sending it:
+      # if the service is slow enough that we fall behind, the wait is part of what a
+      # client sending at this rate would see. (Unpaced, the two are the same.)
+      now = time.time()
+      self.stats.record(op, ok, now - slot, now - start, error)
+
+def runWorkers(dwc, fixtures, mix, workers, rate, ramp, hold, seed, publish, interval, name='0',
+               start=None):
+  """
+  Run workers threads of load against dwc, publish()ing what LoadTestStats.drain()
+  gives every interval seconds, and None when done.
+  """
+
+  ownClient = isinstance(dwc, dict)
+
+  if ownClient:
+    # We're in a worker process, which needs its own client.
+    dwc = Identity(**dwc)
+
+  start = time.time() if start is None else start
+  pacer = LoadTestPacer(rate, ramp, hold, start=start)
+  stats = LoadTestStats()
+  hedgesReported = [ dwc.hedgesSent ]
+  threads = []
+
+  def drain():
+    # Hedged duplicates are load on the service too, so count them in.
+    sent = dwc.hedgesSent
+    stats.hedged(sent - hedgesReported[0])
+    hedgesReported[0] = sent
+
+    return stats.drain()
+
+  for i in range(workers):
+    # Without a target rate, ramp up by starting workers over the ramp instead.
+    startAt = start + ((ramp * i / float(workers)) if not rate else 0)
+
+    threads.append(LoadTestWorker('%s.%d' % (name, i), dwc, fixtures, mix, pacer, stats,
+                                  ('%s/%s/%d' % (seed, name, i)) if (seed is not None) else None, startAt))
+
+  try:
+    for thread in threads:
+      thread.start()
+
+    nextPublish = start + interval
+
+    for thread in threads:
+      while thread.is_alive():
+        thread.join(max(0.0, min(nextPublish - time.time(), interval)))
+
+        if time.time() >= nextPublish:
+          publish(drain())
+          nextPublish += interval
+
+    publish(drain())
+  finally:
+    # However we got here, tell the reporter we're done.
+    publish(None)
+
+    if ownClient:
+      dwc.close()
+
+def formatSeconds(seconds):
+  return ("%.2f ms" % (seconds * 1000)) if (seconds is not None) else "-"
+
+class IdentityLoadTest (object):
+  """
+  Drive a mix of Identity calls at an Identity Service.
+
+  dwc - the Identity to use, or, for several processes, a dict of Identity(**args) for
+    each process to build its own
+  fixtures - from prepareFixtures()
+  mix - [ (operation, weight) ], as from parseMix()
+  workers - threads per process
+  processes - worker processes (1 runs the threads in this process)
+  rate - target requests per second, over all processes (0 for as fast as possible).
+    Latencies then count from when each request was due, so falling behind shows up in
+    them; the summary gives service time (from the actual send) as well.
+  ramp, hold - seconds to ramp up to rate, then seconds to hold it
+  interval - seconds between progress lines
+  out - where progress and the summary go (default stdout)
+  """
+
+  def __init__(self, dwc, fixtures, mix, workers=8, processes=1, rate=0, ramp=0, hold=10,
+               interval=1.0, seed=None, out=None):
+    self.dwc = dwc
+    self.fixtures = fixtures
+    self.mix = mix
+    self.workers = workers
+    self.processes = processes
+    self.rate = rate
+    self.ramp = ramp
+    self.hold = hold
+    self.interval = interval
+    self.seed = seed
+    self.out = out or sys.stdout
+
+    self.stats = LoadTestStats()
+
+  def run(self):
+    """ Run the test, printing progress as it goes. Returns a DataWireResult summary. """
+    start = time.time() + 0.1
+    perProcessRate = float(self.rate) / self.processes
+
+    if self.processes > 1:
+      import multiprocessing
+
+      results = multiprocessing.Queue()
+      children = [ multiprocessing.Process(target=runWorkers,
+                                           args=(self.dwc, self.fixtures, self.mix, self.workers,
+                                                 perProcessRate, self.ramp, self.hold, self.seed,
+                                                 results.put, self.interval, str(i), start))
+                   for i in range(self.processes) ]
+
+      for child in children:
+        child.daemon = True
+        child.start()
+    else:
+      results = queue.Queue()
+      children = [ threading.Thread(target=runWorkers,
+                                    args=(self.dwc, self.fixtures, self.mix, self.workers,
+                                          perProcessRate, self.ramp, self.hold, self.seed,
+                                          results.put, self.interval, '0', start)) ]
+      children[0].daemon = True
+      children[0].start()
+
+    self.out.write("%8s %12s %12s %8s %11s %11s %11s\n" %
+                   ("elapsed", "req/s", "target", "errors", "p50", "p95", "p99"))
+
+    running = len(children)
+    interval = LoadTestStats()
+    lastReport = start
+
+    # Workers publish every interval from start; give them a moment to get it to us.
+    nextReport = start + self.interval + 0.05
+
+    while running:
+      try:
+        drained = results.get(True, max(0.01, nextReport - time.time()))
+      except queue.Empty:
+        drained = ()
+
+        if not any(child.is_alive() for child in children):
+          # Whatever was left died without saying it was done.
+          running = 0
+
+      if drained is None:
+        running -= 1
+      elif drained:
+        interval.merge(drained)
+        self.stats.merge(drained)
+
+      now = time.time()
+
+      if (now >= nextReport) or (not running and interval.ops):
+        self.progress(interval, now - start, now - lastReport, now)
+        interval = LoadTestStats()
+        lastReport = now
+        nextReport += self.interval
+
+    for child in children:
+      child.join()
+
+    return self.summary(time.time() - start)
+
+  def progress(self, stats, elapsed, seconds, now):
+    ok, failed, histogram, serviceHistogram = stats.totals()
+    count = ok + failed
+
+    target = None
+
+    if self.rate:
+      # The ramp is linear, so the rate halfway through the interval is its average.
+      target = LoadTestPacer(self.rate, self.ramp, self.hold,
+                             start=now - elapsed).targetRate(now - seconds / 2.0)
+
+    self.out.write("%7.1fs %12.1f %12s %7.2f%% %11s %11s %11s\n" %
+                   (elapsed, count / max(seconds, 1e-6),
+                    ("%.1f" % target) if (target is not None) else "max",
+                    (100.0 * failed / count) if count else 0.0,
+                    formatSeconds(histogram.quantile(0.50)), formatSeconds(histogram.quantile(0.95)),
+                    formatSeconds(histogram.quantile(0.99))))
+    self.out.flush()
+
+  def summary(self, elapsed):
+    lines = [ "", "%-16s %10s %10s %8s %11s %11s %11s" %
+                  ("operation", "requests", "req/s", "errors", "p50", "p95", "p99") ]
+
+    ops = {}
+
+    serviceLines = [ "", "%-16s %10s %10s %8s %11s %11s %11s" %
+                         ("service time", "", "", "", "p50", "p95", "p99") ]
+
+    for op in [ name for name, weight in self.mix ] + [ None ]:
+      ok, failed, histogram, serviceHistogram = self.stats.totals([ op ] if op else None)
+      count = ok + failed
+
+      values = { 'requests': count, 'errors': failed, 'throughput': count / elapsed,
+                 'errorRate': (float(failed) / count) if count else 0.0,
+                 'p50': histogram.quantile(0.50), 'p95': histogram.quantile(0.95),
+                 'p99': histogram.quantile(0.99),
+                 'serviceP50': serviceHistogram.quantile(0.50),
+                 'serviceP95': serviceHistogram.quantile(0.95),
+                 'serviceP99': serviceHistogram.quantile(0.99) }
+      ops[op or 'total'] = values
+
+      lines.append("%-16s %10d %10.1f %7.2f%% %11s %11s %11s" %
+                   (op or 'total', count, values['throughput'], 100 * values['errorRate'],
+                    formatSeconds(values['p50']), formatSeconds(values['p95']),
+                    formatSeconds(values['p99'])))
+      serviceLines.append("%-16s %10s %10s %8s %11s %11s %11s" %
+                          (op or 'total', "", "", "", formatSeconds(values['serviceP50']),
+                           formatSeconds(values['serviceP95']), formatSeconds(values['serviceP99'])))
+
+    if self.rate:
+      # Paced, the latencies above include any time spent behind schedule; these don't.
+      lines.extend(serviceLines)
+
+    total = ops['total']
+
+    if self.stats.hedges:
+      lines.append("")
+      lines.append("hedged: %d duplicate requests (%.1f%% more load than the counts above)" %
+                   (self.stats.hedges, 100.0 * self.stats.hedges / max(total['requests'], 1)))
+
+    if self.stats.errors:
+      lines.append("")
+      lines.append("most common errors:")
+
+      for error, count in self.stats.errors.most_common(5):
+        lines.append("  %8d  %s" % (count, error))
+
+    self.out.write("\n".join(lines) + "\n")
+    self.out.flush()
+
+    return DataWireResult(ok=True, elapsed=elapsed, operations=ops, requests=total['requests'],
+                          errors=total['errors'], throughput=total['throughput'],
+                          errorRate=total['errorRate'], p50=total['p50'], p95=total['p95'],
+                          p99=total['p99'], serviceP50=total['serviceP50'],
+                          serviceP95=total['serviceP95'], serviceP99=total['serviceP99'],
+                          hedges=self.stats.hedges)
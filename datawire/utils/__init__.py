@@ -2,61 +2,78 @@ import sys
 
 import base64
 import collections
-import json
 import time
 import types
-import uuid
 
-from jose import jwt
-from jose.exceptions import JWSError
+# jose.jwt (and the crypto it drags in) and uuid are slow to import, and the HS256 paths
+# don't need them, so they're imported where they're used. jose.exceptions is cheap.
+from jose.exceptions import JWSError, JWTError
+
+from . import jsoncodec
+from .hs256 import DataWireHS256
 
 # Grumble grumble Python 2 vs 3 grumble
 # (cf http://lucumr.pocoo.org/2011/1/22/forwards-compatible-python/)
 
 class UnicodeMixin (object):
+  __slots__ = ()
+
   if sys.version_info > (3, 0):
     __str__ = lambda x: x.__unicode__()
   else:
     __str__ = lambda x: unicode(x).encode('utf-8')
 
 def prettyJSON(obj):
-  return json.dumps(obj, indent=4, separators=(',',':'), sort_keys=True)
+  return jsoncodec.dumps(obj, indent=4, separators=(',',':'), sort_keys=True)
+
+# Values DataWireResult.toDict can hand to json as they are.
+_plainTypes = frozenset([ type(None), bool, int, float, str, type(u''), list, dict ] +
+                        ([ long ] if sys.version_info < (3, 0) else []))
+
+_noScopes = frozenset()
+
+# What a single raw key can be, as opposed to a keyring.
+_keyTypes = (bytes, type(u''))
 
 # We use DataWireResult in many places, so it gets to be in the toplevel datawire.utils package.
 
 class DataWireResult (UnicodeMixin):
-  def __init__(self, ok=True, error=None, **kwargs):
-    # OK, what gives? Why are we doing all this craziness with setattr plus a keydict and things like
-    # that? Well, we have a couple of goals here:
-    # 
-    # 1. If we do
-    #
-    #    result = DatawireResult.OK(goodThings=True, badThings=False)
-    #
-    # then we want both result.goodThings and result['goodThings'] to work, for setting or for getting,
-    # and we also want 
-    #
-    #    if "goodThings" in result: ...
-    #
-    # to work too. It turns out to be quite painful to make that work by overriding the . operator to look
-    # into a dict, but easy to do it by overriding the [] operator to look at object attributes... except 
-    # that the 'in' business is annoying to do without also having a separate stash of keys, and iterating 
-    # the set of keys that the user passed in is bloody impossible without a separate stash of keys.
-    #
-    # SO. self._keys is just a set of which keys are present. Attributes on self store the actual values.
-
-    self._keys = set()
+  # We want all of
+  #
+  #    result = DataWireResult.OK(goodThings=True, badThings=False)
+  #
+  #    result.goodThings
+  #    result['goodThings']
+  #    if "goodThings" in result: ...
+  #    for key in result.keys(): ...
+  #
+  # to work, for setting and for getting. So the instance __dict__ holds the values and
+  # nothing else -- it's just the kwargs dict we were constructed with -- and ok lives in a
+  # slot, out of the way. error is in the dict when it's set (so 'error' is a key of a
+  # failed result, not of an OK one), and falls back to the class's None otherwise.
+  #
+  # We make a lot of these -- several per Identity call or credential check -- so this
+  # keeps them small and plain attribute access fast, with no extra set of keys to keep
+  # in sync.
+
+  __slots__ = ( 'ok', '__dict__' )
+
+  error = None
 
+  def __init__(self, ok=True, error=None, **kwargs):
     if ok:
-      self.ok = True
-      self.error = None     # you can't set ok and error at the same time
+      self.ok = True      # you can't set ok and error at the same time
     else:
       self.ok = False
+      kwargs['error'] = error
 
-      self['error'] = error
+    self.__dict__ = kwargs
 
-    for key in kwargs:
-      self[key] = kwargs[key]
+  def __getstate__(self):
+    return (self.ok, self.__dict__)
+
+  def __setstate__(self, state):
+    self.ok, self.__dict__ = state
 
   def toDict(self):
     """ 
@@ -66,45 +83,50 @@ class DataWireResult (UnicodeMixin):
     in any meaningful way. [ :P ]
     """
 
-    dictified = { 'ok': self.ok }
+    values = self.__dict__
 
-    for key in self._keys:
-      value = self[key]
+    dictified = { 'ok': self.ok }
+    dictified.update(values)
 
-      dictifier = getattr(value, 'toDict', None)
+    for key, value in values.items():
+      # Most values are plain JSON already; only go looking for toDict on the rest.
+      if type(value) not in _plainTypes:
+        dictifier = getattr(value, 'toDict', None)
 
-      if dictifier:
-        dictifiedValue = dictifier()
-      else:
-        dictifiedValue = value
-
-      dictified[key] = dictifiedValue
+        if dictifier:
+          dictified[key] = dictifier()
 
     return dictified
 
   def toJSON(self):
-    return json.dumps(self.toDict())
+    return jsoncodec.dumps(self.toDict())
 
   def keys(self):
-    return iter(self._keys)
+    return iter(self.__dict__)
 
   def __setitem__(self, key, value):
-    self._keys.add(key)
     setattr(self, key, value)
 
   def __getitem__(self, key):
-    return getattr(self, key)
+    try:
+      return self.__dict__[key]
+    except KeyError:
+      return getattr(self, key)     # ok, error, or AttributeError as always
 
   def __contains__(self, key):
-    return key in self._keys
+    return key in self.__dict__
 
   def __nonzero__(self):
     return self.ok
 
+  __bool__ = __nonzero__    # Python 3
+
   def __unicode__(self):
+    values = self.__dict__
+
     return (u'<DWR %s %s>' % 
             ("OK" if self else "BAD",
-             " ".join([ '%s=%s' % (key, repr(getattr(self, key))) for key in sorted(self._keys) ])))
+             " ".join([ '%s=%s' % (key, repr(values[key])) for key in sorted(values) ])))
 
   @classmethod
   def fromError(klass, error, **kwargs):
@@ -132,7 +154,7 @@ class DataWireResult (UnicodeMixin):
     between receiving valid JSON for DataWireResult that happens to have ok=False, and receiving bad JSON.
     """
 
-    incoming = json.loads(inputJSON)
+    incoming = jsoncodec.loads(inputJSON)
     errorMessage = None
 
     if not isinstance(incoming, collections.Mapping):
@@ -183,8 +205,27 @@ class DataWireCredential (UnicodeMixin):
   iat (optional) - issued-at time, seconds since epoch; if None will be now
   nbf (optional) - not-before time, seconds since epoch; if None will be now
   exp (optional) - expiration time, seconds since epoch; if None, token will not expire
+
+  The credential cache can hold a great many of these, so they're slotted, and scopes
+  aren't kept as a dict per credential: the scopes we know about are bits in scopeMask,
+  and anything else is in the scopeExtra set. The scopes dict itself, which getClaims()
+  has to give back exactly as it came in (values, order and all, since it gets signed),
+  is scopeDict: one dict shared between all the creds with the same scopes.
   """
 
+  __slots__ = ( 'orgID', 'credID', 'ownerEmail', 'email', 'tokenID', 'iat', 'nbf', 'expiry',
+                'scopeMask', 'scopeExtra', 'scopeDict' )
+
+  knownScopes = ( 'dw:user0', 'dw:admin0', 'dw:reqSvc0', 'dw:service0', 'dw:organization0',
+                  'dw:doppelganger0' )
+
+  scopeBits = dict((scope, 1 << bit) for bit, scope in enumerate(knownScopes))
+
+  # Tuple of (scope, value) pairs -> (scopeDict, scopeMask, scopeExtra) for those scopes.
+  # Bounded, in case someone feeds us lots of tokens with made-up scopes.
+  scopeLayouts = {}
+  maxScopeLayouts = 1024
+
   prettyScopeNames = {
     'dw:admin0': 'Organization administrator',
     'dw:organization0': 'Organization',
@@ -194,8 +235,13 @@ class DataWireCredential (UnicodeMixin):
     'dw:doppelganger0': 'Doppelgangers welcome'
   }
 
+  # How far off we'll let the issuer's clock be from ours when checking iat, nbf, and exp.
+  clockSkew = 30
+
   def __init__(self, orgID, credID, scopes, ownerEmail, email=None, tokenID=None, iat=None, nbf=None, exp=None):
     if tokenID is None:
+      import uuid
+
       tokenID = unicode(uuid.uuid4())
 
     now = int(time.time())
@@ -219,11 +265,85 @@ class DataWireCredential (UnicodeMixin):
     self.nbf = nbf
     self.expiry = exp
 
+  @classmethod
+  def scopeLayout(klass, scopes):
+    """ Returns (scopeDict, scopeMask, scopeExtra) for a dict of scopes. """
+    items = tuple(scopes.items())
+
+    # Key on each value's type too: True == 1 == 1.0 and they hash alike, but they don't
+    # serialize alike, and the shared dict is what goes into signed claims. (Containers
+    # like (True,) vs (1,) have the same problem one level down, so they never share.)
+    key = tuple((scope, type(value), value) for scope, value in items)
+
+    try:
+      if any(isinstance(value, (tuple, frozenset)) for scope, value in items):
+        raise TypeError("container scope values")
+
+      layout = klass.scopeLayouts.get(key, None)
+      shareable = True
+    except TypeError:
+      # Unhashable values. Odd, but legal: just don't share.
+      layout = None
+      shareable = False
+
+    if layout is None:
+      mask = 0
+      extra = set()
+
+      for scope, value in items:
+        if value:
+          bit = _scopeBits.get(scope, 0)
+
+          if bit:
+            mask |= bit
+          else:
+            extra.add(scope)
+
+      # Share a copy rather than the caller's dict, unless the copy comes out in a
+      # different order (hash collisions can do that on Python 2).
+      shared = dict(items)
+
+      if tuple(shared.items()) != items:
+        shared = scopes
+        shareable = False
+
+      layout = (shared, mask, frozenset(extra) if extra else _noScopes)
+
+      if shareable:
+        # Start over when full, rather than stop sharing for good.
+        if len(klass.scopeLayouts) >= klass.maxScopeLayouts:
+          klass.scopeLayouts.clear()
+
+        klass.scopeLayouts[key] = layout
+
+    return layout
+
+  @property
+  def scopes(self):
+    return dict(self.scopeDict)
+
+  @scopes.setter
+  def scopes(self, scopes):
+    self.scopeDict, self.scopeMask, self.scopeExtra = self.scopeLayout(scopes)
+
+  def __getstate__(self):
+    return tuple(getattr(self, slot) for slot in self.__slots__)
+
+  def __setstate__(self, state):
+    for slot, value in zip(self.__slots__, state):
+      setattr(self, slot, value)
+
   def __unicode__(self):
-    return "<DWCred %s - %s - %s>" % (self.orgID, self.credID, ",".join(sorted(self.scopes.keys())))
+    return "<DWCred %s - %s - %s>" % (self.orgID, self.credID,
+                                      ",".join(sorted(self.scopeDict.keys())))
 
   def hasScope(self, scope):
-    return bool(self.scopes.get(scope, False))
+    bit = _scopeBits.get(scope, 0)
+
+    if bit:
+      return (self.scopeMask & bit) != 0
+
+    return scope in self.scopeExtra
 
   def isUser(self):
     return self.hasScope('dw:user0')
@@ -247,7 +367,7 @@ class DataWireCredential (UnicodeMixin):
       'nbf': self.nbf,
       'email': self.email,
       'ownerEmail': self.ownerEmail,
-      'scopes': self.scopes,
+      'scopes': self.scopeDict,     # shared with other creds: don't modify
       'dwType': 'DataWireCredential',
     }
 
@@ -260,10 +380,31 @@ class DataWireCredential (UnicodeMixin):
     return self.getClaims()
 
   def toJSON(self):
-    return json.dumps(self.getClaims())
+    return jsoncodec.dumps(self.getClaims())
 
-  def toJWT(self, privateKey, algorithm='HS256'):
-    return jwt.encode(self.getClaims(), privateKey, algorithm=algorithm)
+  def toJWT(self, privateKey, algorithm='HS256', kid=None):
+    """
+    privateKey is a raw HMAC key, a PEM-encoded private key for algorithm, or a key from
+    DataWireKey.load_private (which knows its own algorithm). kid, if given, goes in the
+    JWT header so that a DataWireKeyring can find the key.
+    """
+
+    if not isinstance(privateKey, _keyTypes):
+      codec = privateKey if kid is None else privateKey.withKID(kid)
+    elif algorithm == 'HS256':
+      codec = DataWireHS256.forKey(privateKey, kid)
+    else:
+      from .asymmetric import codecForPEM
+
+      codec = codecForPEM(privateKey, algorithm, kid)
+
+      if codec is None:
+        from jose import jwt
+
+        return jwt.encode(self.getClaims(), privateKey, algorithm=algorithm,
+                          headers=({ 'kid': kid } if kid is not None else None))
+
+    return codec.encode(self.getClaims())
 
   @classmethod
   def prettyScopeName(self, scope):
@@ -271,7 +412,7 @@ class DataWireCredential (UnicodeMixin):
 
   @classmethod
   def fromJSON(self, inputJSON, needOrgID):
-    claims = json.loads(inputJSON)
+    claims = jsoncodec.loads(inputJSON)
 
     return DataWireCredential.fromClaims(claims, needOrgID)
 
@@ -307,14 +448,14 @@ class DataWireCredential (UnicodeMixin):
     if issuer != 'cloud-hub.datawire.io':
       badElements.append('issuer (must be cloud-hub.datawire.io)')
 
-    if (not isinstance(iat, int)) or (iat > (now + 30)):
+    if (not isinstance(iat, int)) or (iat > (now + DataWireCredential.clockSkew)):
       badElements.append('iat (must not be in the future)')
 
-    if (not isinstance(nbf, int)) or (nbf > (now + 30)):
+    if (not isinstance(nbf, int)) or (nbf > (now + DataWireCredential.clockSkew)):
       badElements.append('nbf (must not be in the future)')
 
     if ((exp is not None) and 
-        ((not isinstance(exp, int)) or (exp < (now - 30)))):
+        ((not isinstance(exp, int)) or (exp < (now - DataWireCredential.clockSkew)))):
       badElements.append('exp (must not be in the past)')
 
     if not credID:
@@ -346,6 +487,10 @@ class DataWireCredential (UnicodeMixin):
     Decode a JWT into a credential. You must know the orgID for which the
     cred should have been issued, because we need to verify that it matches.
 
+    publicKey is a raw HMAC key or a PEM-encoded public key for algorithm; or a key from
+    DataWireKey.load_public, which knows its own algorithm; or a DataWireKeyring, which
+    picks the key by the token's kid.
+
     Returns a DataWireResult with a cred member on success.
     """
 
@@ -358,21 +503,37 @@ class DataWireCredential (UnicodeMixin):
         if not really_dont_verify_tokens:
           errorMessage = "public key is required to decode JWT"
         else:
-          header = jwt.get_unverified_headers(token)
+          # Split the token just once, rather than once for the header and again for the claims.
+          header, claimsSegment, signingInput, signature = DataWireHS256.split(token)
 
           if (('typ' not in header) or (header['typ'] != 'JWT')):
             errorMessage = 'malformed token (not a JWT)'
-          elif (('alg' not in header) or (header['alg'] != 'HS256')):
-            errorMessage = 'malformed token (not HS256)'
+          elif (('alg' not in header) or (header['alg'] != algorithm)):
+            errorMessage = 'malformed token (not %s)' % algorithm
           else:
-            claims = jwt.get_unverified_claims(token)
+            claims = DataWireHS256.decodeSegment(claimsSegment, 'payload')
       else:
-        claims = jwt.decode(token, publicKey,
-                            algorithms=algorithm,
-                            audience=needOrgID,
-                            issuer='cloud-hub.datawire.io')
-    except JWSError as error:
-      errorMessage = error.message
+        if not isinstance(publicKey, _keyTypes):
+          codec = publicKey     # already parsed, or a DataWireKeyring
+        elif algorithm == 'HS256':
+          codec = DataWireHS256.forKey(publicKey)
+        else:
+          # PEM text: parse it once, not once per token.
+          from .asymmetric import codecForPEM
+
+          codec = codecForPEM(publicKey, algorithm)
+
+        if codec is not None:
+          claims = codec.decode(token, audience=needOrgID, issuer='cloud-hub.datawire.io')
+        else:
+          from jose import jwt
+
+          claims = jwt.decode(token, publicKey,
+                              algorithms=algorithm,
+                              audience=needOrgID,
+                              issuer='cloud-hub.datawire.io')
+    except (JWSError, JWTError) as error:
+      errorMessage = str(error)
 
     if claims:
       rc = DataWireCredential.fromClaims(claims, needOrgID)
@@ -383,3 +544,6 @@ class DataWireCredential (UnicodeMixin):
         errorMessage = rc.error
 
     return DataWireResult.fromErrorAndResults(error=errorMessage, cred=cred)
+
+# Module-level, so hasScope() skips the trip through the class.
+_scopeBits = DataWireCredential.scopeBits
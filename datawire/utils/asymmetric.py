@@ -0,0 +1,197 @@
+#!python
+
+import hashlib
+import json
+
+from jose.exceptions import JWSError
+
+from .hs256 import DataWireHS256, base64url_encode
+
+class DataWireAsymmetricJWT (object):
+  """
+  JWT codec for DataWireCredential with a public-key algorithm (see DataWireRS256 and
+  DataWireES256 below), along the lines of DataWireHS256.
+
+  jose parses the PEM key again on every encode and decode, and public-key parsing is
+  slow. A codec here parses its key once, when it's built, and then signs and verifies
+  with the parsed key directly. A codec built from a public key can only verify, which
+  is all an edge verifier needs.
+
+  Tokens are what jose.jwt.encode(claims, pem, algorithm=...) would produce (for RS256,
+  byte for byte; ES256 signatures are randomized), and decode() applies jose's checks with
+  jose's error messages.
+
+  Don't build these directly; use forPEM(pem), or DataWireKey.load_private/load_public
+  with keyType 'RSA' or 'EC'. Codecs work anywhere a key does: DataWireCredential.toJWT
+  and fromJWT, and Identity.
+  """
+
+  algorithm = None
+
+  codecs = {}
+  maxCodecs = 32
+
+  def __init__(self, pem, kid=None):
+    if not isinstance(pem, bytes):
+      pem = pem.encode('utf-8')
+
+    self.pem = pem
+    self.kid = kid
+    self.signingKey, self.verifyingKey = self.parse(pem)
+
+    header = { "typ": "JWT", "alg": self.algorithm }
+
+    if kid is not None:
+      header.update({ 'kid': kid })
+
+    # Same dict, same json.dumps call as jose, so the same bytes.
+    self.headerSegment = base64url_encode(json.dumps(header, separators=(',', ':')).encode('utf-8'))
+
+    if len(DataWireHS256.knownHeaders) < DataWireHS256.maxKnownHeaders:
+      DataWireHS256.knownHeaders[self.headerSegment] = header
+
+  @classmethod
+  def forPEM(klass, pem, kid=None):
+    """ Returns the (shared) codec for the PEM-encoded key pem, signing with kid if given. """
+    cacheKey = (klass.algorithm, pem, kid)
+    codec = klass.codecs.get(cacheKey, None)
+
+    if codec is None:
+      if len(klass.codecs) >= klass.maxCodecs:
+        klass.codecs.clear()
+
+      codec = klass(pem, kid=kid)
+      klass.codecs[cacheKey] = codec
+
+    return codec
+
+  def withKID(self, kid):
+    """ This codec's key, signing with kid in the header instead. """
+    if kid == self.kid:
+      return self
+
+    return self.forPEM(self.pem, kid)
+
+  # Parsed keys don't all pickle, so pickle the PEM and parse again.
+  def __getstate__(self):
+    return (self.pem, self.kid)
+
+  def __setstate__(self, state):
+    self.__init__(*state)
+
+  def canSign(self):
+    return self.signingKey is not None
+
+  def encode(self, claims):
+    if self.signingKey is None:
+      raise JWSError('A private key is required to sign %s tokens.' % self.algorithm)
+
+    claimsSegment = DataWireHS256.claimsSegment(claims)
+    signingInput = self.headerSegment + b'.' + claimsSegment
+
+    return (signingInput + b'.' + base64url_encode(self.signature(signingInput))).decode('utf-8')
+
+  def decode(self, token, audience=None, issuer=None):
+    """ Verify token and return its claims, as jose.jwt.decode(token, pem, algorithms=..., ...) """
+    return self.verify(DataWireHS256.split(token), audience=audience, issuer=issuer)
+
+  def verify(self, pieces, audience=None, issuer=None):
+    """ decode(), for a token already split() by DataWireHS256.split. """
+    header, claimsSegment, signingInput, signature = pieces
+
+    alg = header.get('alg')
+
+    if not alg:
+      raise JWSError('No algorithm was specified in the JWS header.')
+
+    if alg != self.algorithm:
+      raise JWSError('The specified alg value is not allowed')
+
+    if not self.checkSignature(signingInput, signature):
+      raise JWSError('Signature verification failed.')
+
+    claims = DataWireHS256.decodeSegment(claimsSegment, 'payload')
+
+    DataWireHS256.checkClaims(claims, audience, issuer)
+
+    return claims
+
+class DataWireRS256 (DataWireAsymmetricJWT):
+  """ RS256 (RSASSA-PKCS1-v1_5 with SHA-256), with PyCrypto as jose uses it. """
+
+  algorithm = 'RS256'
+
+  def parse(self, pem):
+    from Crypto.Hash import SHA256
+    from Crypto.PublicKey import RSA
+    from Crypto.Signature import PKCS1_v1_5
+
+    try:
+      key = RSA.importKey(pem)
+    except (ValueError, IndexError, TypeError) as e:
+      raise JWSError('Could not parse RSA key: %s' % e)
+
+    self.hash = SHA256
+
+    # Build the signer/verifier once; they're stateless between messages.
+    signer = PKCS1_v1_5.new(key) if key.has_private() else None
+
+    return signer, PKCS1_v1_5.new(key.publickey())
+
+  def signature(self, signingInput):
+    return self.signingKey.sign(self.hash.new(signingInput))
+
+  def checkSignature(self, signingInput, signature):
+    try:
+      return self.verifyingKey.verify(self.hash.new(signingInput), signature)
+    except (ValueError, TypeError):
+      # A signature too big for our modulus (say, from another key) raises rather than
+      # failing. jose does the same.
+      return False
+
+class DataWireES256 (DataWireAsymmetricJWT):
+  """ ES256 (ECDSA on P-256 with SHA-256), with the ecdsa package as jose uses it. """
+
+  algorithm = 'ES256'
+
+  def parse(self, pem):
+    import ecdsa
+
+    self.ecdsa = ecdsa
+
+    try:
+      # As jose does it: we don't know which kind of key we have, so try public first.
+      try:
+        signingKey = None
+        verifyingKey = ecdsa.VerifyingKey.from_pem(pem)
+      except ecdsa.der.UnexpectedDER:
+        signingKey = ecdsa.SigningKey.from_pem(pem)
+        verifyingKey = signingKey.get_verifying_key()
+    except (ecdsa.der.UnexpectedDER, ValueError, AssertionError) as e:
+      raise JWSError('Could not parse EC key: %s' % e)
+
+    if verifyingKey.curve != ecdsa.NIST256p:
+      raise JWSError('ES256 needs a P-256 key, not %s' % verifyingKey.curve.name)
+
+    return signingKey, verifyingKey
+
+  def signature(self, signingInput):
+    return self.signingKey.sign(signingInput, hashfunc=hashlib.sha256,
+                                sigencode=self.ecdsa.util.sigencode_string)
+
+  def checkSignature(self, signingInput, signature):
+    try:
+      return self.verifyingKey.verify(signature, signingInput, hashfunc=hashlib.sha256,
+                                      sigdecode=self.ecdsa.util.sigdecode_string)
+    except Exception:
+      # BadSignatureError, or a signature of the wrong length, etc. (jose does the same.)
+      return False
+
+# Algorithm name -> codec class.
+algorithms = dict((klass.algorithm, klass) for klass in [ DataWireRS256, DataWireES256 ])
+
+def codecForPEM(pem, algorithm, kid=None):
+  """ The codec for a PEM-encoded key and an algorithm name, or None if we don't do that algorithm. """
+  klass = algorithms.get(algorithm, None)
+
+  return klass.forPEM(pem, kid) if klass else None
@@ -0,0 +1,84 @@
+#!python
+
+import collections
+import threading
+import time
+
+from . import DataWireCredential
+
+class DataWireCredentialCache (object):
+  """
+  Bounded LRU cache of verified DataWireCredentials, keyed by (token, orgID).
+
+  Only credentials that passed verification belong in here. An entry is dropped once
+  its credential expires, allowing the same clock skew that DataWireCredential.fromClaims
+  allows.
+
+  Safe to share between threads.
+  """
+
+  def __init__(self, maxSize=1024, skew=None):
+    self.maxSize = maxSize
+    self.skew = DataWireCredential.clockSkew if skew is None else skew
+
+    self.entries = collections.OrderedDict()
+    self.lock = threading.Lock()
+
+    self.hits = 0
+    self.misses = 0
+    self.expirations = 0
+    self.evictions = 0
+
+  def __len__(self):
+    return len(self.entries)
+
+  def get(self, token, orgID):
+    """ Returns the cached credential for (token, orgID), or None. """
+    key = (token, orgID)
+
+    with self.lock:
+      entry = self.entries.pop(key, None)
+
+      if entry is not None:
+        cred, expiresAt = entry
+
+        if (expiresAt is not None) and (int(time.time()) > expiresAt):
+          self.expirations += 1
+        else:
+          # Reinsert at the most-recently-used end.
+          self.entries[key] = entry
+          self.hits += 1
+          return cred
+
+      self.misses += 1
+      return None
+
+  def put(self, token, orgID, cred):
+    expiresAt = None
+
+    if cred.expiry is not None:
+      expiresAt = cred.expiry + self.skew
+
+    key = (token, orgID)
+
+    with self.lock:
+      self.entries.pop(key, None)
+      self.entries[key] = (cred, expiresAt)
+
+      while len(self.entries) > self.maxSize:
+        self.entries.popitem(last=False)
+        self.evictions += 1
+
+  def clear(self):
+    with self.lock:
+      self.entries.clear()
+
+  def stats(self):
+    return {
+      'size': len(self.entries),
+      'maxSize': self.maxSize,
+      'hits': self.hits,
+      'misses': self.misses,
+      'expirations': self.expirations,
+      'evictions': self.evictions
+    }
@@ -0,0 +1,230 @@
+#!python
+
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import time
+
+from jose.exceptions import JWSError, JWTClaimsError, ExpiredSignatureError
+
+from . import jsoncodec
+
+try:
+  stringTypes = basestring
+except NameError:
+  stringTypes = str
+
+def base64url_encode(data):
+  return base64.urlsafe_b64encode(data).replace(b'=', b'')
+
+def base64url_decode(data):
+  rem = len(data) % 4
+
+  if rem > 0:
+    data += b'=' * (4 - rem)
+
+  return base64.urlsafe_b64decode(data)
+
+class DataWireHS256 (object):
+  """
+  HS256-only JWT codec for DataWireCredential.
+
+  python-jose does a lot of generic work on every call: it rebuilds and re-encodes the
+  header, looks up the algorithm, re-prepares the key, and (for unverified tokens) parses
+  the token once per piece you ask for. We only ever use HS256 with one key at a time, so
+  this does the fixed parts once: the header segment is precomputed, the keyed HMAC is
+  built once and copied per token, and each token is split and decoded exactly once.
+
+  Output is byte-for-byte what jose.jwt.encode(claims, key, algorithm='HS256') produces,
+  and decode() applies the same checks as jose.jwt.decode() with the same error messages
+  (JWSError, JWTClaimsError, ExpiredSignatureError). The one difference: we check the
+  signature before parsing the claims, so a token that is both badly signed and badly
+  encoded reports the signature.
+
+  A codec built with a kid puts it in the header it signs with, as
+  jose.jwt.encode(..., headers={ 'kid': kid }) would.
+
+  Don't build these directly; use DataWireHS256.forKey(key) or forKey(key, kid).
+  """
+
+  # Same dict, same json.dumps call as jose, so the same bytes on any given Python.
+  header = { "typ": "JWT", "alg": "HS256" }
+  headerSegment = base64url_encode(json.dumps(header, separators=(',', ':')).encode('utf-8'))
+
+  codecs = {}
+  maxCodecs = 32
+
+  # Header segment -> decoded header for the headers we sign with, so split() needn't
+  # decode them. Only codecs add to this, not tokens, so junk tokens can't fill it.
+  knownHeaders = { headerSegment: header }
+  maxKnownHeaders = 64
+
+  def __init__(self, key, kid=None):
+    if not isinstance(key, bytes):
+      key = key.encode('utf-8')
+
+    self.key = key
+    self.kid = kid
+    self.mac = hmac.new(key, digestmod=hashlib.sha256)
+
+    if kid is not None:
+      header = dict(self.header)
+      header.update({ 'kid': kid })
+
+      self.headerSegment = base64url_encode(json.dumps(header, separators=(',', ':')).encode('utf-8'))
+
+      if len(self.knownHeaders) < self.maxKnownHeaders:
+        self.knownHeaders[self.headerSegment] = header
+
+  @classmethod
+  def forKey(klass, key, kid=None):
+    """ Returns the (shared) codec for key, signing with kid in the header if given. """
+    cacheKey = key if kid is None else (key, kid)
+    codec = klass.codecs.get(cacheKey, None)
+
+    if codec is None:
+      if len(klass.codecs) >= klass.maxCodecs:
+        klass.codecs.clear()
+
+      codec = DataWireHS256(key, kid=kid)
+      klass.codecs[cacheKey] = codec
+
+    return codec
+
+  def signature(self, signingInput):
+    mac = self.mac.copy()
+    mac.update(signingInput)
+
+    return mac.digest()
+
+  def withKID(self, kid):
+    """ This codec's key, signing with kid in the header instead. """
+    if kid == self.kid:
+      return self
+
+    return self.forKey(self.key, kid)
+
+  @classmethod
+  def claimsSegment(klass, claims):
+    return base64url_encode(jsoncodec.dumps(claims, separators=(',', ':')).encode('utf-8'))
+
+  def encode(self, claims):
+    signingInput = self.headerSegment + b'.' + self.claimsSegment(claims)
+
+    return (signingInput + b'.' + base64url_encode(self.signature(signingInput))).decode('utf-8')
+
+  @classmethod
+  def split(klass, token):
+    """
+    Split a token without verifying anything. Returns (header, claimsSegment,
+    signingInput, signature); hand claimsSegment to decodeSegment when you want it.
+    """
+
+    if not isinstance(token, bytes):
+      token = token.encode('utf-8')
+
+    try:
+      signingInput, cryptoSegment = token.rsplit(b'.', 1)
+      headerSegment, claimsSegment = signingInput.split(b'.', 1)
+    except ValueError:
+      raise JWSError('Not enough segments')
+
+    header = klass.knownHeaders.get(headerSegment, None)
+
+    if header is None:
+      header = klass.decodeSegment(headerSegment, 'header')
+    else:
+      header = dict(header)
+
+    try:
+      signature = base64url_decode(cryptoSegment)
+    except (TypeError, binascii.Error):
+      raise JWSError('Invalid crypto padding')
+
+    return header, claimsSegment, signingInput, signature
+
+  @classmethod
+  def decodeSegment(klass, segment, what):
+    try:
+      decoded = jsoncodec.loads(base64url_decode(segment).decode('utf-8'))
+    except (TypeError, binascii.Error):
+      raise JWSError('Invalid %s padding' % what)
+    except ValueError as e:
+      raise JWSError('Invalid %s string: %s' % (what, e))
+
+    if not isinstance(decoded, dict):
+      raise JWSError('Invalid %s string: must be a json object' % what)
+
+    return decoded
+
+  def decode(self, token, audience=None, issuer=None):
+    """ Verify token and return its claims, as jose.jwt.decode(token, key, algorithms='HS256', ...) """
+    return self.verify(self.split(token), audience=audience, issuer=issuer)
+
+  def verify(self, pieces, audience=None, issuer=None):
+    """ decode(), for a token already split(). """
+    header, claimsSegment, signingInput, signature = pieces
+
+    alg = header.get('alg')
+
+    if not alg:
+      raise JWSError('No algorithm was specified in the JWS header.')
+
+    if alg != 'HS256':
+      raise JWSError('The specified alg value is not allowed')
+
+    if not hmac.compare_digest(signature, self.signature(signingInput)):
+      raise JWSError('Signature verification failed.')
+
+    claims = self.decodeSegment(claimsSegment, 'payload')
+
+    self.checkClaims(claims, audience, issuer)
+
+    return claims
+
+  @classmethod
+  def checkClaims(klass, claims, audience, issuer):
+    # jose's checks, in jose's order.
+    now = int(time.time())
+
+    if 'iat' in claims:
+      klass.claimInt(claims, 'iat', 'Issued At claim (iat) must be an integer.')
+
+    if 'nbf' in claims:
+      if klass.claimInt(claims, 'nbf', 'Not Before claim (nbf) must be an integer.') > now:
+        raise JWTClaimsError('The token is not yet valid (nbf)')
+
+    if 'exp' in claims:
+      if klass.claimInt(claims, 'exp', 'Expiration Time claim (exp) must be an integer.') < now:
+        raise ExpiredSignatureError('Signature has expired.')
+
+    if 'aud' in claims:
+      audienceClaims = claims['aud']
+
+      if isinstance(audienceClaims, stringTypes):
+        audienceClaims = [ audienceClaims ]
+
+      if ((not isinstance(audienceClaims, list)) or
+          any(not isinstance(c, stringTypes) for c in audienceClaims)):
+        raise JWTClaimsError('Invalid claim format in token')
+
+      if audience not in audienceClaims:
+        raise JWTClaimsError('Invalid audience')
+
+    if (issuer is not None) and (claims.get('iss') != issuer):
+      raise JWTClaimsError('Invalid issuer')
+
+    if ('sub' in claims) and not isinstance(claims['sub'], stringTypes):
+      raise JWTClaimsError('Subject must be a string.')
+
+    if ('jti' in claims) and not isinstance(claims['jti'], stringTypes):
+      raise JWTClaimsError('JWT ID must be a string.')
+
+  @classmethod
+  def claimInt(klass, claims, key, error):
+    try:
+      return int(claims[key])
+    except (TypeError, ValueError):
+      raise JWTClaimsError(error)
@@ -0,0 +1,352 @@
+#!python
+
+import errno
+import os
+
+from . import jsoncodec
+from .state import DataWireState
+
+class JournalDict (dict):
+  """
+  A dict that tells its DataWireJournalState about every change, by path from the top
+  of the state. Dicts inside it become JournalDicts too, as they're looked up, so nested
+  changes like
+
+    dwState['orgs'][orgID]['service_tokens'][handle] = token
+
+  get journaled as well. (Changes made through some other reference to a dict after
+  it's stored -- or to a list -- aren't seen; assign the new value instead.)
+  """
+
+  def __init__(self, journal, path, values=()):
+    # Nested dicts are wrapped when they're first looked up, not here: walking every
+    # value of a big service_tokens just to find the dicts would double load time.
+    dict.__init__(self, values)
+
+    self.journal = journal
+    self.path = path
+
+  def __getitem__(self, key):
+    value = dict.__getitem__(self, key)
+
+    if type(value) is dict:
+      value = self.journal.track(self.path + [ key ], value)
+      dict.__setitem__(self, key, value)
+
+    return value
+
+  def get(self, key, default=None):
+    if key in self:
+      return self[key]
+
+    return default
+
+  def values(self):
+    return [ self[key] for key in self ]
+
+  def items(self):
+    return [ (key, self[key]) for key in self ]
+
+  def __setitem__(self, key, value):
+    path = self.path + [ key ]
+
+    # Adding a dict where there wasn't one is a merge, not a set: two processes that
+    # each add service_tokens to an org should get both sets of tokens, as with mergeState.
+    op = 'merge' if (isinstance(value, dict) and not dict.__contains__(self, key)) else 'set'
+
+    dict.__setitem__(self, key, self.journal.track(path, value))
+    self.journal.record(op, path, value)
+
+  def __delitem__(self, key):
+    dict.__delitem__(self, key)
+    self.journal.record('del', self.path + [ key ])
+
+  def setdefault(self, key, default=None):
+    if key not in self:
+      self[key] = default
+
+    return self[key]
+
+  def pop(self, key, *default):
+    present = key in self
+    value = dict.pop(self, key, *default)
+
+    if present:
+      self.journal.record('del', self.path + [ key ])
+
+    return value
+
+  def popitem(self):
+    key, value = dict.popitem(self)
+    self.journal.record('del', self.path + [ key ])
+
+    return key, value
+
+  def update(self, *args, **kwargs):
+    for key, value in dict(*args, **kwargs).items():
+      self[key] = value
+
+  def clear(self):
+    for key in list(self.keys()):
+      del(self[key])
+
+class DataWireJournalState (DataWireState):
+  """
+  DataWireState kept as a JSON snapshot (the usual datawire.json) plus an append-only
+  journal (datawire.json.journal) of changes since the snapshot, one JSON record per line:
+
+    ["set", ["orgs", "ORG1", "service_tokens", "svc"], "token"]
+    ["del", ["orgs", "ORG1", "service_tokens", "old"]]
+    ["merge", ["orgs", "ORG2"], {"email": "bob@example.com", ...}]
+
+("merge" is for a dict added where there wasn't one: it's merged into whatever dict is
+there by the time it's replayed, rather than replacing it.)
+
+  Loading replays the journal over the snapshot. save() appends just the changes made
+  since the last save, so it costs about the size of the change, not of the whole state.
+  Once the journal passes compactBytes, save() folds it into a fresh snapshot.
+
+  Multiple processes are fine: everything happens under the state lock, and save()
+  first replays whatever other processes journaled since we last looked, then our own
+  changes on top, so (as with mergeState) the last saver wins only where both changed
+  the same thing.
+  """
+
+  compactBytes = 256 * 1024
+
+  def __init__(self, statePath=None, compactBytes=None):
+    if compactBytes is not None:
+      self.compactBytes = compactBytes
+
+    self.recording = False
+    self.pending = []
+
+    super(DataWireJournalState, self).__init__(statePath)
+
+  @property
+  def journal_path(self):
+    return self.state_path + ".journal"
+
+  ### Change tracking
+  def track(self, path, value):
+    if isinstance(value, dict):
+      return JournalDict(self, path, value)
+
+    return value
+
+  def record(self, op, path, value=None):
+    if not self.recording:
+      return
+
+    entry = [ op, path ] if (op == 'del') else [ op, path, value ]
+
+    # Serialize now: the record has to say what the value was when it was set.
+    self.pending.append(jsoncodec.dumps(entry, sort_keys=True, separators=(',', ':')))
+    self.dirty = True
+
+  @classmethod
+  def apply(klass, state, entry):
+    """ Replay one journal entry onto state. Entries for paths that no longer exist are skipped. """
+    op, path = entry[0], entry[1]
+    parent = state
+
+    for key in path[:-1]:
+      child = parent.get(key, None)
+
+      if not isinstance(child, dict):
+        if op == 'del':
+          return
+
+        parent[key] = {}
+        child = parent[key]
+
+      parent = child
+
+    key = path[-1]
+
+    if op == 'del':
+      parent.pop(key, None)
+    elif (op == 'merge') and isinstance(parent.get(key, None), dict):
+      klass.merge(parent[key], entry[2])
+    else:
+      parent[key] = entry[2]
+
+  @classmethod
+  def merge(klass, target, value):
+    for key, item in value.items():
+      current = target.get(key, None)
+
+      if isinstance(current, dict) and isinstance(item, dict):
+        klass.merge(current, item)
+      else:
+        target[key] = item
+
+  def replay(self, entries):
+    """ Apply entries to self.state without journaling them again. """
+    recording = self.recording
+    self.recording = False
+
+    try:
+      for entry in entries:
+        self.apply(self.state, entry)
+    finally:
+      self.recording = recording
+
+  ### Reading
+  def snapshotStat(self):
+    try:
+      st = os.stat(self.state_path)
+    except OSError as exception:
+      if exception.errno != errno.ENOENT:
+        raise
+
+      return None
+
+    return (st.st_ino, st.st_mtime, st.st_size)
+
+  def readJournal(self, offset):
+    """
+    Returns (entries, newOffset) for the whole records in the journal past offset. A
+    partial last line (a writer died mid-append) is left alone and not counted.
+    """
+
+    try:
+      with open(self.journal_path, "rb") as inFile:
+        inFile.seek(offset)
+        data = inFile.read()
+    except IOError as exception:
+      if exception.errno != errno.ENOENT:
+        self.warn("read", self.journal_path, exception)
+
+      return [], offset
+
+    end = data.rfind(b'\n') + 1
+    entries = []
+
+    for line in data[:end].splitlines():
+      try:
+        entries.append(jsoncodec.loads(line.decode('utf-8')))
+      except ValueError as exception:
+        self.warn("replay", self.journal_path, exception)
+
+    return entries, offset + end
+
+  def reload(self):
+    """
+    Throw away in-memory state, and reread the snapshot and replay the journal.
+
+    Reading doesn't take the lock. The snapshot is only ever replaced whole, and the
+    journal only grows until a compaction replaces the snapshot, so if the snapshot is
+    the same after reading the journal as it was before, what we read hangs together.
+    If a compaction got in the way, read again under a shared lock.
+    """
+
+    if self.lockDepth or not self.readFiles():
+      with self.locked(shared=True):
+        self.readFiles()
+
+    self.pending = []
+    self.recording = True
+    self.dirty = False
+
+  def readFiles(self):
+    """ Load the snapshot and replay the journal; False if the snapshot changed meanwhile. """
+    self.stat = self.snapshotStat()
+    state = self.parse(self.readJSON())
+
+    self.recording = False
+    self.state = JournalDict(self, [], state)
+
+    entries, self.journalOffset = self.readJournal(0)
+    self.replay(entries)
+
+    return self.snapshotStat() == self.stat
+
+  ### Writing
+  def catchUp(self):
+    """ Bring self.state up to date with the files, keeping our pending changes on top. Lock held. """
+    pending = self.pending
+    stat = self.snapshotStat()
+
+    try:
+      journalSize = os.path.getsize(self.journal_path)
+    except OSError:
+      journalSize = 0
+
+    if (stat != self.stat) or (journalSize < self.journalOffset):
+      # Someone compacted (or rewrote the snapshot): start over from the files.
+      self.reload()
+    else:
+      entries, self.journalOffset = self.readJournal(self.journalOffset)
+      self.replay(entries)
+
+    self.pending = pending
+    self.replay(jsoncodec.loads(line) for line in pending)
+
+  def save(self):
+    try:
+      self.makeStateDir()
+    except OSError as exception:
+      self.warn("create", self.state_dir, exception)
+      return
+
+    try:
+      with self.locked():
+        self.catchUp()
+
+        if self.pending:
+          data = ''.join(line + '\n' for line in self.pending).encode('utf-8')
+
+          with open(self.journal_path, "ab") as outFile:
+            # Drop any torn record left by a writer that died mid-append.
+            outFile.truncate(self.journalOffset)
+
+            outFile.write(data)
+            outFile.flush()
+            os.fsync(outFile.fileno())
+
+          self.journalOffset += len(data)
+          self.pending = []
+
+        if self.journalOffset > self.compactBytes:
+          self.compact()
+
+        self.dirty = False
+    except (IOError, OSError) as exception:
+      self.warn("save state to", self.state_path, exception)
+
+  def compact(self):
+    """
+    Fold the journal into a new snapshot and empty the journal. Call with the lock held
+    and self.state up to date (see catchUp).
+
+    If we die between the two steps, the next load replays the old journal over the new
+    snapshot, which comes out the same.
+    """
+
+    self.writeState(self.toJSON())
+    self.stat = self.snapshotStat()
+
+    with open(self.journal_path, "ab") as outFile:
+      outFile.truncate(0)
+      os.fsync(outFile.fileno())
+
+    self.journalOffset = 0
+
+  def smite(self):
+    """ USE WITH CARE """
+    with self.locked():
+      for path in [ self.state_path, self.journal_path ]:
+        try:
+          os.remove(path)
+        except OSError as exception:
+          if exception.errno != errno.ENOENT:
+            raise
+
+    self.recording = False
+    self.state = JournalDict(self, [])
+    self.stat = None
+    self.journalOffset = 0
+    self.pending = []
+    self.recording = True
+    self.dirty = True
@@ -0,0 +1,240 @@
+#!python
+
+"""
+JSON encoding and decoding for the rest of datawire: results, credentials, state files
+and Identity Service responses all go through loads() and dumps() here.
+
+If a faster JSON library is installed (orjson, ujson, simplejson), we use it -- but only
+where it gives exactly what the stdlib json module would: the same text out of dumps()
+for the same arguments (byte for byte, since tokens are signed and state files diffed),
+and the same objects, down to str vs unicode, out of loads(). Each library is checked
+against json on a set of probes the first time it's needed, and anything it can't handle
+at runtime (NaN, huge ints, odd keys) falls back to json.
+
+The environment variable DATAWIRE_JSON, or useLibraries(), limits which libraries we'll
+consider, e.g. DATAWIRE_JSON=json for just the stdlib.
+"""
+
+import sys
+
+import json
+import os
+
+# In order of preference. Which of them can do what is sorted out by DataWireJSON.
+LIBRARIES = ( 'orjson', 'ujson', 'simplejson' )
+
+# Things the fast libraries have been known to get subtly different from json.
+_probes = [
+  {},
+  [],
+  { 'x': {}, 'y': [], 'z': [ {} ] },
+  { 'ok': True, 'error': None, 'count': 3, 'ratio': 0.1, 'big': 1e16, 'neg': -0.0, 'one': 1.0 },
+  { 'text': 'line\nbreak\ttab\x01"quote"\\back/slash', u'key\u00e9': u'caf\u00e9 \u2603 \U0001f600' },
+  { 'orgs': { 'ORG': { 'email': 'alice@example.com', 'service_tokens': { 'b': 'tb', 'a': 'ta' } } } },
+  [ 1, 2.5, None, True, False, 12345678901234, 'x' ],
+  # Exponents (json writes 1e-05, not 1e-5) and DEL, which json escapes as \u007f.
+  [ 1e-05, 2.5e-08, 1.5e+300, 0.1 + 0.2, 5e-324, u'\x7f', u'\x1f\u2028' ],
+]
+
+_dumpArgs = [
+  {},
+  { 'separators': (',', ':') },
+  { 'separators': (',', ':'), 'sort_keys': True },
+  { 'indent': 4, 'separators': (',', ':'), 'sort_keys': True },
+]
+
+def _sameValue(a, b):
+  """ Equal, and of the same types all the way down (so u'x' and 'x' differ on Python 2). """
+  if type(a) != type(b):
+    return False
+
+  if isinstance(a, dict):
+    return (sorted(a.keys()) == sorted(b.keys())) and all(_sameValue(a[k], b[k]) for k in a)
+
+  if isinstance(a, list):
+    return (len(a) == len(b)) and all(_sameValue(x, y) for x, y in zip(a, b))
+
+  return a == b
+
+def _stdlibDumps(obj, sort_keys=False, indent=None, separators=None):
+  return json.dumps(obj, sort_keys=sort_keys, indent=indent, separators=separators)
+
+def _ujsonDumps(ujson):
+  def dumps(obj, sort_keys=False, indent=None, separators=None):
+    if separators is None:
+      if indent is not None:
+        # json's default here differs between Python 2 and 3; not worth matching.
+        return _stdlibDumps(obj, sort_keys=sort_keys, indent=indent)
+
+      separators = (', ', ': ')
+
+    return ujson.dumps(obj, ensure_ascii=True, escape_forward_slashes=False, sort_keys=sort_keys,
+                       indent=indent or 0, separators=separators)
+
+  return dumps
+
+def _simplejsonDumps(simplejson):
+  def dumps(obj, sort_keys=False, indent=None, separators=None):
+    return simplejson.dumps(obj, sort_keys=sort_keys, indent=indent, separators=separators)
+
+  return dumps
+
+class DataWireJSON (object):
+  """
+  Picks, from whatever's installed, the fastest loads and dumps that match the stdlib
+  json module's output. dumps is chosen separately for flat and indented output, since
+  e.g. Python 2's json only has a C encoder for the flat case.
+
+  Each choice is made the first time it's needed, so e.g. a dwc run that only reads
+  state never imports the libraries that only help with writing it.
+  """
+
+  def __init__(self, libraries=LIBRARIES):
+    self.libraries = [ name for name in libraries if name in LIBRARIES ]
+    self.chosen = {}
+
+  def choose(self, which):
+    """ which is 'loads', 'dumps' or 'indented dumps'. Returns (name, function) or None. """
+    if which in self.chosen:
+      return self.chosen[which]
+
+    choice = None
+
+    for name in self.libraries:
+      candidate = self.candidate(name, which)
+
+      if candidate is None:
+        continue
+
+      if which == 'loads':
+        ok = self.checkLoader(candidate)
+      else:
+        ok = self.checkDumper(candidate, [ kwargs for kwargs in _dumpArgs
+                                           if ('indent' in kwargs) == (which == 'indented dumps') ])
+
+      if ok:
+        choice = (name, candidate)
+        break
+
+    self.chosen[which] = choice
+
+    return choice
+
+  @classmethod
+  def candidate(klass, name, which):
+    # orjson can't do ensure_ascii or separators, so it only decodes. simplejson.loads
+    # gives str, not unicode, for ASCII strings on Python 2, and its flat dumps is slower
+    # than json's -- but its indented dumps is in C, where Python 2's json does that in
+    # pure Python.
+    if (which == 'loads') and (name not in ('orjson', 'ujson')):
+      return None
+
+    if (which == 'dumps') and (name != 'ujson'):
+      return None
+
+    if (which == 'indented dumps') and (name not in ('ujson', 'simplejson')):
+      return None
+
+    module = klass.importLibrary(name)
+
+    if module is None:
+      return None
+
+    if which == 'loads':
+      return module.loads
+
+    return _ujsonDumps(module) if (name == 'ujson') else _simplejsonDumps(module)
+
+  @classmethod
+  def importLibrary(klass, name):
+    try:
+      return __import__(name)
+    except ImportError:
+      return None
+
+  @classmethod
+  def checkLoader(klass, loader):
+    try:
+      for probe in _probes:
+        text = json.dumps(probe)
+
+        if not _sameValue(loader(text), json.loads(text)):
+          return False
+
+      return True
+    except Exception:
+      return False
+
+  @classmethod
+  def checkDumper(klass, dumper, argSets):
+    try:
+      for kwargs in argSets:
+        for probe in _probes:
+          if dumper(probe, **kwargs) != json.dumps(probe, **kwargs):
+            return False
+
+      return True
+    except Exception:
+      return False
+
+  def loads(self, text):
+    loader = self.chosen['loads'] if ('loads' in self.chosen) else self.choose('loads')
+
+    if loader is not None:
+      try:
+        return loader[1](text)
+      except (ValueError, TypeError, OverflowError):
+        # Bad JSON, or something json takes that the library won't (NaN, huge ints):
+        # either way, json gets the final say, and the error message.
+        pass
+
+    if isinstance(text, bytes) and (sys.version_info < (3, 6)) and (sys.version_info >= (3, 0)):
+      text = text.decode('utf-8')
+
+    return json.loads(text)
+
+  def dumps(self, obj, sort_keys=False, indent=None, separators=None):
+    which = 'dumps' if (indent is None) else 'indented dumps'
+    dumper = self.chosen[which] if (which in self.chosen) else self.choose(which)
+
+    if dumper is not None:
+      try:
+        return dumper[1](obj, sort_keys=sort_keys, indent=indent, separators=separators)
+      except (ValueError, TypeError, OverflowError):
+        pass
+
+    return _stdlibDumps(obj, sort_keys=sort_keys, indent=indent, separators=separators)
+
+  def describe(self):
+    return ", ".join("%s: %s" % (which, (self.choose(which) or ('json',))[0])
+                     for which in ('loads', 'dumps', 'indented dumps'))
+
+_codec = None
+
+def codec():
+  """ The DataWireJSON in use, set up on first use. """
+  global _codec
+
+  if _codec is None:
+    libraries = os.environ.get('DATAWIRE_JSON', None)
+
+    if libraries is None:
+      _codec = DataWireJSON()
+    else:
+      _codec = DataWireJSON([ name.strip() for name in libraries.split(',') if name.strip() ])
+
+  return _codec
+
+def useLibraries(*names):
+  """ useLibraries('ujson'), useLibraries('json') (stdlib only), useLibraries() for the default. """
+  global _codec
+
+  _codec = DataWireJSON(names or LIBRARIES)
+
+  return _codec
+
+def loads(text):
+  return codec().loads(text)
+
+def dumps(obj, sort_keys=False, indent=None, separators=None):
+  return codec().dumps(obj, sort_keys=sort_keys, indent=indent, separators=separators)
@@ -0,0 +1,298 @@
+#!python
+
+import bisect
+import collections
+import contextlib
+import threading
+import time
+
+class DataWireHistogram (object):
+  """
+  Bucketed histogram: counts[i] is the number of observations <= buckets[i] and
+  > buckets[i-1]; the last count is everything bigger. (prometheus() makes them cumulative.)
+  """
+
+  __slots__ = ('buckets', 'counts', 'count', 'sum')
+
+  def __init__(self, buckets):
+    self.buckets = buckets
+    self.counts = [ 0 ] * (len(buckets) + 1)
+    self.count = 0
+    self.sum = 0.0
+
+  def observe(self, value):
+    self.counts[bisect.bisect_left(self.buckets, value)] += 1
+    self.count += 1
+    self.sum += value
+
+  def merge(self, other):
+    """ Add other's observations (with the same buckets) to ours. """
+    self.counts = [ mine + theirs for mine, theirs in zip(self.counts, other.counts) ]
+    self.count += other.count
+    self.sum += other.sum
+
+  def quantile(self, q):
+    """
+    Approximate q-quantile: the upper bound of the bucket it falls in (the largest bucket
+    bound if it's past them all), or None if nothing has been observed.
+    """
+
+    if not self.count:
+      return None
+
+    wanted = q * self.count
+    seen = 0
+
+    for i, count in enumerate(self.counts):
+      seen += count
+
+      if seen >= wanted:
+        break
+
+    return self.buckets[min(i, len(self.buckets) - 1)]
+
+  def toDict(self):
+    return { 'buckets': list(self.buckets), 'counts': list(self.counts),
+             'count': self.count, 'sum': self.sum }
+
+class DataWireMetrics (object):
+  """
+  Counters and histograms for an Identity client, keyed by metric name and a tuple of
+  label values. Safe to share between threads (and between Identity instances).
+
+  What Identity records, with its labels:
+
+  request_seconds (histogram; method, endpoint) - time for each HTTP request
+  response_bytes (histogram; method, endpoint) - size of each response body
+  responses_total (counter; method, endpoint, status) - HTTP status codes
+  failures_total (counter; method, endpoint, reason) - requests that didn't give a good
+    DataWireResult: 'timeout', 'no result', 'not ok', or 'missing elements'
+  verifications_total (counter; result) - local token verification: 'verified',
+    'cached', or 'invalid'
+  verify_seconds (histogram) - time to verify a token that wasn't cached
+  policy_checks_total (counter; policy, result) - scope policy checks: 'ok' or 'denied'
+
+  endpoint is the URL path with everything past the first two elements replaced by '*',
+  so that IDs and email addresses don't each get their own series. The most recent
+  failure messages are kept in recentErrors, since they're too varied to be labels.
+
+  phase() times named stretches of work for a caller like dwc --timings.
+  """
+
+  prefix = 'datawire_identity_'
+
+  latencyBuckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+  sizeBuckets = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+  help = {
+    'request_seconds': ('histogram', 'Identity Service request latency in seconds.'),
+    'response_bytes': ('histogram', 'Identity Service response body size in bytes.'),
+    'responses_total': ('counter', 'Identity Service responses by HTTP status.'),
+    'failures_total': ('counter', 'Identity Service requests that failed, by reason.'),
+    'verifications_total': ('counter', 'Local token verifications, by result.'),
+    'verify_seconds': ('histogram', 'Local token verification time in seconds.'),
+    'policy_checks_total': ('counter', 'Scope policy checks, by policy and result.'),
+  }
+
+  labelNames = {
+    'request_seconds': ('method', 'endpoint'),
+    'response_bytes': ('method', 'endpoint'),
+    'responses_total': ('method', 'endpoint', 'status'),
+    'failures_total': ('method', 'endpoint', 'reason'),
+    'verifications_total': ('result',),
+    'verify_seconds': (),
+    'policy_checks_total': ('policy', 'result'),
+  }
+
+  def __init__(self, recentErrors=32):
+    self.lock = threading.Lock()
+
+    # name -> { labels: count or DataWireHistogram }
+    self.counters = collections.defaultdict(dict)
+    self.histograms = collections.defaultdict(dict)
+
+    # name -> [ calls, seconds ], in the order first seen.
+    self.phases = collections.OrderedDict()
+
+    self.recentErrors = collections.deque(maxlen=recentErrors)
+
+  @classmethod
+  def endpointFor(klass, target):
+    """ The endpoint label for a target as given to Identity.makeURL. """
+    return '/' + '/'.join(list(target[:2]) + ([ '*' ] * (len(target) - 2)))
+
+  def count(self, name, labels, n=1):
+    with self.lock:
+      series = self.counters[name]
+      series[labels] = series.get(labels, 0) + n
+
+  def observe(self, name, labels, value, buckets=None):
+    with self.lock:
+      series = self.histograms[name]
+      histogram = series.get(labels, None)
+
+      if histogram is None:
+        histogram = DataWireHistogram(buckets or self.latencyBuckets)
+        series[labels] = histogram
+
+      histogram.observe(value)
+
+  # What Identity calls.
+
+  def recordResponse(self, method, endpoint, status, seconds, size):
+    labels = (method, endpoint)
+
+    with self.lock:
+      for name, value, buckets in [ ('request_seconds', seconds, self.latencyBuckets),
+                                    ('response_bytes', size, self.sizeBuckets) ]:
+        series = self.histograms[name]
+        histogram = series.get(labels, None)
+
+        if histogram is None:
+          histogram = DataWireHistogram(buckets)
+          series[labels] = histogram
+
+        histogram.observe(value)
+
+      series = self.counters['responses_total']
+      key = (method, endpoint, str(status))
+      series[key] = series.get(key, 0) + 1
+
+  def recordFailure(self, method, endpoint, reason, error):
+    self.count('failures_total', (method, endpoint, reason))
+    self.recentErrors.append((time.time(), method, endpoint, reason, error))
+
+  def recordVerification(self, result, seconds=None):
+    with self.lock:
+      series = self.counters['verifications_total']
+      series[(result,)] = series.get((result,), 0) + 1
+
+      if seconds is not None:
+        series = self.histograms['verify_seconds']
+        histogram = series.get((), None)
+
+        if histogram is None:
+          histogram = DataWireHistogram(self.latencyBuckets)
+          series[()] = histogram
+
+        histogram.observe(seconds)
+
+  def recordPolicyCheck(self, policy, ok):
+    self.count('policy_checks_total', (policy.name or 'ad hoc', 'ok' if ok else 'denied'))
+
+  @contextlib.contextmanager
+  def phase(self, name):
+    """ Add the time spent in the with block to the phase called name. """
+    start = time.time()
+
+    try:
+      yield
+    finally:
+      elapsed = time.time() - start
+
+      with self.lock:
+        totals = self.phases.setdefault(name, [ 0, 0.0 ])
+        totals[0] += 1
+        totals[1] += elapsed
+
+  # Reading it all back.
+
+  def counter(self, name, labels):
+    with self.lock:
+      return self.counters[name].get(labels, 0)
+
+  def histogram(self, name, labels):
+    """ A copy of the histogram for name and labels, or None. """
+    with self.lock:
+      histogram = self.histograms[name].get(labels, None)
+
+      if histogram is None:
+        return None
+
+      copy = DataWireHistogram(histogram.buckets)
+      copy.counts = list(histogram.counts)
+      copy.count = histogram.count
+      copy.sum = histogram.sum
+
+      return copy
+
+  def snapshot(self):
+    """
+    Everything, as plain data: { 'counters': { name: [ (labels, count), ... ] },
+    'histograms': { name: [ (labels, histogram dict), ... ] }, 'phases': ...,
+    'recentErrors': ... }. Labels are dicts of label name -> value.
+    """
+
+    with self.lock:
+      return {
+        'counters': dict((name, [ (self.labelDict(name, labels), count)
+                                  for labels, count in sorted(series.items()) ])
+                         for name, series in self.counters.items()),
+        'histograms': dict((name, [ (self.labelDict(name, labels), histogram.toDict())
+                                    for labels, histogram in sorted(series.items()) ])
+                           for name, series in self.histograms.items()),
+        'phases': [ (name, calls, seconds) for name, (calls, seconds) in self.phases.items() ],
+        'recentErrors': list(self.recentErrors),
+      }
+
+  def labelDict(self, name, labels):
+    return dict(zip(self.labelNames.get(name, ()), labels))
+
+  def totalSeconds(self, name):
+    """ Summed time over every series of the histogram called name. """
+    with self.lock:
+      return sum(histogram.sum for histogram in self.histograms[name].values())
+
+  def totalCount(self, name):
+    """ Summed observations over every series of the histogram or counter called name. """
+    with self.lock:
+      if name in self.histograms:
+        return sum(histogram.count for histogram in self.histograms[name].values())
+
+      return sum(self.counters[name].values())
+
+  def prometheus(self):
+    """ Everything, in the Prometheus text exposition format (version 0.0.4). """
+    lines = []
+
+    with self.lock:
+      for name in sorted(set(self.counters) | set(self.histograms)):
+        kind, helpText = self.help.get(name, ('untyped', name))
+        fullName = self.prefix + name
+        labelNames = self.labelNames.get(name, ())
+
+        lines.append('# HELP %s %s' % (fullName, helpText))
+        lines.append('# TYPE %s %s' % (fullName, kind))
+
+        for labels, count in sorted(self.counters.get(name, {}).items()):
+          lines.append('%s%s %d' % (fullName, self.labelText(labelNames, labels), count))
+
+        for labels, histogram in sorted(self.histograms.get(name, {}).items()):
+          cumulative = 0
+
+          for bound, count in zip(list(histogram.buckets) + [ None ], histogram.counts):
+            cumulative += count
+            le = '+Inf' if bound is None else repr(float(bound))
+
+            lines.append('%s_bucket%s %d' % (fullName, self.labelText(labelNames, labels, le),
+                                              cumulative))
+
+          lines.append('%s_sum%s %r' % (fullName, self.labelText(labelNames, labels),
+                                        float(histogram.sum)))
+          lines.append('%s_count%s %d' % (fullName, self.labelText(labelNames, labels),
+                                          histogram.count))
+
+    return '\n'.join(lines) + '\n'
+
+  @classmethod
+  def labelText(klass, labelNames, labels, le=None):
+    pairs = [ '%s="%s"' % (name, klass.escape(value)) for name, value in zip(labelNames, labels) ]
+
+    if le is not None:
+      pairs.append('le="%s"' % le)
+
+    return ('{%s}' % ','.join(pairs)) if pairs else ''
+
+  @staticmethod
+  def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
@@ -0,0 +1,70 @@
+#!python
+
+from . import DataWireCredential
+
+class DataWireScopePolicy (object):
+  """
+  A scope check compiled once for reuse: a credential passes if it has every scope in
+  scopesMust and none of the scopes in scopesMustNot.
+
+  The scopes DataWireCredential knows about become bitmasks to test against the
+  credential's scopeMask, so the usual check is two ANDs. Any other scopes are checked
+  against the credential's scopeExtra set. The scope lists are only walked again to build
+  the error message when a check fails.
+  """
+
+  __slots__ = ( 'name', 'scopesMust', 'scopesMustNot',
+                'mustMask', 'mustExtra', 'mustNotMask', 'mustNotExtra' )
+
+  def __init__(self, scopesMust, scopesMustNot, name=None):
+    self.name = name
+    self.scopesMust = tuple(scopesMust)
+    self.scopesMustNot = tuple(scopesMustNot)
+
+    self.mustMask, self.mustExtra = self.compile(self.scopesMust)
+    self.mustNotMask, self.mustNotExtra = self.compile(self.scopesMustNot)
+
+  @staticmethod
+  def compile(scopes):
+    """ Returns (mask, extra) for scopes: the bits of the known scopes, and a set of the rest. """
+    mask = 0
+    extra = set()
+
+    for scope in scopes:
+      bit = DataWireCredential.scopeBits.get(scope, 0)
+
+      if bit:
+        mask |= bit
+      else:
+        extra.add(scope)
+
+    return mask, frozenset(extra)
+
+  def __getstate__(self):
+    return tuple(getattr(self, slot) for slot in self.__slots__)
+
+  def __setstate__(self, state):
+    for slot, value in zip(self.__slots__, state):
+      setattr(self, slot, value)
+
+  def __repr__(self):
+    return "<DWScopePolicy %s: +%s -%s>" % (self.name, ",".join(self.scopesMust),
+                                            ",".join(self.scopesMustNot))
+
+  def check(self, cred):
+    """ Returns None if cred passes, else an error message naming the offending scopes. """
+    held = cred.scopeMask
+
+    if (((held & self.mustMask) != self.mustMask) or
+        (self.mustExtra and not (self.mustExtra <= cred.scopeExtra))):
+      missingScopes = [ scope for scope in self.scopesMust if not cred.hasScope(scope) ]
+
+      return 'credential is missing scopes: %s' % " ".join(missingScopes)
+
+    if ((held & self.mustNotMask) or
+        (self.mustNotExtra and not self.mustNotExtra.isdisjoint(cred.scopeExtra))):
+      wrongScopes = [ scope for scope in self.scopesMustNot if cred.hasScope(scope) ]
+
+      return 'credential must not have scopes: %s' % " ".join(wrongScopes)
+
+    return None
@@ -0,0 +1,127 @@
+#!python
+
+import sys
+
+# cProfile, pstats and tracemalloc are imported only when profiling is actually asked for.
+
+class DataWireProfile (object):
+  """
+  A CPU profile (cProfile) of some stretch of code, plus, optionally, what it allocated
+  (tracemalloc, Python 3.4+ only). Use it as a context manager, which reports when the
+  with block is done (see profiled() below), or start() and stop() it yourself, then
+  report().
+
+  path - if given, stop() saves the raw profile there, for pstats, snakeviz, etc.
+  memory - if True, also trace memory allocations
+  top - how many entries each section of the report gets
+  stream - where the context manager writes the report (default stderr)
+  """
+
+  def __init__(self, path=None, memory=False, top=25, stream=None):
+    self.path = path
+    self.memory = memory
+    self.top = top
+    self.stream = stream
+
+    self.profiler = None
+    self.stats = None
+    self.snapshot = None
+    self.peakMemory = None
+    self.memoryError = None
+
+  def __enter__(self):
+    self.start()
+    return self
+
+  def __exit__(self, excType, excValue, traceback):
+    self.stop()
+    self.report(self.stream)
+
+  def start(self):
+    import cProfile
+
+    if self.memory:
+      try:
+        import tracemalloc
+      except ImportError:
+        self.memoryError = 'tracemalloc needs Python 3.4 or later'
+      else:
+        if not tracemalloc.is_tracing():
+          tracemalloc.start(8)
+
+    self.profiler = cProfile.Profile()
+    self.profiler.enable()
+
+  def stop(self):
+    self.profiler.disable()
+
+    import pstats
+
+    if self.memory and not self.memoryError:
+      import tracemalloc
+
+      self.snapshot = tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+      ])
+      self.peakMemory = tracemalloc.get_traced_memory()[1]
+      tracemalloc.stop()
+
+    if self.path:
+      self.profiler.dump_stats(self.path)
+
+    self.stats = pstats.Stats(self.profiler)
+
+  def hotPaths(self, sortBy='cumulative'):
+    """
+    The top entries of the profile, sorted by sortBy ('cumulative' or 'tottime'), as
+    (where, calls, tottime, cumtime) tuples; where is 'file:line(function)'.
+    """
+
+    rows = []
+
+    for (filename, line, function), (primitive, calls, tottime, cumtime, callers) in self.stats.stats.items():
+      rows.append(('%s:%d(%s)' % (filename, line, function), calls, tottime, cumtime))
+
+    column = 3 if (sortBy == 'cumulative') else 2
+    rows.sort(key=lambda row: row[column], reverse=True)
+
+    return rows[:self.top]
+
+  def report(self, stream=None):
+    """ Write a ranked report of the hot paths (and allocations, if traced) to stream. """
+    if stream is None:
+      stream = sys.stderr
+
+    stream.write("profile: %d calls, %.3f s total\n" % (self.stats.total_calls, self.stats.total_tt))
+
+    if self.path:
+      stream.write("  (raw profile saved to %s)\n" % self.path)
+
+    for sortBy, title in [ ('cumulative', 'including callees'), ('tottime', 'own time only') ]:
+      stream.write("\ntop %d by %s:\n" % (self.top, title))
+      stream.write("  %10s %10s %10s  %s\n" % ('calls', 'own s', 'cum s', 'where'))
+
+      for where, calls, tottime, cumtime in self.hotPaths(sortBy):
+        stream.write("  %10d %10.4f %10.4f  %s\n" % (calls, tottime, cumtime, where))
+
+    if self.memoryError:
+      stream.write("\nmemory: not traced: %s\n" % self.memoryError)
+    elif self.snapshot is not None:
+      stream.write("\nmemory: peak %.1f KiB; top %d live allocations by line:\n" %
+                   (self.peakMemory / 1024.0, self.top))
+
+      for stat in self.snapshot.statistics('lineno')[:self.top]:
+        frame = stat.traceback[0]
+        stream.write("  %10.1f KiB %8d blocks  %s:%d\n" % (stat.size / 1024.0, stat.count,
+                                                          frame.filename, frame.lineno))
+
+def profiled(path=None, memory=False, top=25, stream=None):
+  """
+  Profile the body of the with block, then write the report to stream (default
+  stderr). See DataWireProfile for the other arguments.
+
+    with profiled('out.prof', memory=True):
+      ...
+  """
+
+  return DataWireProfile(path=path, memory=memory, top=top, stream=stream)
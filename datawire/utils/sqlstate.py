@@ -0,0 +1,455 @@
+#!python
+
+import errno
+import os
+import sqlite3
+
+from . import jsoncodec
+from .state import DataWireState
+
+class SQLiteServiceTokens (object):
+  """
+  One org's service tokens, read from the database a handle at a time. Changes are
+  staged in memory until DataWireSQLiteState.save().
+  """
+
+  def __init__(self, db, orgID):
+    self.db = db
+    self.orgID = orgID
+    self.cache = {}
+    self.changed = {}     # handle -> token, or None if deleted
+
+  def __getitem__(self, handle):
+    if handle in self.changed:
+      token = self.changed[handle]
+
+      if token is None:
+        raise KeyError(handle)
+
+      return token
+
+    if handle not in self.cache:
+      row = self.db.execute("SELECT token FROM service_tokens WHERE orgID = ? AND handle = ?",
+                            (self.orgID, handle)).fetchone()
+
+      if row is None:
+        raise KeyError(handle)
+
+      self.cache[handle] = row[0]
+
+    return self.cache[handle]
+
+  def __setitem__(self, handle, token):
+    self.changed[handle] = token
+
+  def __delitem__(self, handle):
+    if handle not in self:
+      raise KeyError(handle)
+
+    self.changed[handle] = None
+
+  def __contains__(self, handle):
+    try:
+      self[handle]
+      return True
+    except KeyError:
+      return False
+
+  def get(self, handle, default=None):
+    try:
+      return self[handle]
+    except KeyError:
+      return default
+
+  def toDict(self):
+    """ Everything, in one query. """
+    tokens = dict(self.db.execute("SELECT handle, token FROM service_tokens WHERE orgID = ?",
+                                  (self.orgID,)))
+
+    for handle, token in self.changed.items():
+      if token is None:
+        tokens.pop(handle, None)
+      else:
+        tokens[handle] = token
+
+    return tokens
+
+  def keys(self):
+    return self.toDict().keys()
+
+  def items(self):
+    return self.toDict().items()
+
+  def __iter__(self):
+    return iter(self.keys())
+
+  def __len__(self):
+    return len(self.toDict())
+
+  def flush(self):
+    """ Write staged changes. Call inside a transaction. """
+    for handle, token in self.changed.items():
+      if token is None:
+        self.db.execute("DELETE FROM service_tokens WHERE orgID = ? AND handle = ?",
+                        (self.orgID, handle))
+        self.cache.pop(handle, None)
+      else:
+        self.db.execute("INSERT OR REPLACE INTO service_tokens (orgID, handle, token) VALUES (?, ?, ?)",
+                        (self.orgID, handle, token))
+        self.cache[handle] = token
+
+    self.changed = {}
+
+class SQLiteOrgs (object):
+  """
+  The 'orgs' element of a DataWireSQLiteState. Each org is a plain dict, read only
+  when someone asks for it; its 'service_tokens', if it has any, is a SQLiteServiceTokens.
+  """
+
+  def __init__(self, dwState):
+    self.dwState = dwState
+    self.reset()
+
+  @property
+  def db(self):
+    return self.dwState.connect()
+
+  def reset(self):
+    self.cache = {}         # orgID -> org dict
+    self.snapshots = {}     # orgID -> info JSON as last read or written
+    self.replaced = set()   # orgs assigned wholesale since the last save
+    self.deleted = set()
+    self.cleared = False    # the whole 'orgs' element was replaced
+
+  def __getitem__(self, orgID):
+    if orgID in self.cache:
+      return self.cache[orgID]
+
+    row = None
+
+    if (orgID not in self.deleted) and not self.cleared:
+      row = self.db.execute("SELECT info FROM orgs WHERE orgID = ?", (orgID,)).fetchone()
+
+    if row is None:
+      raise KeyError(orgID)
+
+    org = jsoncodec.loads(row[0])
+
+    hasTokens = self.db.execute("SELECT 1 FROM service_tokens WHERE orgID = ? LIMIT 1",
+                                (orgID,)).fetchone()
+
+    if hasTokens:
+      org['service_tokens'] = SQLiteServiceTokens(self.db, orgID)
+
+    self.cache[orgID] = org
+    self.snapshots[orgID] = row[0]
+
+    return org
+
+  def __setitem__(self, orgID, org):
+    self.cache[orgID] = org
+    self.replaced.add(orgID)
+    self.deleted.discard(orgID)
+
+  def __delitem__(self, orgID):
+    if orgID not in self:
+      raise KeyError(orgID)
+
+    self.cache.pop(orgID, None)
+    self.replaced.discard(orgID)
+    self.deleted.add(orgID)
+
+  def __contains__(self, orgID):
+    try:
+      self[orgID]
+      return True
+    except KeyError:
+      return False
+
+  def get(self, orgID, default=None):
+    try:
+      return self[orgID]
+    except KeyError:
+      return default
+
+  def replaceAll(self, orgs):
+    self.reset()
+    self.cleared = True
+
+    for orgID, org in orgs.items():
+      self[orgID] = org
+
+  def keys(self):
+    orgIDs = set()
+
+    if not self.cleared:
+      orgIDs.update(row[0] for row in self.db.execute("SELECT orgID FROM orgs"))
+
+    orgIDs -= self.deleted
+    orgIDs.update(self.cache.keys())
+
+    return sorted(orgIDs)
+
+  def items(self):
+    return [ (orgID, self[orgID]) for orgID in self.keys() ]
+
+  def __iter__(self):
+    return iter(self.keys())
+
+  def __len__(self):
+    return len(self.keys())
+
+  def toDict(self):
+    orgs = {}
+
+    for orgID, org in self.items():
+      org = dict(org)
+      tokens = org.get('service_tokens', None)
+
+      if isinstance(tokens, SQLiteServiceTokens):
+        org['service_tokens'] = tokens.toDict()
+
+      orgs[orgID] = org
+
+    return orgs
+
+  def flush(self):
+    """ Write just the orgs and tokens that changed. Call inside a transaction. """
+    if self.cleared:
+      self.db.execute("DELETE FROM orgs")
+      self.db.execute("DELETE FROM service_tokens")
+
+    for orgID in self.deleted:
+      self.db.execute("DELETE FROM orgs WHERE orgID = ?", (orgID,))
+      self.db.execute("DELETE FROM service_tokens WHERE orgID = ?", (orgID,))
+
+    for orgID, org in self.cache.items():
+      info = dict((key, value) for key, value in org.items() if key != 'service_tokens')
+      infoJSON = jsoncodec.dumps(info, sort_keys=True)
+
+      if (orgID in self.replaced) or (infoJSON != self.snapshots.get(orgID, None)):
+        self.db.execute("INSERT OR REPLACE INTO orgs (orgID, info) VALUES (?, ?)", (orgID, infoJSON))
+        self.snapshots[orgID] = infoJSON
+
+      tokens = org.get('service_tokens', None)
+
+      if isinstance(tokens, SQLiteServiceTokens) and (tokens.orgID == orgID) and (orgID not in self.replaced):
+        # The usual case: only the handles that were touched.
+        tokens.flush()
+      else:
+        # Someone handed us a plain dict (or took the tokens away): make the rows match.
+        self.syncTokens(orgID, tokens)
+
+    self.replaced = set()
+    self.deleted = set()
+    self.cleared = False
+
+  def syncTokens(self, orgID, tokens):
+    if isinstance(tokens, SQLiteServiceTokens):
+      tokens = tokens.toDict()
+    elif tokens is None:
+      tokens = {}
+
+    existing = dict(self.db.execute("SELECT handle, token FROM service_tokens WHERE orgID = ?",
+                                    (orgID,)))
+
+    for handle in existing:
+      if handle not in tokens:
+        self.db.execute("DELETE FROM service_tokens WHERE orgID = ? AND handle = ?", (orgID, handle))
+
+    for handle, token in tokens.items():
+      if existing.get(handle, None) != token:
+        self.db.execute("INSERT OR REPLACE INTO service_tokens (orgID, handle, token) VALUES (?, ?, ?)",
+                        (orgID, handle, token))
+
+class DataWireSQLiteState (DataWireState):
+  """
+  DataWireState kept in SQLite rather than one big JSON document, for state with lots
+  of orgs and service tokens.
+
+  Top-level elements (orgID, etc.) live in a small 'meta' table and are read at open.
+  Orgs and service tokens have their own tables, keyed by orgID and (orgID, handle), and
+  are read only as they're asked for, so e.g. currentServiceToken reads one org row and
+  one token row. save() writes only what changed, in one transaction; SQLite does the
+  locking between processes.
+
+  Use DataWireState.open() to pick a backend, and DataWireSQLiteState.migrate() to
+  move an existing datawire.json over.
+  """
+
+  schema = [
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS orgs (orgID TEXT PRIMARY KEY, info TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS service_tokens (orgID TEXT NOT NULL, handle TEXT NOT NULL, "
+      "token TEXT NOT NULL, PRIMARY KEY (orgID, handle))",
+  ]
+
+  def __init__(self, statePath=None):
+    if statePath:
+      self.state_path = statePath
+      self.state_dir = os.path.dirname(os.path.abspath(self.state_path))
+    else:
+      self.state_dir = os.path.join(os.path.expanduser('~'), '.datawire')
+      self.state_path = os.path.join(self.state_dir, "datawire.db")
+
+    self.lock_path = self.state_path + ".lock"
+    self.lockFile = None
+    self.lockDepth = 0
+
+    self.db = None
+    self.dirty = False
+    self.reload()
+
+  def connect(self):
+    if self.db is None:
+      self.makeStateDir()
+
+      self.db = sqlite3.connect(self.state_path, timeout=30)
+      self.db.execute("PRAGMA journal_mode=WAL")
+
+      with self.db:
+        for statement in self.schema:
+          self.db.execute(statement)
+
+    return self.db
+
+  def reload(self):
+    try:
+      db = self.connect()
+    except (OSError, sqlite3.Error) as exception:
+      self.warn("open", self.state_path, exception)
+      raise
+
+    self.state = dict((key, jsoncodec.loads(value)) for key, value in db.execute("SELECT key, value FROM meta"))
+    self.metaSnapshot = dict((key, jsoncodec.dumps(value, sort_keys=True)) for key, value in self.state.items())
+
+    self.orgs = SQLiteOrgs(self)
+    self.orgsAssigned = False
+    self.dirty = False
+
+  def hasOrgs(self):
+    return self.orgsAssigned or (len(self.orgs) > 0)
+
+  def __len__(self):
+    return len(self.state) + (1 if self.hasOrgs() else 0)
+
+  def __getitem__(self, key):
+    if key == 'orgs':
+      return self.orgs if self.hasOrgs() else None
+
+    return self.state.get(key, None)
+
+  def __setitem__(self, key, value):
+    if key == 'orgs':
+      if value is not self.orgs:
+        self.orgs.replaceAll(value)
+
+      self.orgsAssigned = True
+    else:
+      self.state[key] = value
+
+    self.dirty = True
+
+  def __delitem__(self, key):
+    if key == 'orgs':
+      self.orgs.replaceAll({})
+      self.orgsAssigned = False
+    else:
+      del(self.state[key])
+
+    self.dirty = True
+
+  def __iter__(self):
+    return iter(self.keys())
+
+  def __contains__(self, key):
+    if key == 'orgs':
+      return self.hasOrgs()
+
+    return key in self.state
+
+  def keys(self):
+    keys = list(self.state.keys())
+
+    if self.hasOrgs():
+      keys.append('orgs')
+
+    return keys
+
+  def save(self):
+    try:
+      db = self.connect()
+
+      with db:
+        for key, value in self.state.items():
+          valueJSON = jsoncodec.dumps(value, sort_keys=True)
+
+          if self.metaSnapshot.get(key, None) != valueJSON:
+            db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, valueJSON))
+            self.metaSnapshot[key] = valueJSON
+
+        for key in list(self.metaSnapshot.keys()):
+          if key not in self.state:
+            db.execute("DELETE FROM meta WHERE key = ?", (key,))
+            del(self.metaSnapshot[key])
+
+        self.orgs.flush()
+
+      self.dirty = False
+    except (OSError, sqlite3.Error) as exception:
+      self.warn("save state to", self.state_path, exception)
+
+  def toDict(self):
+    state = dict(self.state)
+
+    if self.hasOrgs():
+      state['orgs'] = self.orgs.toDict()
+
+    return state
+
+  def toJSON(self):
+    return jsoncodec.dumps(self.toDict(), indent=4, separators=(',',':'), sort_keys=True)
+
+  def smite(self):
+    """ USE WITH CARE """
+    if self.db is not None:
+      self.db.close()
+      self.db = None
+
+    with self.locked():
+      for path in [ self.state_path, self.state_path + "-wal", self.state_path + "-shm" ]:
+        try:
+          os.remove(path)
+        except OSError as exception:
+          if exception.errno != errno.ENOENT:
+            raise
+
+    # Start over empty, without touching the database again until someone saves.
+    self.state = {}
+    self.metaSnapshot = {}
+    self.orgs = SQLiteOrgs(self)
+    self.orgs.cleared = True
+    self.orgsAssigned = False
+    self.dirty = True
+
+  def close(self):
+    if self.db is not None:
+      self.db.close()
+      self.db = None
+
+  @classmethod
+  def migrate(klass, jsonPath, dbPath):
+    """
+    Copy a JSON DataWireState into a (new or existing) SQLite state. Everything in the
+    JSON replaces what's in the database. The JSON file is left alone.
+    """
+
+    source = DataWireState.open(jsonPath)
+    dest = klass(dbPath)
+
+    for key in source.keys():
+      dest[key] = source[key]
+
+    dest.save()
+
+    return dest
@@ -1,8 +1,17 @@
 import sys
 
+import contextlib
 import os
 import errno
-import json
+import tempfile
+
+try:
+  import fcntl
+except ImportError:
+  # No advisory locking here (Windows). Saves are still atomic, just not serialized.
+  fcntl = None
+
+from . import jsoncodec
 
 class DataWireError (Exception):
   pass
@@ -16,7 +25,76 @@ class DataWireNoCurrentUserTokenError (DataWireError):
 class DataWireNoSuchServiceError (DataWireError):
   pass
 
+# Placeholder for "no such key" while merging.
+_MISSING = object()
+
+def mergeState(base, ours, theirs):
+  """
+  Three-way merge of state dicts: base is what we loaded, ours is what we have now,
+  theirs is what's on disk now (i.e. base plus whatever other processes saved since).
+
+  Anything only one side changed keeps that change; dicts changed on both sides are
+  merged key by key, so e.g. two processes adding services to the same org both win.
+  A real conflict (both sides changed the same leaf) goes to ours, since we're saving last.
+  """
+
+  if not (isinstance(base, dict) and isinstance(ours, dict) and isinstance(theirs, dict)):
+    if ours == base:
+      return theirs
+
+    return ours
+
+  merged = {}
+
+  for key in set(base) | set(ours) | set(theirs):
+    b = base.get(key, _MISSING)
+    o = ours.get(key, _MISSING)
+    t = theirs.get(key, _MISSING)
+
+    if o == b:
+      value = t
+    elif t == b:
+      value = o
+    elif (o is _MISSING) or (t is _MISSING):
+      # One side deleted it, the other changed it: keep the changed value.
+      value = t if o is _MISSING else o
+    else:
+      value = mergeState({} if b is _MISSING else b, o, t)
+
+    if value is not _MISSING:
+      merged[key] = value
+
+  return merged
+
+def replaceFile(source, dest):
+  replace = getattr(os, 'replace', None)    # Python 3.3+
+
+  if replace:
+    replace(source, dest)
+  else:
+    try:
+      os.rename(source, dest)     # atomic on POSIX
+    except OSError:
+      if os.name != 'nt':
+        raise
+
+      # Windows won't rename over an existing file.
+      os.remove(dest)
+      os.rename(source, dest)
+
 class DataWireState (object):
+  """
+  Datawire account state, kept as JSON in ~/.datawire/datawire.json.
+
+  Safe for many dwc processes sharing one state file:
+
+  - save() writes to a temporary file and renames it into place, so readers see
+    either the old state or the new one, never a partial write;
+  - save() holds an advisory lock (on datawire.json.lock) while it re-reads the file and
+    merges our changes into whatever other processes saved since we loaded (see mergeState);
+  - update() holds that same lock around a whole reload-modify-save.
+  """
+
   def __init__(self, statePath=None):
     # Make sure we have ~/.datawire...
     if statePath:
@@ -26,9 +104,52 @@ class DataWireState (object):
       self.state_dir = os.path.join(os.path.expanduser('~'), '.datawire')
       self.state_path = os.path.join(self.state_dir, "datawire.json")
 
-    self.state = {}
+    self.lock_path = self.state_path + ".lock"
+    self.lockFile = None
+    self.lockDepth = 0
+
     self.dirty = False
+    self.reload()
+
+  # State paths with these extensions are SQLite databases (see sqlstate.py).
+  sqliteExtensions = ( '.db', '.sqlite' )
+
+  @classmethod
+  def open(klass, statePath=None, journaled=False):
+    """
+    Returns the right kind of DataWireState for statePath: SQLite for *.db or *.sqlite,
+    JSON otherwise. With no statePath, use ~/.datawire/datawire.db if it exists (i.e.
+    someone ran dwc migrate-state), else ~/.datawire/datawire.json.
+
+    JSON state is journaled (see journalstate.py) if journaled is set, or if it already
+    has a journal: once journaled, always journaled.
+    """
+
+    defaultDir = os.path.join(os.path.expanduser('~'), '.datawire')
+
+    if not statePath:
+      dbPath = os.path.join(defaultDir, 'datawire.db')
+
+      if os.path.exists(dbPath):
+        statePath = dbPath
+
+    if statePath and statePath.endswith(klass.sqliteExtensions):
+      from .sqlstate import DataWireSQLiteState
 
+      return DataWireSQLiteState(statePath)
+
+    jsonPath = statePath or os.path.join(defaultDir, 'datawire.json')
+
+    if journaled or os.path.exists(jsonPath + '.journal'):
+      from .journalstate import DataWireJournalState
+
+      return DataWireJournalState(statePath)
+
+    return klass(statePath)
+
+  def readJSON(self):
+    """ Returns the raw JSON from disk, or None if there isn't any. """
+    stateJSON = None
     inFile = None
 
     try:
@@ -39,15 +160,92 @@ class DataWireState (object):
 
     if inFile != None:
       try:
-        self.state = json.load(inFile)
-      except ValueError as exception:
-        self.warn("load", self.state_path, exception)
+        stateJSON = inFile.read()
       except IOError as exception:
         self.warn("read", self.state_path, exception)
 
-    if inFile != None:
       inFile.close()
 
+    return stateJSON
+
+  def parse(self, stateJSON):
+    if stateJSON is None:
+      return {}
+
+    try:
+      return jsoncodec.loads(stateJSON)
+    except ValueError as exception:
+      self.warn("load", self.state_path, exception)
+      return {}
+
+  def reload(self):
+    """ Throw away in-memory state and reread it from disk. """
+    stateJSON = self.readJSON()
+    self.state = self.parse(stateJSON)
+
+    # Hang onto the raw text, not a parsed copy: we only need the base for a merge
+    # at save time, and most runs never save.
+    self.baseJSON = stateJSON
+    self.dirty = False
+
+  def lock(self, shared=False):
+    """
+    Take the (reentrant) advisory lock on the state file. A shared lock is for readers:
+    it waits out writers, but doesn't create the state directory or the lock file (no
+    lock file means nobody has written yet). Reentry keeps whatever lock is held.
+    """
+
+    if self.lockDepth == 0:
+      if shared:
+        try:
+          self.lockFile = open(self.lock_path, "r")
+        except IOError as exception:
+          if exception.errno != errno.ENOENT:
+            raise
+
+          self.lockFile = None
+      else:
+        self.makeStateDir()
+        self.lockFile = open(self.lock_path, "a")
+
+      if fcntl and self.lockFile:
+        fcntl.flock(self.lockFile.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+
+    self.lockDepth += 1
+
+  def unlock(self):
+    self.lockDepth -= 1
+
+    if (self.lockDepth == 0) and self.lockFile:
+      if fcntl:
+        fcntl.flock(self.lockFile.fileno(), fcntl.LOCK_UN)
+
+      self.lockFile.close()
+      self.lockFile = None
+
+  @contextlib.contextmanager
+  def locked(self, shared=False):
+    self.lock(shared=shared)
+
+    try:
+      yield self
+    finally:
+      self.unlock()
+
+  @contextlib.contextmanager
+  def update(self):
+    """
+    with dwState.update(): ...
+
+    Lock, reload from disk, let the caller modify, save, unlock. Nobody else can save
+    in between, so no merging is needed. Unsaved in-memory changes from before are lost.
+    """
+
+    with self.locked():
+      self.reload()
+      yield self
+      self.save()
+
   def __len__(self):
     return len(self.state)
 
@@ -71,39 +269,70 @@ class DataWireState (object):
   def keys(self):
     return self.state.keys()
 
-  def save(self):
-    haveStateDir = False
-
+  def makeStateDir(self):
     try:
       os.makedirs(self.state_dir)
-      haveStateDir = True
     except OSError as exception:
       if exception.errno != errno.EEXIST:
-        self.warn("create", self.state_dir, exception)
-      else:
-        haveStateDir = True
+        raise
 
-    if haveStateDir:
-      try:
-        outFile = open(self.state_path, "w")
-        outFile.write(self.toJSON())
-        outFile.close()
+  def save(self):
+    try:
+      self.makeStateDir()
+    except OSError as exception:
+      self.warn("create", self.state_dir, exception)
+      return
+
+    try:
+      with self.locked():
+        onDiskJSON = self.readJSON()
+
+        if onDiskJSON != self.baseJSON:
+          # Someone else saved since we loaded. Fold their changes in with ours.
+          self.state = mergeState(self.parse(self.baseJSON), self.state, self.parse(onDiskJSON))
+
+        stateJSON = self.toJSON()
+        self.writeState(stateJSON)
+
+        self.baseJSON = stateJSON
         self.dirty = False
-      except IOError as exception:
-        self.warn("save state to", self.state_path, exception)
+    except (IOError, OSError) as exception:
+      self.warn("save state to", self.state_path, exception)
+
+  def writeState(self, stateJSON):
+    """ Atomically replace the state file with stateJSON. Call with the lock held. """
+    fd, tmpPath = tempfile.mkstemp(prefix=".datawire-", suffix=".tmp", dir=self.state_dir)
+
+    try:
+      with os.fdopen(fd, "w") as outFile:
+        outFile.write(stateJSON)
+        outFile.flush()
+        os.fsync(outFile.fileno())
+
+      try:
+        os.chmod(tmpPath, os.stat(self.state_path).st_mode & 0o777)
+      except OSError:
+        pass    # no existing file; mkstemp's 0600 is fine for tokens
+
+      replaceFile(tmpPath, self.state_path)
+    except Exception:
+      os.remove(tmpPath)
+      raise
 
   def toJSON(self):
-    return json.dumps(self.state, indent=4, separators=(',',':'), sort_keys=True)
+    return jsoncodec.dumps(self.state, indent=4, separators=(',',':'), sort_keys=True)
 
   def smite(self):
     """ USE WITH CARE """
-    try:
-      os.remove(self.state_path)
-    except OSError as exception:
-      if exception.errno != errno.ENOENT:
-        raise
+    with self.locked():
+      try:
+        os.remove(self.state_path)
+      except OSError as exception:
+        if exception.errno != errno.ENOENT:
+          raise
 
-    self.state = []
+    self.state = {}
+    self.baseJSON = None
     self.dirty = True
 
   def warn(self, verb, path, exception):
@@ -1,4 +1,19 @@
+import sys
+
 from setuptools import setup, find_packages
+from setuptools.command.build_py import build_py
+
+class BuildPy (build_py):
+    # AsyncIdentity's code is Python 3.5+ syntax: don't install (and fail to byte-compile)
+    # it anywhere older. datawire.cloud.asyncidentity raises ImportError there instead.
+    def find_package_modules(self, package, package_dir):
+        modules = build_py.find_package_modules(self, package, package_dir)
+
+        if sys.version_info < (3, 5):
+            modules = [ module for module in modules
+                        if module[:2] != ('datawire.cloud', '_asyncidentity') ]
+
+        return modules
 
 VERSION = open('VERSION', 'r').read().strip()
 
@@ -7,12 +22,18 @@ setup(
     version = VERSION,
     packages = find_packages(),
     scripts = [ 'dwc' ],
+    cmdclass = { 'build_py': BuildPy },
 
     install_requires = [ 
         'requests==2.9.1',
         'python-jose==0.5.5'
     ],
 
+    extras_require = {
+        # AsyncIdentity (Python 3.5+; elsewhere the extra is empty)
+        'async:python_version >= "3.5"': [ 'aiohttp>=1.0' ],
+    },
+
     package_data = {
         # # If any package contains *.txt or *.rst files, include them:
         # '': ['*.txt', '*.rst'],
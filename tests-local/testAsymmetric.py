@@ -0,0 +1,123 @@
+#!python
+
+import os
+import pickle
+import shutil
+import tempfile
+
+from jose import jwt
+
+from datawire.cloud.identity import Identity
+from datawire.utils import DataWireCredential
+from datawire.utils.hs256 import base64url_encode
+from datawire.utils.keys import DataWireKey, DataWireRSAKey, DataWireECKey, DataWireHMACKey
+
+def makeCred():
+  return DataWireCredential('ORG', 'bob', { 'dw:user0': True, 'dw:reqSvc0': True }, 'alice@example.com',
+                            email='bob@example.com')
+
+def decodeArgs(algorithm):
+  return { 'algorithms': algorithm, 'audience': 'ORG', 'issuer': 'cloud-hub.datawire.io' }
+
+class TestAsymmetric (object):
+  def setup(self):
+    self.tmpdir = tempfile.mkdtemp()
+
+    # Small RSA keys keep the test quick; the size doesn't matter to the code.
+    self.keys = {
+      'RS256': (DataWireRSAKey.new(bits=1024), DataWireRSAKey.new(bits=1024)),
+      'ES256': (DataWireECKey.new(), DataWireECKey.new()),
+    }
+
+  def teardown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def test_sameAsJose(self):
+    cred = makeCred()
+    claims = cred.getClaims()
+
+    for algorithm, (key, otherKey) in self.keys.items():
+      token = cred.toJWT(key.codec())
+
+      if algorithm == 'RS256':
+        # RSA PKCS#1 v1.5 signatures are deterministic; ECDSA's aren't.
+        assert token == jwt.encode(claims, key.private_key, algorithm=algorithm)
+
+      # jose accepts ours, and we accept jose's.
+      assert jwt.decode(token, key.public_key, **decodeArgs(algorithm)) == claims
+
+      joseToken = jwt.encode(claims, key.private_key, algorithm=algorithm)
+      rc = DataWireCredential.fromJWT(joseToken, key.public_key, 'ORG', algorithm=algorithm)
+      assert rc and (rc.cred.getClaims() == claims), algorithm
+
+      # PEM text in, PEM text out, parsed just once.
+      assert DataWireCredential.fromJWT(cred.toJWT(key.private_key, algorithm=algorithm),
+                                        key.public_key, 'ORG', algorithm=algorithm)
+
+      # The wrong key, or the wrong algorithm, fails.
+      rc = DataWireCredential.fromJWT(token, otherKey.codec(), 'ORG')
+      assert rc.error == 'Signature verification failed.', algorithm
+
+      rc = DataWireCredential.fromJWT(cred.toJWT('not-a-secret'), key.codec(), 'ORG')
+      assert rc.error == 'The specified alg value is not allowed'
+
+      # Public keys verify, but can't sign.
+      publicCodec = DataWireKey.keyClass(algorithm)(public_key=key.public_key).codec()
+      assert not publicCodec.canSign()
+
+      try:
+        cred.toJWT(publicCodec)
+        assert False, "signed with a public key"
+      except Exception:
+        pass
+
+  def test_oversizedSignature(self):
+    # A signature that's a bigger number than the key's modulus (as one from another key
+    # can be) makes PyCrypto raise rather than fail. It's still just a bad signature.
+    key = self.keys['RS256'][0]
+    token = makeCred().toJWT(key.codec())
+
+    signingInput = token.rsplit('.', 1)[0]
+    oversized = base64url_encode(b'\xff' * 128).decode('ascii')
+
+    rc = DataWireCredential.fromJWT(signingInput + '.' + oversized, key.codec(), 'ORG')
+    assert not rc
+    assert rc.error == 'Signature verification failed.'
+
+  def test_loadAndCheck(self):
+    cred = makeCred()
+
+    for algorithm, (key, otherKey) in self.keys.items():
+      privatePath = os.path.join(self.tmpdir, algorithm + '.pem')
+      publicPath = os.path.join(self.tmpdir, algorithm + '.pub')
+
+      with open(privatePath, "w") as keyFile:
+        keyFile.write(key.private_key)
+
+      with open(publicPath, "w") as keyFile:
+        keyFile.write(key.public_key)
+
+      privateKey = DataWireKey.load_private(privatePath, keyType=algorithm).privateKey
+      publicKey = DataWireKey.load_public(publicPath, keyType=algorithm).publicKey
+
+      # Codecs pickle (for process pools) by way of their PEM.
+      publicKey = pickle.loads(pickle.dumps(publicKey))
+
+      dwc = Identity("http://localhost:8080", publicKey)
+      tokens = [ cred.toJWT(privateKey), cred.toJWT(privateKey, kid='k1'), cred.toJWT(otherKey.codec()) ]
+
+      for useProcesses in [ False, True ]:
+        results = dwc.checkTokens(tokens, 'ORG', [ 'dw:user0' ], [], workers=2, useProcesses=useProcesses)
+        assert [ bool(rc) for rc in results ] == [ True, True, False ], algorithm
+
+      assert not DataWireKey.load_public(privatePath + '.nope', keyType=algorithm)
+      assert not DataWireKey.load_public(privatePath, keyType=algorithm)
+
+    # HMAC is still the default.
+    hmacKey = DataWireHMACKey.new()
+    hmacPath = os.path.join(self.tmpdir, 'hmac.key')
+
+    with open(hmacPath, "w") as keyFile:
+      keyFile.write(hmacKey.encoded().decode('ascii'))
+
+    assert DataWireKey.load_public(hmacPath).publicKey == hmacKey.public_key
@@ -0,0 +1,85 @@
+#!python
+
+import sys
+
+import json
+import threading
+
+try:
+  from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+  from SocketServer import ThreadingMixIn
+except ImportError:
+  from http.server import HTTPServer, BaseHTTPRequestHandler
+  from socketserver import ThreadingMixIn
+
+from nose.plugins.skip import SkipTest
+
+class ThreadingServer (ThreadingMixIn, HTTPServer):
+  daemon_threads = True
+
+class SvcCheckHandler (BaseHTTPRequestHandler):
+  protocol_version = 'HTTP/1.1'
+
+  def do_POST(self):
+    elements = self.path.split('/')
+
+    if elements[2] == 'svcCheck':
+      body = { 'ok': True, 'orgID': elements[3] }
+    else:
+      body = { 'ok': False, 'error': 'no such endpoint' }
+
+    body = json.dumps(body).encode('utf-8')
+
+    self.send_response(200)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, *args):
+    pass
+
+class TestAsyncIdentity (object):
+  @classmethod
+  def setup_class(klass):
+    if sys.version_info < (3, 5):
+      raise SkipTest("AsyncIdentity needs Python 3.5+")
+
+    klass.server = ThreadingServer(('127.0.0.1', 0), SvcCheckHandler)
+
+    thread = threading.Thread(target=klass.server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    klass.baseURL = "http://127.0.0.1:%d" % klass.server.server_address[1]
+
+  @classmethod
+  def teardown_class(klass):
+    klass.server.shutdown()
+    klass.server.server_close()
+
+  def test_concurrentChecks(self):
+    import asyncio
+    from datawire.cloud.asyncidentity import AsyncIdentity
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    dwc = AsyncIdentity(self.baseURL, None, really_dont_verify_tokens=True, concurrency=8)
+
+    try:
+      checks = [ dwc.serviceCheck('ORG%d' % i, 'token', 'svc') for i in range(50) ]
+      checks.append(dwc.userForgotPassword('alice@example.com'))
+
+      results = loop.run_until_complete(asyncio.gather(*checks))
+    finally:
+      loop.run_until_complete(dwc.close())
+      asyncio.set_event_loop(None)
+      loop.close()
+
+    for i, rc in enumerate(results[:-1]):
+      assert rc
+      assert rc.orgID == 'ORG%d' % i
+
+    assert not results[-1]
+    assert results[-1].error == 'no such endpoint'
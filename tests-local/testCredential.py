@@ -0,0 +1,71 @@
+#!python
+
+import itertools
+import json
+import pickle
+
+from datawire.utils import DataWireCredential
+
+SCOPES = [ 'dw:user0', 'dw:admin0', 'dw:reqSvc0', 'dw:service0', 'dw:organization0',
+           'dw:doppelganger0', 'custom:thing', 'dw:other1' ]
+
+def makeCred(scopes):
+  return DataWireCredential('ORG', 'bob', scopes, 'alice@example.com', email='bob@example.com',
+                            tokenID='token-1', iat=1000, nbf=1000, exp=2000)
+
+class TestDataWireCredential (object):
+  def test_scopes(self):
+    for scopes in [ { 'dw:user0': True },
+                    { 'dw:user0': True, 'dw:admin0': False, 'custom:thing': True, 'custom:off': 0 },
+                    { 'dw:service0': 1, 'dw:reqSvc0': 'yes', 'dw:weird': [ 'x' ] } ]:
+      cred = makeCred(scopes)
+
+      assert cred.scopes == scopes
+
+      for scope in SCOPES + list(scopes.keys()):
+        assert cred.hasScope(scope) == bool(scopes.get(scope, False)), scope
+
+      claims = cred.getClaims()
+      assert claims['scopes'] == scopes
+
+      wanted = cred.getClaims()
+      wanted['scopes'] = scopes
+      assert json.dumps(claims) == json.dumps(wanted)
+
+    assert not hasattr(cred, '__dict__')
+
+  def test_claimsKeepOrder(self):
+    # The signed JSON has to come out exactly as the scopes went in, whatever order
+    # the dict iterates in.
+    for perm in itertools.permutations(SCOPES, 4):
+      scopes = {}
+
+      for scope in perm:
+        scopes[scope] = True
+
+      assert json.dumps(makeCred(scopes).getClaims()['scopes']) == json.dumps(scopes)
+
+  def test_shared(self):
+    c1 = makeCred({ 'dw:user0': True, 'dw:reqSvc0': True })
+    c2 = makeCred({ 'dw:user0': True, 'dw:reqSvc0': True })
+
+    assert c1.scopeDict is c2.scopeDict
+    assert c1.scopeMask == c2.scopeMask
+
+    c3 = pickle.loads(pickle.dumps(c1))
+    assert c3.getClaims() == c1.getClaims()
+    assert c3.canRequestService() and not c3.isOrgAdmin()
+
+    # True, 1 and 1.0 are equal, but each credential has to say what it was given.
+    mixed = [ { 'dw:service0': True }, { 'dw:service0': 1 }, { 'dw:service0': 1.0 },
+              { 'custom:thing': 1.0 }, { 'custom:thing': True }, { 'custom:thing': (1,) },
+              { 'custom:thing': (True,) } ]
+
+    for i in range(2):
+      for scopes in mixed:
+        claims = makeCred(scopes).getClaims()['scopes']
+        assert json.dumps(claims) == json.dumps(scopes)
+
+    c2.scopes = { 'dw:admin0': True }
+    assert c2.isOrgAdmin() and not c2.isUser()
+    assert c1.isUser()
@@ -0,0 +1,63 @@
+#!python
+
+import time
+
+from datawire.cloud.identity import Identity
+from datawire.utils import DataWireCredential
+from datawire.utils.cache import DataWireCredentialCache
+from datawire.utils.keys import DataWireHMACKey
+
+def makeCred(orgID='ORG', credID='svc', exp=None):
+  return DataWireCredential(orgID, credID, { 'dw:service0': True }, 'alice@example.com', exp=exp)
+
+class TestCredentialCache (object):
+  def test_identityCache(self):
+    key = DataWireHMACKey.new().private_key
+    dwc = Identity("http://localhost:8080", key)
+
+    token = makeCred(exp=int(time.time()) + 300).toJWT(key)
+
+    rc1 = dwc.checkService(token, 'ORG')
+    assert rc1
+
+    rc2 = dwc.checkService(token, 'ORG')
+    assert rc2
+    assert rc2.cred is rc1.cred
+
+    assert dwc.credCache.hits == 1
+    assert dwc.credCache.misses == 1
+
+    # A different org is a different key, and must still fail verification.
+    assert not dwc.checkService(token, 'OTHER')
+    assert dwc.credCache.misses == 2
+    assert len(dwc.credCache) == 1
+
+  def test_expiry(self):
+    cache = DataWireCredentialCache(maxSize=4)
+    now = int(time.time())
+
+    # Within the skew window, still good...
+    cache.put('fresh', 'ORG', makeCred(exp=now - DataWireCredential.clockSkew + 5))
+    assert cache.get('fresh', 'ORG') is not None
+
+    # ...past it, gone.
+    cache.put('stale', 'ORG', makeCred(exp=now - DataWireCredential.clockSkew - 5))
+    assert cache.get('stale', 'ORG') is None
+    assert cache.expirations == 1
+    assert len(cache) == 1
+
+  def test_lru(self):
+    cache = DataWireCredentialCache(maxSize=2)
+
+    cache.put('a', 'ORG', makeCred(credID='a'))
+    cache.put('b', 'ORG', makeCred(credID='b'))
+
+    # Touch a, so b is the least recently used.
+    assert cache.get('a', 'ORG').credID == 'a'
+
+    cache.put('c', 'ORG', makeCred(credID='c'))
+
+    assert cache.get('b', 'ORG') is None
+    assert cache.get('a', 'ORG') is not None
+    assert cache.get('c', 'ORG') is not None
+    assert cache.evictions == 1
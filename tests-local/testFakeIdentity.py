@@ -0,0 +1,115 @@
+#!python
+
+import requests
+
+from datawire.cloud.fakeidentity import FakeIdentityService
+from datawire.cloud.identity import Identity
+
+class TestFakeIdentity (object):
+  def test_workflow(self):
+    # The same ground tests-remote covers against the real service.
+    with FakeIdentityService() as service:
+      dwc = Identity(service.baseURL, service.publicKey)
+
+      rc = dwc.orgCreate("Alice's House of Grues", "Alice", "alice@example.com", "aliceRules",
+                         isATest=True)
+      assert rc and rc.cred.hasScope('dw:admin0')
+
+      orgID = rc.orgID
+      adminToken = rc.token
+
+      rc = dwc.userInvite(orgID, adminToken, 'bob@example.com', 'Alice', 'alice@example.com',
+                          scopes=[ 'dw:reqSvc0' ])
+      assert rc and rc.invitation
+
+      rc = dwc.userAcceptInvitation(rc.invitation, 'Bob', 'bobRules')
+      assert rc and (rc.orgID == orgID) and (rc.cred.email == 'bob@example.com')
+
+      # Bob isn't an admin, so he can't invite anyone.
+      assert not dwc.userInvite(orgID, rc.token, 'eve@example.com', 'Bob', 'bob@example.com')
+
+      assert dwc.userAuth('alice@example.com', 'aliceRules')
+      assert not dwc.userAuth('bob@example.com', 'aliceRules')
+
+      rc = dwc.userAuth('bob@example.com', 'bobRules', orgID=orgID)
+      assert rc
+
+      rc = dwc.userUpdate(orgID, rc.token, 'bob@example.com', password='bobRulesMore')
+      assert rc
+      assert dwc.userAuth('bob@example.com', 'bobRulesMore')
+
+      rc = dwc.serviceCreate(orgID, rc.token, 'grueLocator')
+      assert rc and (rc.cred.credID == 'grueLocator')
+
+      svcToken = rc.token
+
+      assert dwc.serviceCheck(orgID, svcToken, 'grueLocator')
+      assert not dwc.serviceCheck(orgID, svcToken, 'grueAvoider')
+      assert not dwc.serviceCheck(orgID, svcToken + svcToken, 'grueLocator')
+
+      # The newer form of the check.
+      resp = requests.get(service.baseURL + '/v1/services/grueLocator',
+                          headers={ 'Authorization': 'Bearer ' + svcToken })
+      assert resp.json()['ok']
+
+      assert dwc.userForgotPassword('nobody@example.com').msg
+
+      rc = dwc.orgList(service.superToken)
+      assert rc and (rc.orgIDs == [ orgID ])
+
+      # Only the super token gets to list orgs.
+      assert not dwc.orgList(adminToken)
+
+      assert dwc.orgDelete(orgID, service.superToken)
+      assert dwc.orgList(service.superToken).orgIDs == []
+
+      dwc.close()
+
+  def test_faults(self):
+    with FakeIdentityService(errorRate=1.0, seed=1) as service:
+      dwc = Identity(service.baseURL, service.publicKey)
+
+      rc = dwc.userAuth('alice@example.com', 'aliceRules')
+      assert not rc
+      assert rc.error == 'injected failure'
+      assert service.injectedErrors == 1
+
+      # Faults and latency can change on the fly.
+      service.errorRate = 0.0
+      service.latency = 0.5
+
+      rc = dwc.orgList(service.superToken)
+      assert rc
+
+      rc = dwc.get([ 'v1', 'orgs' ], token=service.superToken, required=[], timeout=(1.0, 0.1))
+      assert not rc
+      assert 'timed out' in rc.error
+
+      dwc.close()
+
+    # Bad requests get an answer, not a dropped connection.
+    with FakeIdentityService() as service:
+      url = service.baseURL + '/v1/orgs'
+
+      for body in [ '[1]', '"x"' ]:
+        resp = requests.post(url, data=body, headers={ 'Content-Type': 'application/json' })
+        assert resp.status_code == 400
+        assert resp.json() == { 'ok': False, 'error': 'request body is not a JSON object' }
+
+      resp = requests.post(url, json={ 'orgName': 'Oops', 'adminName': 'Oops',
+                                       'adminEmail': 42, 'adminPassword': 'oops' })
+      assert resp.status_code == 500
+      assert resp.json()['ok'] is False
+      assert 'AttributeError' in resp.json()['error']
+
+    # The same seed fails the same requests.
+    failures = []
+
+    for i in range(2):
+      with FakeIdentityService(errorRate=0.3, seed=42) as service:
+        dwc = Identity(service.baseURL, service.publicKey)
+        failures.append([ bool(dwc.userForgotPassword('alice@example.com')) for j in range(20) ])
+        dwc.close()
+
+    assert failures[0] == failures[1]
+    assert not all(failures[0]) and any(failures[0])
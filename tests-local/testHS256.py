@@ -0,0 +1,91 @@
+#!python
+
+import time
+
+from jose import jwt
+
+from datawire.utils import DataWireCredential
+from datawire.utils.hs256 import DataWireHS256
+from datawire.utils.keys import DataWireHMACKey
+
+def makeCreds():
+  now = int(time.time())
+
+  return [
+    DataWireCredential('ORG', 'svc', { 'dw:service0': True }, 'alice@example.com'),
+    DataWireCredential('ORG', 'bob', { 'dw:user0': True, 'dw:admin0': True, 'dw:reqSvc0': True },
+                       'alice@example.com', email='bob@example.com', iat=now, nbf=now - 60, exp=now + 900),
+    DataWireCredential(u'ORG', u'\u00e9ve', { u'dw:user0': True }, u'alice@example.com',
+                       email=u'\u00e9ve@example.com')
+  ]
+
+def joseError(token, key, audience):
+  try:
+    jwt.decode(token, key, algorithms='HS256', audience=audience, issuer='cloud-hub.datawire.io')
+  except Exception as e:
+    return (type(e), str(e))
+
+def codecError(token, key, audience):
+  try:
+    DataWireHS256.forKey(key).decode(token, audience=audience, issuer='cloud-hub.datawire.io')
+  except Exception as e:
+    return (type(e), str(e))
+
+class TestHS256 (object):
+  def test_sameAsJose(self):
+    key = DataWireHMACKey.new().private_key
+    codec = DataWireHS256.forKey(key)
+
+    assert DataWireHS256.forKey(key) is codec
+
+    for cred in makeCreds():
+      claims = cred.getClaims()
+      token = codec.encode(claims)
+
+      assert token == jwt.encode(claims, key, algorithm='HS256')
+      assert type(token) == type(jwt.encode(claims, key, algorithm='HS256'))
+
+      assert codec.decode(token, audience=cred.orgID, issuer='cloud-hub.datawire.io') == claims
+
+      rc = DataWireCredential.fromJWT(token, key, cred.orgID)
+      assert rc
+      assert rc.cred.getClaims() == claims
+
+  def test_errorsMatchJose(self):
+    key = DataWireHMACKey.new().private_key
+    otherKey = DataWireHMACKey.new().private_key
+
+    now = int(time.time())
+    cred = makeCreds()[0]
+    token = cred.toJWT(key)
+
+    expired = DataWireCredential('ORG', 'svc', { 'dw:service0': True }, 'alice@example.com',
+                                 iat=now - 100, nbf=now - 100, exp=now - 10).toJWT(key)
+
+    cases = [
+      (token, otherKey, 'ORG'),
+      (token, key, 'OTHER'),
+      (expired, key, 'ORG'),
+      ('garbage', key, 'ORG'),
+      (token[:-3], key, 'ORG'),
+      ('eyJhbGciOiJub25lIn0.' + token.split('.', 1)[1], key, 'ORG'),
+    ]
+
+    for badToken, badKey, audience in cases:
+      wanted = joseError(badToken, badKey, audience)
+
+      assert wanted is not None
+      assert codecError(badToken, badKey, audience) == wanted
+
+  def test_unverified(self):
+    cred = makeCreds()[1]
+    token = cred.toJWT(DataWireHMACKey.new().private_key)
+
+    rc = DataWireCredential.fromJWT(token, None, 'ORG', really_dont_verify_tokens=True)
+    assert rc
+    assert rc.cred.email == 'bob@example.com'
+
+    rc = DataWireCredential.fromJWT('eyJhbGciOiJub25lIn0.' + token.split('.', 1)[1], None, 'ORG',
+                                    really_dont_verify_tokens=True)
+    assert not rc
+    assert rc.error == 'malformed token (not a JWT)'
@@ -0,0 +1,59 @@
+#!python
+
+import threading
+
+from datawire.cloud.identity import Identity
+from datawire.utils import DataWireCredential
+from datawire.utils.keys import DataWireHMACKey
+
+class TestIdentityClient (object):
+  def test_sessionPool(self):
+    dwc = Identity("http://localhost:8080", None, really_dont_verify_tokens=True,
+                   poolSize=2, maxKeepAlive=4)
+
+    s1 = dwc.session()
+    assert dwc.session() is s1
+
+    # Every session uses the same adapter, hence the same pool.
+    adapter = dwc.httpAdapter()
+    assert s1.get_adapter("http://localhost:8080/v1/orgs") is adapter
+    assert adapter._pool_maxsize == 4
+
+    others = []
+
+    thread = threading.Thread(target=lambda: others.append(dwc.session()))
+    thread.start()
+    thread.join()
+
+    assert others[0] is not s1
+    assert others[0].get_adapter("https://id.datawire.io/v1/orgs") is adapter
+
+    dwc.close()
+    assert dwc.session() is s1
+
+  def test_checkTokens(self):
+    key = DataWireHMACKey.new().private_key
+    dwc = Identity("http://localhost:8080", key)
+
+    service = DataWireCredential('ORG', 'svc', { 'dw:service0': True }, 'alice@example.com')
+    user = DataWireCredential('ORG', 'bob', { 'dw:user0': True }, 'alice@example.com',
+                              email='bob@example.com')
+
+    tokens = [ service.toJWT(key), user.toJWT(key), 'garbage' ] * 5
+
+    for useProcesses in [ False, True ]:
+      results = dwc.checkTokens(tokens, 'ORG', [ 'dw:service0' ], [ 'dw:user0' ],
+                                workers=3, useProcesses=useProcesses)
+
+      assert len(results) == len(tokens)
+
+      for i in range(0, len(tokens), 3):
+        assert results[i]
+        assert results[i].cred.credID == 'svc'
+
+        assert not results[i + 1]
+        assert results[i + 1].error == 'credential is missing scopes: dw:service0'
+
+        assert not results[i + 2]
+
+    assert dwc.checkTokens([], 'ORG', [], []) == []
@@ -0,0 +1,255 @@
+#!python
+
+import sys
+
+import json
+import threading
+import time
+
+try:
+  from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+  from SocketServer import ThreadingMixIn
+except ImportError:
+  from http.server import HTTPServer, BaseHTTPRequestHandler
+  from socketserver import ThreadingMixIn
+
+from nose.plugins.skip import SkipTest
+
+from datawire.cloud.identity import Identity
+
+class ThreadingServer (ThreadingMixIn, HTTPServer):
+  daemon_threads = True
+
+  def handle_error(self, request, client_address):
+    # Clients that time out hang up on us; that's the point.
+    pass
+
+class SlowHandler (BaseHTTPRequestHandler):
+  """
+  GET /v1/sleep/SECONDS answers after SECONDS. GET /v1/once/KEY answers after a second
+  the first time it sees KEY, and right away after that.
+  """
+
+  protocol_version = 'HTTP/1.1'
+
+  seen = set()
+  seenLock = threading.Lock()
+
+  def do_GET(self):
+    elements = self.path.split('/')
+
+    if elements[2] == 'sleep':
+      time.sleep(float(elements[3]))
+    elif elements[2] == 'once':
+      with self.seenLock:
+        first = elements[3] not in self.seen
+        self.seen.add(elements[3])
+
+      if first:
+        time.sleep(1.0)
+
+    body = json.dumps({ 'ok': True, 'path': self.path }).encode('utf-8')
+
+    self.send_response(200)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, *args):
+    pass
+
+class TestIdentityTimeouts (object):
+  @classmethod
+  def setup_class(klass):
+    klass.server = ThreadingServer(('127.0.0.1', 0), SlowHandler)
+
+    thread = threading.Thread(target=klass.server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    klass.baseURL = "http://127.0.0.1:%d" % klass.server.server_address[1]
+
+  @classmethod
+  def teardown_class(klass):
+    klass.server.shutdown()
+    klass.server.server_close()
+
+  def test_timeouts(self):
+    dwc = Identity(self.baseURL, None, really_dont_verify_tokens=True,
+                   timeout=(1.0, 0.2), timeouts={ 'POST': 5.0 })
+
+    assert dwc.timeoutFor('GET') == (1.0, 0.2)
+    assert dwc.timeoutFor('POST') == 5.0
+    assert dwc.timeoutFor('GET', 3.0) == 3.0
+
+    try:
+      rc = dwc.get([ 'v1', 'sleep', '0' ], required=[ 'path' ])
+      assert rc and (rc.path == '/v1/sleep/0')
+
+      # Too slow for the default read timeout...
+      rc = dwc.get([ 'v1', 'sleep', '0.6' ], required=[ 'path' ])
+      assert not rc
+      assert 'timed out' in rc.error
+
+      # ...but fine for a longer one, just this once.
+      rc = dwc.get([ 'v1', 'sleep', '0.6' ], required=[ 'path' ], timeout=2.0)
+      assert rc
+    finally:
+      dwc.close()
+
+  def test_hedging(self):
+    dwc = Identity(self.baseURL, None, really_dont_verify_tokens=True, hedge=True,
+                   minHedgeSamples=5)
+
+    try:
+      # Not enough samples yet, so no hedging: the slow first answer is what we get.
+      rc = dwc.get([ 'v1', 'once', 'sync-early' ], required=[ 'path' ])
+      assert rc and (dwc.hedgesSent == 0)
+
+      # Enough fast requests that the slow one is past the p95.
+      for i in range(20):
+        assert dwc.get([ 'v1', 'sleep', '0' ], required=[ 'path' ])
+
+      assert dwc.currentHedgeDelay() < 1.0
+
+      # Now the first attempt is slow, and the hedge answers right away. (With a delay
+      # that short, one of the fast ones may have been hedged too; don't count those.)
+      hedges = (dwc.hedgesSent, dwc.hedgesWon)
+
+      start = time.time()
+      rc = dwc.get([ 'v1', 'once', 'sync-late' ], required=[ 'path' ])
+
+      assert rc and (rc.path == '/v1/once/sync-late')
+      assert time.time() - start < 0.9
+      assert (dwc.hedgesSent - hedges[0], dwc.hedgesWon - hedges[1]) == (1, 1)
+
+      # Only idempotent requests get hedged.
+      dwc.get([ 'v1', 'once', 'sync-unhedged' ], required=[ 'path' ], hedge=False)
+      assert dwc.hedgesSent - hedges[0] == 1
+    finally:
+      dwc.close()
+
+  def test_hedgingUnderLoad(self):
+    # More callers than hedging threads. The hedging delay has to start when each request
+    # goes out, not when it's asked for, or the wait for a thread sets off hedges itself.
+    dwc = Identity(self.baseURL, None, really_dont_verify_tokens=True, hedge=True,
+                   hedgeQuantile=0.95, hedgeWorkers=4)
+
+    callers = 32
+    perCaller = 25
+    failures = []
+
+    def call():
+      for i in range(perCaller):
+        if not dwc.get([ 'v1', 'sleep', '0.02' ], required=[ 'path' ]):
+          failures.append(i)
+
+    try:
+      threads = [ threading.Thread(target=call) for i in range(callers) ]
+
+      for thread in threads:
+        thread.start()
+
+      for thread in threads:
+        thread.join()
+    finally:
+      dwc.close()
+
+    assert not failures
+
+    # About (1 - hedgeQuantile) of requests should get a duplicate; allow for jitter.
+    assert dwc.hedgesSent <= 0.15 * callers * perCaller, dwc.hedgesSent
+
+  def test_asyncNeedsPython3(self):
+    if sys.version_info >= (3, 5):
+      raise SkipTest("this is about older Pythons")
+
+    try:
+      import datawire.cloud.asyncidentity
+      assert False, "imported asyncidentity"
+    except ImportError as e:
+      assert str(e) == "datawire.cloud.asyncidentity requires Python 3.5+"
+
+  def test_asyncTimeoutsAndHedging(self):
+    if sys.version_info < (3, 5):
+      raise SkipTest("AsyncIdentity needs Python 3.5+")
+
+    import asyncio
+    from datawire.cloud.asyncidentity import AsyncIdentity
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    dwc = AsyncIdentity(self.baseURL, None, really_dont_verify_tokens=True,
+                        timeout=(1.0, 0.2), hedge=True, minHedgeSamples=5)
+
+    run = loop.run_until_complete
+
+    try:
+      timedOut = run(dwc.get([ 'v1', 'sleep', '0.6' ], required=[ 'path' ]))
+
+      for i in range(20):
+        assert run(dwc.get([ 'v1', 'sleep', '0' ], required=[ 'path' ]))
+
+      hedges = (dwc.hedgesSent, dwc.hedgesWon)
+
+      start = time.time()
+      hedged = run(dwc.get([ 'v1', 'once', 'async-late' ], required=[ 'path' ], timeout=2.0))
+      elapsed = time.time() - start
+    finally:
+      run(dwc.close())
+      asyncio.set_event_loop(None)
+      loop.close()
+
+    assert not timedOut
+    assert 'timed out' in timedOut.error
+
+    assert hedged and (hedged.path == '/v1/once/async-late')
+    assert elapsed < 0.9
+    assert (dwc.hedgesSent - hedges[0], dwc.hedgesWon - hedges[1]) == (1, 1)
+
+  def test_asyncHedgingUnderLoad(self):
+    if sys.version_info < (3, 5):
+      raise SkipTest("AsyncIdentity needs Python 3.5+")
+
+    import asyncio
+    from datawire.cloud.asyncidentity import AsyncIdentity
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    # More callers than the semaphore lets through, and than hedgeWorkers. Waiting for
+    # the semaphore mustn't count toward the hedging delay, or set off hedges itself.
+    dwc = AsyncIdentity(self.baseURL, None, really_dont_verify_tokens=True, concurrency=8,
+                        hedge=True, hedgeQuantile=0.95, hedgeWorkers=4)
+
+    callers = 32
+    perCaller = 25
+    results = []
+
+    run = loop.run_until_complete
+
+    try:
+      # Learn the delay unloaded, then pile on. (No async def here: this file has to
+      # parse on Python 2.)
+      for i in range(30):
+        assert run(dwc.get([ 'v1', 'sleep', '0.02' ], required=[ 'path' ]))
+
+      for i in range(perCaller):
+        results.extend(run(asyncio.gather(*[ dwc.get([ 'v1', 'sleep', '0.02' ], required=[ 'path' ])
+                                             for j in range(callers) ])))
+    finally:
+      run(dwc.close())
+      asyncio.set_event_loop(None)
+      loop.close()
+
+    assert all(results)
+
+    # About (1 - hedgeQuantile) of requests should get a duplicate; allow for jitter.
+    assert dwc.hedgesSent <= 0.15 * callers * perCaller, dwc.hedgesSent
+    assert dwc.hedgesInFlight == 0
+
+    # And the delay still tracks the service (slower under this load, but not by much),
+    # not the time queued behind the other callers.
+    assert dwc.currentHedgeDelay() < 0.15, dwc.currentHedgeDelay()
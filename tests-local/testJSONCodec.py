@@ -0,0 +1,76 @@
+#!python
+
+import json
+
+from datawire.utils import jsoncodec
+from datawire.utils.jsoncodec import DataWireJSON
+
+def sampleState():
+  return {
+    'orgID': 'ORG',
+    'orgs': {
+      'ORG': { 'email': u'\u00e9ve@example.com', 'user_token': 'a.b.c',
+               'service_tokens': dict(('svc%d' % i, 'token/%d' % i) for i in range(50)) }
+    },
+    'numbers': [ 0, -1, 2.5, 1e100, 2 ** 40 ],
+    'misc': { 'none': None, 'yes': True, 'quote': '"\\\n\t' }
+  }
+
+class TestJSONCodec (object):
+  def test_sameAsJson(self):
+    obj = sampleState()
+
+    for libraries in [ jsoncodec.LIBRARIES ] + [ (name,) for name in jsoncodec.LIBRARIES ] + [ () ]:
+      codec = DataWireJSON(libraries)
+
+      assert codec.dumps(obj) == json.dumps(obj)
+      assert codec.dumps(obj, separators=(',', ':')) == json.dumps(obj, separators=(',', ':'))
+      assert (codec.dumps(obj, indent=4, separators=(',', ':'), sort_keys=True) ==
+              json.dumps(obj, indent=4, separators=(',', ':'), sort_keys=True))
+
+      text = json.dumps(obj)
+      assert jsoncodec._sameValue(codec.loads(text), json.loads(text))
+
+  def test_exponentsAndDel(self):
+    # ujson writes 1e-5 and a raw DEL where json writes 1e-05 and \u007f, which would
+    # change the bytes of signed tokens.
+    obj = { 'small': 1e-05, 'tiny': [ 2.5e-08 ], 'del': u'a\x7fb' }
+
+    for libraries in [ jsoncodec.LIBRARIES ] + [ (name,) for name in jsoncodec.LIBRARIES ]:
+      codec = DataWireJSON(libraries)
+
+      for kwargs in [ {}, { 'separators': (',', ':'), 'sort_keys': True },
+                      { 'indent': 4, 'separators': (',', ':'), 'sort_keys': True } ]:
+        assert codec.dumps(obj, **kwargs) == json.dumps(obj, **kwargs)
+
+  def test_fallback(self):
+    codec = DataWireJSON()
+
+    # Things some libraries won't do, that json will.
+    for obj in [ float('nan'), { 'big': 2 ** 80 }, { 1: 'int key' } ]:
+      assert codec.dumps(obj) == json.dumps(obj)
+
+    assert codec.loads('[NaN]')[0] != codec.loads('[NaN]')[0]
+    assert codec.loads('[%d]' % (2 ** 80)) == [ 2 ** 80 ]
+
+    # Bad JSON fails the way json fails.
+    for text in [ '', '{', '{"a": }' ]:
+      try:
+        json.loads(text)
+        assert False, "json took %r" % text
+      except ValueError as e:
+        wanted = str(e)
+
+      try:
+        codec.loads(text)
+        assert False, "codec took %r" % text
+      except ValueError as e:
+        assert str(e) == wanted
+
+  def test_useLibraries(self):
+    try:
+      codec = jsoncodec.useLibraries('json')
+      assert codec.describe() == 'loads: json, dumps: json, indented dumps: json'
+      assert jsoncodec.codec() is codec
+    finally:
+      jsoncodec.useLibraries()
@@ -0,0 +1,146 @@
+#!python
+
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+from datawire.utils.state import DataWireState
+from datawire.utils.journalstate import DataWireJournalState
+
+def addService(args):
+  statePath, orgID, serviceHandle = args
+
+  dwState = DataWireState.open(statePath)
+
+  org = dwState['orgs'][orgID]
+  org.setdefault('service_tokens', {})[serviceHandle] = 'token-' + serviceHandle
+
+  dwState.save()
+
+class TestDataWireJournalState (object):
+  def setup(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.statePath = os.path.join(self.tmpdir, 'datawire.json')
+    self.journalPath = self.statePath + '.journal'
+
+    dwState = DataWireState.open(self.statePath, journaled=True)
+    dwState['orgID'] = 'ORG1'
+    dwState['orgs'] = {
+      'ORG1': { 'email': 'alice@example.com', 'user_token': 'alice-token' },
+      'ORG2': { 'email': 'bob@example.com', 'user_token': 'bob-token',
+                'service_tokens': dict(('svc%d' % i, 'token%d' % i) for i in range(100)) }
+    }
+    dwState.save()
+
+  def teardown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def journal(self):
+    with open(self.journalPath, 'r') as inFile:
+      return [ json.loads(line) for line in inFile ]
+
+  def test_appendOnlyChanges(self):
+    dwState = DataWireState.open(self.statePath)
+    assert type(dwState) == DataWireJournalState
+
+    before = os.path.getsize(self.journalPath)
+
+    dwState['orgs']['ORG2']['service_tokens']['new'] = 'new-token'
+    del(dwState['orgs']['ORG2']['service_tokens']['svc7'])
+    dwState.save()
+
+    assert self.journal()[-2:] == [
+      [ 'set', [ 'orgs', 'ORG2', 'service_tokens', 'new' ], 'new-token' ],
+      [ 'del', [ 'orgs', 'ORG2', 'service_tokens', 'svc7' ] ]
+    ]
+    assert os.path.getsize(self.journalPath) - before < 200
+
+    # Nothing to save, nothing written.
+    dwState.save()
+    assert len(self.journal()) == 4
+
+    tokens = DataWireState.open(self.statePath)['orgs']['ORG2']['service_tokens']
+    assert tokens['new'] == 'new-token'
+    assert 'svc7' not in tokens
+    assert len(tokens) == 100
+
+  def test_readOnlyLoad(self):
+    # Loading to read (dwc status, say) creates nothing and takes no lock.
+    os.remove(self.statePath + '.lock')
+
+    dwState = DataWireState.open(self.statePath)
+    assert dwState['orgs']['ORG1']['email'] == 'alice@example.com'
+    assert not os.path.exists(self.statePath + '.lock')
+
+    missingDir = os.path.join(self.tmpdir, 'nowhere')
+    dwState = DataWireJournalState(os.path.join(missingDir, 'datawire.json'))
+    assert len(dwState) == 0
+    assert not os.path.exists(missingDir)
+
+    # Saving still locks.
+    dwState = DataWireState.open(self.statePath)
+    dwState['orgID'] = 'ORG2'
+    dwState.save()
+    assert os.path.exists(self.statePath + '.lock')
+    assert DataWireState.open(self.statePath)['orgID'] == 'ORG2'
+
+  def test_interleavedSaves(self):
+    s1 = DataWireState.open(self.statePath)
+    s2 = DataWireState.open(self.statePath)
+
+    s1['orgs']['ORG1'].setdefault('service_tokens', {})['a'] = 'a-token'
+    s2['orgs']['ORG1']['email'] = 'carol@example.com'
+    s2['orgs']['ORG1'].setdefault('service_tokens', {})['b'] = 'b-token'
+    s2['orgID'] = 'ORG2'
+
+    s1.save()
+    s2.save()
+
+    wanted = DataWireState.open(self.statePath).toJSON()
+    assert s2.toJSON() == wanted
+
+    state = json.loads(wanted)
+    assert state['orgID'] == 'ORG2'
+    assert state['orgs']['ORG1'] == { 'email': 'carol@example.com', 'user_token': 'alice-token',
+                                      'service_tokens': { 'a': 'a-token', 'b': 'b-token' } }
+
+  def test_compaction(self):
+    dwState = DataWireJournalState(self.statePath, compactBytes=4096)
+    other = DataWireJournalState(self.statePath)
+
+    for i in range(100):
+      dwState['orgs']['ORG1'].setdefault('service_tokens', {})['x%d' % i] = 'x-token'
+      dwState.save()
+
+    assert os.path.getsize(self.journalPath) <= 4096
+
+    # A torn record at the end of the journal is ignored, then overwritten.
+    with open(self.journalPath, 'a') as outFile:
+      outFile.write('["set",["orgID"],"BROKEN')
+
+    other['orgs']['ORG2']['email'] = 'dave@example.com'
+    other.save()
+
+    state = json.loads(DataWireState.open(self.statePath).toJSON())
+    assert len(state['orgs']['ORG1']['service_tokens']) == 100
+    assert state['orgs']['ORG2']['email'] == 'dave@example.com'
+    assert state['orgID'] == 'ORG1'
+
+    # Compaction leaves the snapshot readable as plain JSON state, too.
+    dwState.compact()
+    assert DataWireState(self.statePath).toJSON() == dwState.toJSON()
+
+  def test_concurrentProcesses(self):
+    work = [ (self.statePath, 'ORG%d' % (1 + (i % 2)), 'p%d' % i) for i in range(16) ]
+
+    pool = multiprocessing.Pool(4)
+    pool.map(addService, work)
+    pool.close()
+    pool.join()
+
+    state = json.loads(DataWireState.open(self.statePath).toJSON())
+
+    for statePath, orgID, serviceHandle in work:
+      assert state['orgs'][orgID]['service_tokens'][serviceHandle] == 'token-' + serviceHandle
@@ -0,0 +1,140 @@
+#!python
+
+import os
+import shutil
+import tempfile
+import time
+
+from jose import jwt
+
+from datawire.cloud.identity import Identity
+from datawire.utils import DataWireCredential
+from datawire.utils.keys import DataWireHMACKey, DataWireKey, DataWireKeyring
+
+def makeCred():
+  return DataWireCredential('ORG', 'svc', { 'dw:service0': True }, 'alice@example.com')
+
+def writeKey(path, key, mtime=None):
+  with open(path, "w") as keyFile:
+    keyFile.write(DataWireHMACKey(key=key).encoded().decode('ascii') + "\n")
+
+  if mtime is not None:
+    os.utime(path, (mtime, mtime))
+
+class TestDataWireKeyring (object):
+  def setup(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.key1 = DataWireHMACKey.new().private_key
+    self.key2 = DataWireHMACKey.new().private_key
+
+    writeKey(os.path.join(self.tmpdir, 'one.key'), self.key1)
+    writeKey(os.path.join(self.tmpdir, 'two.key'), self.key2)
+    writeKey(os.path.join(self.tmpdir, 'ignored.txt'), self.key2)
+
+  def teardown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def test_kid(self):
+    keyring = DataWireKeyring(self.tmpdir)
+    assert keyring.kids() == [ 'one', 'two' ]
+    assert keyring.key('two') == self.key2
+
+    cred = makeCred()
+    claims = cred.getClaims()
+
+    # Same bytes as jose, kid and all.
+    token = cred.toJWT(self.key2, kid='two')
+    assert token == jwt.encode(claims, self.key2, algorithm='HS256', headers={ 'kid': 'two' })
+
+    rc = DataWireCredential.fromJWT(token, keyring, 'ORG')
+    assert rc and (rc.cred.credID == 'svc')
+
+    # Signed with the wrong key for its kid...
+    rc = DataWireCredential.fromJWT(cred.toJWT(self.key1, kid='two'), keyring, 'ORG')
+    assert rc.error == 'Signature verification failed.'
+
+    # ...a kid we don't have, no kid at all, and a kid that's not even a string.
+    rc = DataWireCredential.fromJWT(cred.toJWT(self.key1, kid='three'), keyring, 'ORG')
+    assert rc.error == 'Unknown key ID (kid): three'
+
+    rc = DataWireCredential.fromJWT(cred.toJWT(self.key1), keyring, 'ORG')
+    assert rc.error == 'No key ID (kid) in the token, and no default key.'
+
+    rc = DataWireCredential.fromJWT(jwt.encode(claims, self.key1, headers={ 'kid': [ 'one' ] }),
+                                    keyring, 'ORG')
+    assert not rc
+
+    # With a default, tokens without a kid are fine.
+    keyring = DataWireKeyring(self.tmpdir, defaultKID='one')
+    assert DataWireCredential.fromJWT(cred.toJWT(self.key1), keyring, 'ORG')
+
+    # Ditto with just the one key.
+    keyring = DataWireKeyring(os.path.join(self.tmpdir, 'two.key'))
+    assert DataWireCredential.fromJWT(cred.toJWT(self.key2), keyring, 'ORG')
+
+  def test_reload(self):
+    keyring = DataWireKeyring([ self.tmpdir ], checkInterval=0)
+    cred = makeCred()
+
+    oldToken = cred.toJWT(self.key1, kid='one')
+    assert DataWireCredential.fromJWT(oldToken, keyring, 'ORG')
+
+    # Rotate one, add three.
+    newKey = DataWireHMACKey.new().private_key
+    threeKey = DataWireHMACKey.new().private_key
+
+    writeKey(os.path.join(self.tmpdir, 'one.key'), newKey, mtime=time.time() + 10)
+    writeKey(os.path.join(self.tmpdir, 'three.key'), threeKey)
+
+    assert not DataWireCredential.fromJWT(oldToken, keyring, 'ORG')
+    assert DataWireCredential.fromJWT(cred.toJWT(newKey, kid='one'), keyring, 'ORG')
+    assert DataWireCredential.fromJWT(cred.toJWT(threeKey, kid='three'), keyring, 'ORG')
+
+    # A broken file keeps its old key; a removed one loses it.
+    with open(os.path.join(self.tmpdir, 'three.key'), "w") as keyFile:
+      keyFile.write("not base64 at all!")
+
+    os.remove(os.path.join(self.tmpdir, 'two.key'))
+
+    assert keyring.kids() == [ 'one', 'three' ]
+    assert keyring.key('three') == threeKey
+
+    # Nothing changed, nothing reloaded.
+    reloads = keyring.reloads
+    keyring.refresh(force=True)
+    assert keyring.reloads == reloads
+
+  def test_cachedRevocation(self):
+    keyring = DataWireKeyring([ self.tmpdir ])
+    dwc = Identity("http://localhost:8080", keyring)
+
+    token = makeCred().toJWT(self.key1, kid='one')
+
+    assert dwc.credentialFromToken(token, 'ORG')
+    assert dwc.credentialFromToken(token, 'ORG')
+    assert dwc.credCache.hits == 1
+
+    # Losing a key takes the tokens it verified out of the cache with it.
+    os.remove(os.path.join(self.tmpdir, 'one.key'))
+    keyring.refresh(force=True)
+    assert keyring.kids() == [ 'two' ]
+
+    rc = dwc.credentialFromToken(token, 'ORG')
+    assert rc.error == 'Unknown key ID (kid): one'
+    assert len(dwc.credCache) == 0
+
+  def test_identity(self):
+    keyring = DataWireKey.load_keyring([ self.tmpdir ]).publicKey
+    dwc = Identity("http://localhost:8080", keyring)
+
+    tokens = [ makeCred().toJWT(self.key1, kid='one'), makeCred().toJWT(self.key2, kid='two'),
+               makeCred().toJWT(self.key2, kid='one') ]
+
+    for useProcesses in [ False, True ]:
+      results = dwc.checkTokens(tokens, 'ORG', [ 'dw:service0' ], [], workers=2,
+                                useProcesses=useProcesses)
+
+      assert [ bool(rc) for rc in results ] == [ True, True, False ]
+
+    rc = DataWireKey.load_keyring([ os.path.join(self.tmpdir, 'nope.key') ])
+    assert rc.error.startswith('key not present')
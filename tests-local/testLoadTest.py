@@ -0,0 +1,100 @@
+#!python
+
+import io
+
+from datawire.cloud.fakeidentity import FakeIdentityService
+from datawire.cloud.identity import Identity
+from datawire.cloud.loadtest import IdentityLoadTest, LoadTestPacer, parseMix, prepareFixtures
+
+class TestLoadTest (object):
+  def test_mix(self):
+    assert parseMix('serviceCheck=80,userAuth=20') == [ ('serviceCheck', 80.0), ('userAuth', 20.0) ]
+    assert parseMix('orgList, serviceCreate=0') == [ ('orgList', 1.0) ]
+
+    for bad in [ 'grueLocate=1', 'userAuth=-1', 'orgList=0' ]:
+      try:
+        parseMix(bad)
+        assert False, "%s parsed" % bad
+      except ValueError:
+        pass
+
+  def test_pacer(self):
+    # 100/second ramping over 2 seconds is 100 requests in the ramp, then 100/second.
+    pacer = LoadTestPacer(100, 2, 3, start=0)
+
+    assert abs(pacer.offset(100) - 2.0) < 1e-9
+    assert abs(pacer.offset(25) - 1.0) < 1e-9
+    assert abs(pacer.offset(200) - 3.0) < 1e-9
+
+    slots = []
+
+    while True:
+      slot = pacer.next()
+
+      if slot is None:
+        break
+
+      slots.append(slot)
+
+    assert len(slots) == 400
+    assert slots == sorted(slots)
+
+    assert pacer.targetRate(1.0) == 50
+    assert pacer.targetRate(4.0) == 100
+
+  def test_run(self):
+    with FakeIdentityService() as service:
+      dwc = Identity(service.baseURL, service.publicKey)
+
+      rc = dwc.orgCreate("Load Test", "Alice", "alice@example.com", "aliceRules", isATest=True)
+      assert rc
+
+      mix = parseMix('userAuth=1,serviceCreate=1,serviceCheck=1,orgList=1')
+
+      # orgList needs the super token.
+      assert not prepareFixtures(dwc, mix, email='alice@example.com', password='aliceRules')
+
+      rc = prepareFixtures(dwc, mix, email='alice@example.com', password='aliceRules',
+                           superToken=service.superToken)
+      assert rc and rc.fixtures['serviceToken']
+
+      out = io.StringIO() if str is not bytes else io.BytesIO()
+      test = IdentityLoadTest(dwc, rc.fixtures, mix, workers=4, rate=100, ramp=0.5, hold=1.0,
+                              interval=0.5, seed=1, out=out)
+      rc = test.run()
+
+      assert rc
+      # 25 requests in the ramp and 100 in the hold, give or take a slot at the edges.
+      assert 120 <= rc.requests <= 130
+      assert rc.errors == 0
+      assert set(rc.operations) == set([ 'userAuth', 'serviceCreate', 'serviceCheck',
+                                         'orgList', 'total' ])
+      assert rc.p50 <= rc.p95 <= rc.p99
+
+      assert rc.serviceP50 <= rc.serviceP95 <= rc.serviceP99
+      assert rc.hedges == 0
+
+      report = out.getvalue()
+      assert 'p99' in report and 'serviceCreate' in report and 'service time' in report
+
+      dwc.close()
+
+  def test_fallingBehind(self):
+    # One worker can manage about 20 requests a second here, so at 50 a second it falls
+    # further and further behind. Latency has to count that wait; service time doesn't.
+    with FakeIdentityService(latency=0.05) as service:
+      dwc = Identity(service.baseURL, service.publicKey)
+      mix = parseMix('orgList')
+      rc = prepareFixtures(dwc, mix, superToken=service.superToken)
+      assert rc
+
+      out = io.StringIO() if str is not bytes else io.BytesIO()
+      test = IdentityLoadTest(dwc, rc.fixtures, mix, workers=1, rate=50, hold=0.5,
+                              interval=0.5, out=out)
+      rc = test.run()
+
+      assert rc and (rc.errors == 0)
+      assert rc.serviceP99 < 0.25
+      assert rc.p99 > 0.5
+
+      dwc.close()
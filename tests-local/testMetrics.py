@@ -0,0 +1,130 @@
+#!python
+
+import json
+import threading
+
+try:
+  from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+  from SocketServer import ThreadingMixIn
+except ImportError:
+  from http.server import HTTPServer, BaseHTTPRequestHandler
+  from socketserver import ThreadingMixIn
+
+from datawire.cloud.identity import Identity
+from datawire.utils import DataWireCredential
+from datawire.utils.keys import DataWireHMACKey
+from datawire.utils.metrics import DataWireMetrics, DataWireHistogram
+
+class ThreadingServer (ThreadingMixIn, HTTPServer):
+  daemon_threads = True
+
+class OrgsHandler (BaseHTTPRequestHandler):
+  """ GET /v1/orgs works; DELETE /v1/orgs/ORG says no; anything else is a 404 with no JSON. """
+
+  protocol_version = 'HTTP/1.1'
+
+  def answer(self, status, body):
+    self.send_response(status)
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def do_GET(self):
+    if self.path == '/v1/orgs':
+      self.answer(200, json.dumps({ 'ok': True, 'orgIDs': [ 'ORG' ] }).encode('utf-8'))
+    else:
+      self.answer(404, b'nope')
+
+  def do_DELETE(self):
+    self.answer(403, json.dumps({ 'ok': False, 'error': 'not yours' }).encode('utf-8'))
+
+  def log_message(self, *args):
+    pass
+
+class TestMetrics (object):
+  def test_histogram(self):
+    histogram = DataWireHistogram((1, 2, 5))
+
+    for value in [ 0.5, 1, 1.5, 2, 3, 10 ]:
+      histogram.observe(value)
+
+    # Bucket bounds are inclusive.
+    assert histogram.counts == [ 2, 2, 1, 1 ]
+    assert histogram.count == 6
+    assert histogram.sum == 18.0
+
+    assert histogram.quantile(0.5) == 2
+    assert histogram.quantile(0.99) == 5
+    assert DataWireHistogram((1,)).quantile(0.5) is None
+
+  def test_prometheus(self):
+    metrics = DataWireMetrics()
+
+    metrics.recordResponse('GET', '/v1/orgs', 200, 0.02, 300)
+    metrics.recordResponse('GET', '/v1/orgs', 200, 0.2, 300)
+    metrics.recordFailure('POST', '/v1/auth/*', 'not ok', 'bad "password"')
+    metrics.recordVerification('verified', 0.0001)
+
+    text = metrics.prometheus()
+    lines = text.splitlines()
+
+    assert '# TYPE datawire_identity_request_seconds histogram' in lines
+    assert 'datawire_identity_request_seconds_bucket{method="GET",endpoint="/v1/orgs",le="0.025"} 1' in lines
+    assert 'datawire_identity_request_seconds_bucket{method="GET",endpoint="/v1/orgs",le="+Inf"} 2' in lines
+    assert 'datawire_identity_request_seconds_count{method="GET",endpoint="/v1/orgs"} 2' in lines
+    assert 'datawire_identity_responses_total{method="GET",endpoint="/v1/orgs",status="200"} 2' in lines
+    assert 'datawire_identity_failures_total{method="POST",endpoint="/v1/auth/*",reason="not ok"} 1' in lines
+    assert 'datawire_identity_verifications_total{result="verified"} 1' in lines
+    assert 'datawire_identity_verify_seconds_count 1' in lines
+
+    # The error message itself isn't a label, but it's kept.
+    assert metrics.recentErrors[-1][1:] == ('POST', '/v1/auth/*', 'not ok', 'bad "password"')
+
+  def test_identity(self):
+    server = ThreadingServer(('127.0.0.1', 0), OrgsHandler)
+
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    key = DataWireHMACKey.new().private_key
+    dwc = Identity("http://127.0.0.1:%d" % server.server_address[1], key)
+    metrics = dwc.metrics
+
+    try:
+      assert dwc.orgList('token')
+      assert not dwc.orgDelete('ORG', 'token')
+      assert not dwc.get([ 'v1', 'nothing', 'here' ], required=[])
+    finally:
+      dwc.close()
+      server.shutdown()
+      server.server_close()
+
+    assert DataWireMetrics.endpointFor([ 'v1', 'users', 'ORG', 'bob@example.com' ]) == '/v1/users/*/*'
+
+    assert metrics.counter('responses_total', ('GET', '/v1/orgs', '200')) == 1
+    assert metrics.counter('responses_total', ('DELETE', '/v1/orgs/*', '403')) == 1
+    assert metrics.counter('failures_total', ('DELETE', '/v1/orgs/*', 'not ok')) == 1
+    assert metrics.counter('failures_total', ('GET', '/v1/nothing/*', 'no result')) == 1
+    assert metrics.histogram('response_bytes', ('GET', '/v1/nothing/*')).sum == 4
+    assert metrics.totalCount('request_seconds') == 3
+
+    # Local verification.
+    user = DataWireCredential('ORG', 'bob', { 'dw:user0': True }, 'alice@example.com',
+                              email='bob@example.com')
+    token = user.toJWT(key)
+
+    assert dwc.checkUser(token, 'ORG')
+    assert dwc.checkUser(token, 'ORG')
+    assert not dwc.checkService(token, 'ORG')
+    assert not dwc.checkUser('garbage', 'ORG')
+
+    assert metrics.counter('verifications_total', ('verified',)) == 1
+    assert metrics.counter('verifications_total', ('cached',)) == 2
+    assert metrics.counter('verifications_total', ('invalid',)) == 1
+    assert metrics.counter('policy_checks_total', ('user', 'ok')) == 2
+    assert metrics.counter('policy_checks_total', ('service', 'denied')) == 1
+    assert metrics.totalCount('verify_seconds') == 2
+
+    # Metrics can be turned off.
+    assert Identity(None, key, metrics=False).metrics is None
@@ -0,0 +1,60 @@
+#!python
+
+import sys
+
+import os
+import pstats
+import shutil
+import tempfile
+
+try:
+  from StringIO import StringIO
+except ImportError:
+  from io import StringIO
+
+from datawire.utils.profiling import DataWireProfile, profiled
+
+def busyWork():
+  return sum(len(str(i)) for i in range(20000))
+
+class TestProfiling (object):
+  def setup(self):
+    self.tmpdir = tempfile.mkdtemp()
+
+  def teardown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def test_profiled(self):
+    path = os.path.join(self.tmpdir, 'out.prof')
+    stream = StringIO()
+
+    with profiled(path, memory=True, top=5, stream=stream) as profile:
+      busyWork()
+
+    report = stream.getvalue()
+
+    # busyWork is the hot path, both in the report and in the saved profile.
+    assert 'busyWork' in profile.hotPaths('cumulative')[0][0]
+    assert 'top 5 by including callees' in report
+    assert 'busyWork' in report
+    assert ('raw profile saved to %s' % path) in report
+
+    saved = pstats.Stats(path)
+    assert any(function == 'busyWork' for filename, line, function in saved.stats)
+
+    if sys.version_info >= (3, 4):
+      assert profile.peakMemory > 0
+      assert 'memory: peak' in report
+    else:
+      assert 'memory: not traced' in report
+
+  def test_startStop(self):
+    profile = DataWireProfile(top=3)
+
+    profile.start()
+    busyWork()
+    profile.stop()
+
+    rows = profile.hotPaths('tottime')
+    assert len(rows) <= 3
+    assert rows[0][2] >= rows[-1][2]
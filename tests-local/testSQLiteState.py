@@ -0,0 +1,116 @@
+#!python
+
+import json
+import os
+import shutil
+import tempfile
+
+from datawire.utils.state import DataWireState, DataWireNoSuchServiceError
+from datawire.utils.sqlstate import DataWireSQLiteState
+
+class TestDataWireSQLiteState (object):
+  def setup(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.jsonPath = os.path.join(self.tmpdir, 'datawire.json')
+    self.dbPath = os.path.join(self.tmpdir, 'datawire.db')
+
+    self.state = {
+      'orgID': 'ORG1',
+      'orgs': {
+        'ORG1': { 'email': 'alice@example.com', 'user_token': 'alice-token',
+                  'service_tokens': dict(('svc%d' % i, 'token%d' % i) for i in range(100)) },
+        'ORG2': { 'email': 'bob@example.com', 'user_token': 'bob-token' }
+      }
+    }
+
+    with open(self.jsonPath, 'w') as outFile:
+      json.dump(self.state, outFile)
+
+  def teardown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def test_open(self):
+    assert type(DataWireState.open(self.jsonPath)) == DataWireState
+
+    dwState = DataWireState.open(self.dbPath)
+    assert type(dwState) == DataWireSQLiteState
+    assert len(dwState) == 0
+    assert 'orgs' not in dwState
+    assert dwState['orgs'] is None
+
+  def test_migrate(self):
+    DataWireSQLiteState.migrate(self.jsonPath, self.dbPath).close()
+
+    dwState = DataWireSQLiteState(self.dbPath)
+
+    assert json.loads(dwState.toJSON()) == self.state
+    assert dwState.toJSON() == DataWireState(self.jsonPath).toJSON()
+
+    assert dwState.currentOrgID() == 'ORG1'
+    assert dwState.currentUserToken() == 'alice-token'
+    assert dwState.currentServiceToken('svc42') == 'token42'
+
+    try:
+      dwState.currentServiceToken('nope')
+      assert False, "found a nonexistent service"
+    except DataWireNoSuchServiceError as e:
+      assert str(e) == "no such service in current org"
+
+    dwState['orgID'] = 'ORG2'
+
+    try:
+      dwState.currentServiceToken('svc42')
+      assert False, "found a service in an org with none"
+    except DataWireNoSuchServiceError as e:
+      assert str(e) == "no services in current org"
+
+  def test_saveOnlyChanges(self):
+    DataWireSQLiteState.migrate(self.jsonPath, self.dbPath).close()
+
+    dwState = DataWireSQLiteState(self.dbPath)
+    org = dwState.currentOrg()
+
+    org['service_tokens']['new'] = 'new-token'
+    del(org['service_tokens']['svc7'])
+
+    before = dwState.db.total_changes
+    dwState.save()
+
+    # One insert and one delete; nothing else rewritten.
+    assert dwState.db.total_changes - before == 2
+
+    tokens = DataWireSQLiteState(self.dbPath)['orgs']['ORG1']['service_tokens']
+    assert tokens['new'] == 'new-token'
+    assert 'svc7' not in tokens
+    assert len(tokens) == 100
+
+  def test_dwcStyleUpdates(self):
+    # The way dwc's login etc. write state.
+    dwState = DataWireState.open(self.dbPath)
+
+    if 'orgs' not in dwState:
+      dwState['orgs'] = {}
+
+    dwState['orgID'] = 'ORG3'
+    dwState['orgs']['ORG3'] = { 'email': 'carol@example.com', 'user_token': 'carol-token' }
+    dwState.save()
+
+    dwState = DataWireState.open(self.dbPath)
+    org = dwState.currentOrg()
+
+    if 'service_tokens' not in org:
+      org['service_tokens'] = {}
+
+    org['service_tokens']['svc'] = 'svc-token'
+    dwState.save()
+
+    dwState = DataWireState.open(self.dbPath)
+    assert dwState.toDict() == {
+      'orgID': 'ORG3',
+      'orgs': { 'ORG3': { 'email': 'carol@example.com', 'user_token': 'carol-token',
+                          'service_tokens': { 'svc': 'svc-token' } } }
+    }
+
+    dwState.smite()
+    assert len(dwState) == 0
+    assert not os.path.exists(self.dbPath)
@@ -0,0 +1,89 @@
+#!python
+
+import itertools
+import pickle
+
+from datawire.cloud.identity import Identity, DataWireIdentityError
+from datawire.utils import DataWireCredential
+from datawire.utils.keys import DataWireHMACKey
+from datawire.utils.policy import DataWireScopePolicy
+
+SCOPES = [ 'dw:user0', 'dw:admin0', 'dw:reqSvc0', 'dw:service0', 'dw:organization0', 'custom:thing' ]
+
+def listCheck(cred, scopesMust, scopesMustNot):
+  # checkToken as it was, before policies were compiled.
+  missingScopes = [ scope for scope in scopesMust if not cred.hasScope(scope) ]
+
+  if missingScopes:
+    return 'credential is missing scopes: %s' % " ".join(missingScopes)
+
+  wrongScopes = [ scope for scope in scopesMustNot if cred.hasScope(scope) ]
+
+  if wrongScopes:
+    return 'credential must not have scopes: %s' % " ".join(wrongScopes)
+
+  return None
+
+def makeCred(scopes):
+  return DataWireCredential('ORG', 'bob', dict((scope, True) for scope in scopes),
+                            'alice@example.com', email='bob@example.com')
+
+class TestScopePolicy (object):
+  def test_matchesListCheck(self):
+    policies = list(Identity.scopePolicies.values()) + [
+      DataWireScopePolicy([ 'custom:thing', 'dw:user0' ], [ 'custom:other', 'dw:admin0' ]),
+      DataWireScopePolicy([ 'dw:reqSvc0', 'dw:user0', 'dw:reqSvc0' ], [ 'custom:thing' ]),
+      DataWireScopePolicy([], []),
+    ]
+
+    for count in range(len(SCOPES) + 1):
+      for scopes in itertools.combinations(SCOPES, count):
+        cred = makeCred(scopes)
+
+        for policy in policies:
+          assert policy.check(cred) == listCheck(cred, policy.scopesMust, policy.scopesMustNot), \
+                 (scopes, policy)
+
+  def test_identity(self):
+    key = DataWireHMACKey.new().private_key
+    dwc = Identity("http://localhost:8080", key)
+
+    admin = makeCred([ 'dw:user0', 'dw:admin0', 'dw:reqSvc0' ]).toJWT(key)
+    user = makeCred([ 'dw:user0', 'custom:thing' ]).toJWT(key)
+
+    assert dwc.checkOrgAdmin(admin, 'ORG')
+    assert dwc.checkUser(admin, 'ORG')
+    assert dwc.checkCanRequestServices(admin, 'ORG')
+
+    rc = dwc.checkService(admin, 'ORG')
+    assert rc.error == 'credential is missing scopes: dw:service0'
+
+    rc = dwc.checkOrgAdmin(user, 'ORG')
+    assert rc.error == 'credential is missing scopes: dw:admin0 dw:reqSvc0'
+
+    rc = dwc.checkToken(admin, 'ORG', [ 'dw:user0' ], [ 'dw:reqSvc0', 'dw:service0', 'dw:admin0' ])
+    assert rc.error == 'credential must not have scopes: dw:reqSvc0 dw:admin0'
+
+    # Custom policies, by name or by object.
+    policy = Identity.registerScopePolicy('thingUser', [ 'custom:thing', 'dw:user0' ], [ 'dw:admin0' ])
+
+    try:
+      assert dwc.checkPolicy(user, 'ORG', 'thingUser').cred.credID == 'bob'
+      assert dwc.checkPolicy(admin, 'ORG', policy).error == 'credential is missing scopes: custom:thing'
+    finally:
+      del(Identity.scopePolicies['thingUser'])
+
+    try:
+      dwc.checkPolicy(user, 'ORG', 'thingUser')
+      assert False, "unknown policy name accepted"
+    except DataWireIdentityError:
+      pass
+
+    # Bad tokens still fail before any scope checking.
+    assert not dwc.checkPolicy('garbage', 'ORG', 'user')
+
+  def test_pickle(self):
+    policy = pickle.loads(pickle.dumps(Identity.scopePolicy('orgAdmin')))
+
+    assert policy.mustMask == Identity.scopePolicy('orgAdmin').mustMask
+    assert policy.check(makeCred([ 'dw:user0', 'dw:admin0', 'dw:reqSvc0' ])) is None
@@ -0,0 +1,95 @@
+#!python
+
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+from datawire.utils.state import DataWireState, mergeState
+
+def addService(args):
+  statePath, orgID, serviceHandle = args
+
+  dwState = DataWireState(statePath)
+
+  org = dwState['orgs'][orgID]
+  org.setdefault('service_tokens', {})[serviceHandle] = 'token-' + serviceHandle
+
+  dwState.save()
+
+class TestDataWireState (object):
+  def setup(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.statePath = os.path.join(self.tmpdir, 'datawire.json')
+
+    dwState = DataWireState(self.statePath)
+    dwState['orgID'] = 'ORG1'
+    dwState['orgs'] = {
+      'ORG1': { 'email': 'alice@example.com', 'user_token': 'alice-token' },
+      'ORG2': { 'email': 'bob@example.com', 'user_token': 'bob-token',
+                'service_tokens': { 'old': 'old-token' } }
+    }
+    dwState.save()
+
+  def teardown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def onDisk(self):
+    return json.load(open(self.statePath, 'r'))
+
+  def test_mergeOnSave(self):
+    s1 = DataWireState(self.statePath)
+    s2 = DataWireState(self.statePath)
+
+    s1['orgs']['ORG1']['service_tokens'] = { 'a': 'a-token' }
+    s2['orgs']['ORG2']['service_tokens']['b'] = 'b-token'
+    del(s2['orgs']['ORG2']['service_tokens']['old'])
+    s2['orgID'] = 'ORG2'
+
+    s1.save()
+    s2.save()
+
+    state = self.onDisk()
+
+    assert state['orgID'] == 'ORG2'
+    assert state['orgs']['ORG1']['service_tokens'] == { 'a': 'a-token' }
+    assert state['orgs']['ORG2']['service_tokens'] == { 'b': 'b-token' }
+    assert s2['orgs']['ORG1']['service_tokens'] == { 'a': 'a-token' }
+
+    # Nothing left lying around but the state and its lock.
+    assert sorted(os.listdir(self.tmpdir)) == [ 'datawire.json', 'datawire.json.lock' ]
+
+  def test_update(self):
+    s1 = DataWireState(self.statePath)
+    s2 = DataWireState(self.statePath)
+
+    s1['orgs']['ORG1']['email'] = 'carol@example.com'
+    s1.save()
+
+    with s2.update():
+      assert s2['orgs']['ORG1']['email'] == 'carol@example.com'
+      s2['orgs']['ORG1']['user_token'] = 'carol-token'
+
+    assert self.onDisk()['orgs']['ORG1'] == { 'email': 'carol@example.com', 'user_token': 'carol-token' }
+
+  def test_concurrentProcesses(self):
+    work = [ (self.statePath, 'ORG%d' % (1 + (i % 2)), 'svc%d' % i) for i in range(16) ]
+
+    pool = multiprocessing.Pool(4)
+    pool.map(addService, work)
+    pool.close()
+    pool.join()
+
+    state = self.onDisk()
+
+    for statePath, orgID, serviceHandle in work:
+      assert state['orgs'][orgID]['service_tokens'][serviceHandle] == 'token-' + serviceHandle
+
+  def test_mergeState(self):
+    base = { 'a': 1, 'b': { 'x': 1, 'y': 2 }, 'c': 3 }
+    ours = { 'a': 2, 'b': { 'x': 1, 'y': 3 } }
+    theirs = { 'a': 1, 'b': { 'x': 5, 'y': 2 }, 'c': 4, 'd': 5 }
+
+    # c: deleted by us but changed by them, so their change survives.
+    assert mergeState(base, ours, theirs) == { 'a': 2, 'b': { 'x': 5, 'y': 3 }, 'c': 4, 'd': 5 }
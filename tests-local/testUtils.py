@@ -1,5 +1,7 @@
 #!python
 
+import pickle
+
 from datawire.utils import DataWireResult
 from datawire.utils.random import DataWireRandom
 
@@ -96,3 +98,83 @@ class TestDWUtils (object):
       seen[x] = True
 
     assert True
+
+  def test_randomBatches(self):
+    randomness = DataWireRandom()
+
+    def oldBase34(value, numChars):
+      output = []
+
+      for i in range(numChars):
+        output.append(DataWireRandom.base34chars[value % 34])
+        value //= 34
+
+      return "".join(output)
+
+    for numChars in [ 1, 2, 7, 10, 40 ]:
+      values = randomness.randomBitsList(50, int(numChars * DataWireRandom.bitsPerBase34Char))
+      wanted = [ oldBase34(value, numChars) for value in values ]
+
+      assert randomness.toBase34List(values, numChars) == wanted
+      assert [ randomness.toBase34(value, numChars) for value in values ] == wanted
+
+    ids = randomness.randomIDs(1000)
+    assert len(ids) == 1000
+    assert all(len(x) == 10 and x.strip(DataWireRandom.base34chars) == '' for x in ids)
+    assert len(set(ids)) > 990
+
+    for numBits in [ 8, 50, 63, 64, 203 ]:
+      values = randomness.randomBitsList(200, numBits)
+      assert len(values) == 200
+      assert all(0 <= value < (1 << numBits) for value in values)
+      assert max(values).bit_length() > numBits - 8
+
+    # Force duplicates: with 8-bit strings, 256 unique ones is every possible value.
+    strings = randomness.randomBitStrings(256, 8, unique=True)
+    assert sorted(strings) == sorted(set(strings))
+    assert len(strings) == 256
+
+    # One more than that can't be done, and says so rather than looping forever.
+    for call in [ lambda: randomness.randomBitStrings(257, 8, unique=True),
+                  lambda: randomness.randomBase34Strings(33, 1, unique=True) ]:
+      try:
+        call()
+        assert False, "made too many unique values"
+      except ValueError:
+        pass
+
+    assert len(set(randomness.randomBase34Strings(32, 1, unique=True))) == 32
+
+    assert len(randomness.randomBitStrings(3, 384)[2]) == 48
+    assert randomness.randomIDs(0) == []
+
+  def test_resultAccess(self):
+    r1 = DataWireResult.OK(alpha="Alice")
+
+    assert r1.alpha == r1['alpha'] == "Alice"
+    assert r1.error is None
+    assert 'error' not in r1
+    assert 'beta' not in r1
+
+    r1['beta'] = True
+    r1.gamma = 3
+
+    assert r1.beta and r1['gamma'] == 3
+    assert sorted(r1.keys()) == [ 'alpha', 'beta', 'gamma' ]
+    assert r1.toDict() == { 'ok': True, 'alpha': 'Alice', 'beta': True, 'gamma': 3 }
+
+    try:
+      r1.delta
+      assert False, "got a nonexistent attribute"
+    except AttributeError:
+      pass
+
+    r2 = DataWireResult.fromError("nope", inner=DataWireResult.OK(x=1))
+
+    assert r2.error == r2['error'] == "nope"
+    assert 'error' in r2
+    assert r2.toDict() == { 'ok': False, 'error': 'nope', 'inner': { 'ok': True, 'x': 1 } }
+
+    r3 = pickle.loads(pickle.dumps(r2))
+    assert not r3
+    assert r3.toDict() == r2.toDict()